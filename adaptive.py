@@ -0,0 +1,252 @@
+# SPDX-License-Identifier: GPL-2.0-only
+# Copyright (c) 2019-2022 NITK Surathkal
+
+########################
+# SHOULD BE RUN AS ROOT
+########################
+
+import json
+import os
+import signal
+import subprocess
+import threading
+import time
+
+from run_stats import percentile, relative_precision
+
+## This program contains the adaptive-duration mode of the experiments.
+#
+# The flows of an experiment are configured to stop at the longest acceptable run time
+# (200 seconds in the scripts here). While `Experiment.run()` runs, a monitor samples the
+# goodput and the RTT of every TCP flow, and once the run has reached a steady state it ends
+# the experiment early. NeST then parses and packs the results as usual.
+#
+# Steady state is reached when, over the last `window` seconds, the `confidence` confidence
+# intervals on both the mean aggregate goodput and the mean p99 RTT are within `precision`
+# (e.g. +-5%) of those means, and the run has lasted at least `min_duration` seconds.
+#
+# Goodput and RTT are read from the senders' sockets with `ss -tin`: the goodput from the
+# increase of `bytes_acked`, the RTT from the smoothed `rtt` of every socket.
+#
+# The experiment is ended by asking every measurement tool to stop the way it stops by itself:
+# netperf on SIGALRM (its test timer), ping and iperf3 clients on SIGINT, and the `ss`/`tc`
+# sampling loops on SIGTERM. Why the run stopped is written to `adaptive.json` in its dump.
+
+## Signal that ends each tool of an experiment gracefully. Servers are left to NeST's cleanup.
+STOP_SIGNALS = {
+    "netperf": signal.SIGALRM,
+    "ping": signal.SIGINT,
+    "iperf3": signal.SIGINT,
+}
+
+## `ss` and `tc` are sampled by NeST's iterator scripts
+ITERATOR_SCRIPTS = ("ss.sh", "tc.sh")
+
+
+## Steady-state criterion of the adaptive mode
+class SteadyState:
+
+    def __init__(self, min_duration=20, window=10, precision=0.05, confidence=0.95, interval=1.0):
+        self.min_duration = min_duration
+        self.window = window
+        self.precision = precision
+        self.confidence = confidence
+        # Seconds between two samples of the flows
+        self.interval = interval
+
+    ## Returns the (goodput, p99 RTT) relative precisions over the last `window` seconds,
+    ## or None if there are not enough samples yet
+    def precisions(self, samples):
+        count = int(self.window / self.interval)
+        recent = [sample for sample in samples[-count:] if sample["rtt_p99"] is not None]
+        if len(samples) < count or len(recent) < count:
+            return None
+
+        return (
+            relative_precision([sample["goodput"] for sample in recent], self.confidence),
+            relative_precision([sample["rtt_p99"] for sample in recent], self.confidence),
+        )
+
+
+## This method returns the TCP sockets of namespace `ns` towards `destinations`,
+## as {(local, peer): (bytes_acked, rtt in ms)}
+def read_sockets(ns, destinations):
+    proc = subprocess.run(
+        ["ip", "netns", "exec", ns, "ss", "-Htin", "state", "established"],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        universal_newlines=True,
+    )
+
+    sockets = {}
+    socket = None
+    for line in proc.stdout.splitlines():
+        fields = line.split()
+        if not fields:
+            continue
+
+        # A socket is a line with its addresses, followed by an indented line with its `tcp_info`
+        if not line[0].isspace():
+            (local, peer) = (fields[2], fields[3])
+            socket = (local, peer) if peer.rsplit(":", 1)[0].strip("[]") in destinations else None
+            continue
+        if socket is None:
+            continue
+
+        bytes_acked = 0
+        rtt = None
+        for field in fields:
+            if field.startswith("bytes_acked:"):
+                bytes_acked = int(field.split(":")[1])
+            elif field.startswith("rtt:"):
+                rtt = float(field.split(":")[1].split("/")[0])
+        sockets[socket] = (bytes_acked, rtt)
+
+    return sockets
+
+
+## This method returns the TCP flows of `experiment` as {source namespace: set of destination addresses}
+def tcp_sources(experiment):
+    sources = {}
+    for flow in experiment.flows:
+        (src_ns, dst_ns, dst_addr, start_t, stop_t, streams, options) = flow._get_props()
+        if options["protocol"] == "TCP":
+            sources.setdefault(src_ns, set()).add(str(dst_addr).split("/")[0])
+    return sources
+
+
+## This method asks the measurement tools running in `namespaces` to stop, as if their time was up
+def stop_tools(namespaces):
+    for ns in namespaces:
+        proc = subprocess.run(
+            ["ip", "netns", "pids", ns], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True
+        )
+        for pid in proc.stdout.split():
+            try:
+                with open("/proc/" + pid + "/cmdline") as cmdline:
+                    argv = cmdline.read().split("\0")
+            except OSError:
+                # The process already exited
+                continue
+
+            tool = os.path.basename(argv[0])
+            if tool in STOP_SIGNALS:
+                # Leave servers running (netserver is a different program, `iperf3 -s` is not)
+                if tool == "iperf3" and "-s" in argv:
+                    continue
+                stop_signal = STOP_SIGNALS[tool]
+            elif any(os.path.basename(arg) in ITERATOR_SCRIPTS for arg in argv[1:]):
+                stop_signal = signal.SIGTERM
+            else:
+                continue
+
+            try:
+                os.kill(int(pid), stop_signal)
+            except ProcessLookupError:
+                pass
+
+
+## Samples the flows of an experiment while it runs, and stops it on steady state
+class AdaptiveMonitor(threading.Thread):
+
+    def __init__(self, experiment, criterion, namespaces, max_duration):
+        super().__init__(daemon=True)
+        self.sources = tcp_sources(experiment)
+        self.criterion = criterion
+        # Namespaces whose tools are stopped on steady state
+        self.namespaces = namespaces
+        self.max_duration = max_duration
+
+        self.samples = []
+        self.reason = None
+        self.stop_time = None
+        self.precisions = None
+        self.finished = threading.Event()
+
+    def run(self):
+        start = time.monotonic()
+        previous = {}
+        previous_time = 0.0
+
+        while not self.finished.wait(self.criterion.interval):
+            elapsed = time.monotonic() - start
+            current = {}
+            for (ns, destinations) in self.sources.items():
+                for (socket, info) in read_sockets(ns, destinations).items():
+                    current[(ns,) + socket] = info
+
+            # Sockets that just opened only count from their next sample on
+            acked = sum(
+                info[0] - previous[socket][0] for (socket, info) in current.items() if socket in previous
+            )
+            rtts = [info[1] for info in current.values() if info[1] is not None]
+            self.samples.append({
+                "time": elapsed,
+                "goodput": acked * 8 / (elapsed - previous_time) / 1e6,
+                "rtt_p99": percentile(rtts, 99) if rtts else None,
+                "sockets": len(current),
+            })
+            previous = current
+            previous_time = elapsed
+
+            precisions = self.criterion.precisions(self.samples)
+            if precisions is None or elapsed < self.criterion.min_duration:
+                continue
+
+            self.precisions = precisions
+            if max(precisions) <= self.criterion.precision:
+                self.reason = "steady_state"
+                self.stop_time = elapsed
+                stop_tools(self.namespaces)
+                return
+
+    ## Returns why and when the run stopped, along with the samples it was decided on
+    def record(self):
+        # Without a steady state, the flows ran until their stop time
+        if self.reason is None:
+            self.reason = "max_duration"
+            self.stop_time = self.max_duration
+
+        return {
+            "reason": self.reason,
+            "stop_time": self.stop_time,
+            "max_duration": self.max_duration,
+            "min_duration": self.criterion.min_duration,
+            "window": self.criterion.window,
+            "precision": self.criterion.precision,
+            "confidence": self.criterion.confidence,
+            # Relative precisions of the goodput and p99 RTT when the run stopped
+            "goodput_precision": self.precisions[0] if self.precisions else None,
+            "rtt_p99_precision": self.precisions[1] if self.precisions else None,
+            "samples": self.samples,
+        }
+
+
+## This method runs `experiment` in adaptive-duration mode, and returns (and writes to
+## `adaptive.json` in the dump) why and when it stopped.
+# `criterion` is a `SteadyState` (the default one if None). The flows' stop times are the
+# maximum duration of the run.
+def run_adaptive(experiment, criterion=None):
+    from nest.experiment.pack import Pack
+    from nest.topology_map import TopologyMap
+
+    if criterion is None:
+        criterion = SteadyState()
+
+    max_duration = max(flow._get_props()[4] for flow in experiment.flows)
+    namespaces = [namespace["id"] for namespace in TopologyMap.get_namespaces()]
+
+    monitor = AdaptiveMonitor(experiment, criterion, namespaces, max_duration)
+    monitor.start()
+    try:
+        experiment.run()
+    finally:
+        monitor.finished.set()
+        monitor.join()
+
+    record = monitor.record()
+    with open(os.path.join(Pack.FOLDER, "adaptive.json"), "w") as record_file:
+        json.dump(record, record_file, indent=4)
+
+    print("Run stopped after %.1f s (%s)" % (record["stop_time"], record["reason"]))
+    return record
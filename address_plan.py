@@ -0,0 +1,79 @@
+# SPDX-License-Identifier: GPL-2.0-only
+# Copyright (c) 2019-2022 NITK Surathkal
+
+import ipaddress
+
+## This program contains the address planner of the dumbbell in `tcp_up_down.py`.
+#
+# The pool (10.0.0.0/8 by default) is cut into equally sized, aligned blocks:
+#
+#   block 0: left-nodes  <--> left-router    one /31 per access link
+#   block 1: right-nodes <--> right-router   one /31 per access link
+#   block 2: left-router <--> right-router   the first two hosts of its /24
+#
+# A block is a /24 for up to 128 flows, which gives the same addresses as the fixed
+# 10.0.0.0/24, 10.0.1.0/24 and 10.0.2.0/24 networks, and doubles for every doubling of
+# the flows after that (e.g. a /21 per side for 1,000 flows).
+#
+# The address of a link is computed from its index, so planning N links is O(N) and
+# no allocator has to be scanned for the next free address.
+
+
+class AddressPlan:
+
+    def __init__(self, links_per_side, pool="10.0.0.0/8"):
+        self.links_per_side = links_per_side
+        self.pool = ipaddress.ip_network(pool)
+
+        # Both ends of every access link need an address, and a side is never smaller than a /24
+        block_size = 256
+        while block_size < 2 * links_per_side:
+            block_size *= 2
+
+        # The three blocks have to fit in the pool
+        if 3 * block_size > self.pool.num_addresses:
+            raise ValueError(
+                "Address pool " + pool + " is too small for " + str(links_per_side) + " links per side"
+            )
+
+        prefixlen = 32 - (block_size.bit_length() - 1)
+        base = int(self.pool.network_address)
+
+        self.left_network = ipaddress.ip_network((base, prefixlen))
+        self.right_network = ipaddress.ip_network((base + block_size, prefixlen))
+        self.router_network = ipaddress.ip_network((base + 2 * block_size, 24))
+
+    ## Returns the (node side, router side) addresses of the i-th left access link
+    def left_link(self, i):
+        return self._access_link(self.left_network, i)
+
+    ## Returns the (node side, router side) addresses of the i-th right access link
+    def right_link(self, i):
+        return self._access_link(self.right_network, i)
+
+    ## Returns the (left-router side, right-router side) addresses of the bottleneck link
+    def router_link(self):
+        base = int(self.router_network.network_address)
+        return (
+            str(ipaddress.ip_address(base + 1)) + "/24",
+            str(ipaddress.ip_address(base + 2)) + "/24",
+        )
+
+    # Each access link is a point-to-point /31 (RFC 3021), with the node on the odd address:
+    # the first left link is 10.0.0.0/31 with the node at 10.0.0.1 and the router at 10.0.0.0.
+    # The routers therefore learn every node through the connected route of the link.
+    def _access_link(self, network, i):
+        if not 0 <= i < self.links_per_side:
+            raise IndexError("Access link " + str(i) + " is not part of the plan")
+
+        base = int(network.network_address) + 2 * i
+        return (
+            str(ipaddress.ip_address(base + 1)) + "/31",
+            str(ipaddress.ip_address(base)) + "/31",
+        )
+
+    def __repr__(self):
+        return (
+            "AddressPlan(left=" + str(self.left_network) + ", right=" + str(self.right_network)
+            + ", routers=" + str(self.router_network) + ")"
+        )
@@ -0,0 +1,200 @@
+# SPDX-License-Identifier: GPL-2.0-only
+# Copyright (c) 2019-2022 NITK Surathkal
+
+########################
+# SHOULD BE RUN AS ROOT
+########################
+
+import subprocess
+from collections import OrderedDict
+
+## This program contains the "batched" way of configuring a topology.
+#
+# Every NeST call (`connect()`, `add_route()`, `set_attributes()`, ...) forks its own
+# `ip`/`tc` process, sometimes several of them. That is fine for `h1 - r1 - r2 - h2`,
+# but the dumbbell in `tcp_up_down.py` makes roughly 20 such calls per flow.
+#
+# A `BatchPlan` instead collects the whole link, address, route and qdisc plan first and
+# then applies it with `ip -batch` / `tc -batch`: one `ip` process for the veth pairs,
+# and then one `ip` and one `tc` process per namespace, irrespective of the number of flows.
+#
+# The qdisc layout is the same one NeST builds in `set_attributes()`, so results of the
+# two build modes can be compared directly:
+#
+#   <dev>  root htb 1: --> class 1:1 (rate) --> netem 11: (delay)
+#   [AQM]  filter on 1: redirects egress traffic to an IFB with
+#   <ifb>  root htb 1: --> class 1:1 (rate) --> <AQM> 11:
+
+
+## Raised when `ip -batch` or `tc -batch` rejects a part of the plan
+class BatchError(Exception):
+    pass
+
+
+## Stand-in for the NeST `Interface` of a link built by a `BatchPlan`.
+## It carries what the experiments need from an interface: its node, its name
+## inside the namespace and its address.
+class BatchInterface:
+
+    def __init__(self, node, name, address=None):
+        self.node = node
+        self.id = name
+        self.name = name
+        self.address = address
+        self.pair = None
+        # Name of the IFB carrying the AQM of this interface (if any)
+        self.ifb = None
+
+    def get_address(self):
+        return self.address
+
+    def __repr__(self):
+        return "BatchInterface(" + repr(self.name) + ")"
+
+
+class BatchPlan:
+
+    def __init__(self):
+        # Commands that have to run in the default namespace (veth creation)
+        self.root_commands = []
+
+        # `ip` and `tc` commands for each namespace, in the order they were planned
+        self.ip_commands = OrderedDict()
+        self.tc_commands = OrderedDict()
+
+        # Number of `ip`/`tc` processes forked by `apply()`
+        self.processes = 0
+
+    ## Create a veth pair with one end (`dev1`) in `node1` and the other (`dev2`) in `node2`.
+    ## Returns the two ends as `BatchInterface`s, like NeST's `connect()` does.
+    def connect(self, node1, dev1, node2, dev2):
+        self.root_commands.append(
+            "link add " + dev1 + " netns " + node1.id + " type veth peer name " + dev2 + " netns " + node2.id
+        )
+        self._ip(node1.id, "link set dev " + dev1 + " up")
+        self._ip(node2.id, "link set dev " + dev2 + " up")
+
+        interface1 = BatchInterface(node1, dev1)
+        interface2 = BatchInterface(node2, dev2)
+        interface1.pair = interface2
+        interface2.pair = interface1
+        return (interface1, interface2)
+
+    ## Assign `address` (in "a.b.c.d/len" form) to `interface`
+    def set_address(self, interface, address):
+        self._ip(interface.node.id, "address add " + address + " dev " + interface.id)
+        interface.address = address
+
+    ## Route `destination` ("DEFAULT", a host or a subnet) via `interface`.
+    ## As in NeST, the next hop is the other end of the veth pair.
+    def add_route(self, node, destination, interface):
+        if destination == "DEFAULT":
+            destination = "default"
+        next_hop = interface.pair.address.split("/")[0]
+        self._ip(node.id, "route add " + destination + " via " + next_hop + " dev " + interface.id)
+
+    ## Same as NeST's `Interface.set_attributes()`: shape the egress of `interface` to
+    ## `bandwidth`, delay it by `delay` and, when `qdisc` is given, queue it in `qdisc`.
+    def set_attributes(self, interface, bandwidth, delay, qdisc=None):
+        ns = interface.node.id
+        dev = interface.id
+
+        self._tc(ns, "qdisc add dev " + dev + " root handle 1: htb default 1")
+        self._tc(ns, "class add dev " + dev + " parent 1: classid 1:1 htb rate " + bandwidth)
+        self._tc(ns, "qdisc add dev " + dev + " parent 1:1 handle 11: netem delay " + delay)
+
+        if qdisc is not None:
+            interface.ifb = "ifb-" + dev
+            self._ip(ns, "link add " + interface.ifb + " type ifb")
+            self._ip(ns, "link set dev " + interface.ifb + " up")
+            self._tc(ns, "qdisc add dev " + interface.ifb + " root handle 1: htb default 1")
+            self._tc(ns, "class add dev " + interface.ifb + " parent 1: classid 1:1 htb rate " + bandwidth)
+            self._tc(ns, "qdisc add dev " + interface.ifb + " parent 1:1 handle 11: " + qdisc)
+            self._tc(
+                ns,
+                "filter add dev " + dev + " parent 1: protocol all prio 1 u32 match u32 0 0"
+                " action mirred egress redirect dev " + interface.ifb,
+            )
+
+    ## Replace the qdisc `set_attributes()` put on the IFB of `interface` with a fresh `qdisc`
+    def set_qdisc(self, interface, qdisc):
+        ns = interface.node.id
+        self._tc(ns, "qdisc del dev " + interface.ifb + " parent 1:1 handle 11:")
+        self._tc(ns, "qdisc add dev " + interface.ifb + " parent 1:1 handle 11: " + qdisc)
+
+    ## Forget the TCP metrics (ssthresh, RTT, cwnd, ...) `node` cached from earlier connections,
+    ## so that the next experiment starts every connection from scratch
+    def flush_tcp_metrics(self, node):
+        self._ip(node.id, "tcp_metrics flush all")
+
+    ## Undo `set_address()` and `set_attributes()` on `interface`: remove its addresses, neighbours,
+    ## qdiscs and IFB, leaving the (up) link itself in place to be configured again
+    def flush_interface(self, interface):
+        ns = interface.node.id
+        self._ip(ns, "address flush dev " + interface.id)
+        self._ip(ns, "neigh flush dev " + interface.id)
+        if interface.ifb is not None:
+            self._ip(ns, "link del " + interface.ifb)
+        self._tc(ns, "qdisc del dev " + interface.id + " root")
+
+        interface.address = None
+        interface.ifb = None
+
+    ## Remove every route of `node`'s main table, i.e. those `add_route()` added
+    def flush_routes(self, node):
+        self._ip(node.id, "route flush table main")
+
+    ## Number of individual `ip`/`tc` commands in the plan
+    def command_count(self):
+        count = len(self.root_commands)
+        for commands in self.ip_commands.values():
+            count += len(commands)
+        for commands in self.tc_commands.values():
+            count += len(commands)
+        return count
+
+    ## Apply the plan: veth pairs first, then the `ip` configuration of every
+    ## namespace (addresses, IFBs, routes) and finally their qdiscs.
+    def apply(self):
+        if self.root_commands:
+            run_batch("ip", None, self.root_commands)
+            self.processes += 1
+
+        for ns, commands in self.ip_commands.items():
+            run_batch("ip", ns, commands)
+            self.processes += 1
+
+        for ns, commands in self.tc_commands.items():
+            run_batch("tc", ns, commands)
+            self.processes += 1
+
+        self.root_commands = []
+        self.ip_commands = OrderedDict()
+        self.tc_commands = OrderedDict()
+
+    def _ip(self, ns, command):
+        self.ip_commands.setdefault(ns, []).append(command)
+
+    def _tc(self, ns, command):
+        self.tc_commands.setdefault(ns, []).append(command)
+
+
+## Feed `commands` to a single `ip -batch -` or `tc -batch -` process,
+## run inside the namespace `ns` (or the default namespace if `ns` is None)
+def run_batch(tool, ns, commands):
+    cmd = [tool]
+    if ns is not None:
+        cmd += ["-n", ns]
+    cmd += ["-batch", "-"]
+
+    proc = subprocess.run(
+        cmd,
+        input="\n".join(commands) + "\n",
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+    )
+    if proc.returncode != 0:
+        raise BatchError(
+            "'" + " ".join(cmd) + "' failed in namespace " + str(ns) + ": " + proc.stderr.strip()
+        )
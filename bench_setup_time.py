@@ -0,0 +1,155 @@
+# SPDX-License-Identifier: GPL-2.0-only
+# Copyright (c) 2019-2022 NITK Surathkal
+
+########################
+# SHOULD BE RUN AS ROOT
+########################
+
+# This program benchmarks how long it takes to build the dumbbell of `tcp_up_down.py`
+# for a growing number of flows, once with one NeST call at a time ("serial") and
+# once with `ip -batch`/`tc -batch` ("batched").
+#
+# With `--flows-per-host`, it also compares the one-node-per-flow layout with nodes
+# carrying K flows each: for every build it reports the number of namespaces and the
+# kernel memory (slab and overall) it took, along with the setup time.
+#
+# Usage:
+#   python bench_setup_time.py [--flows 1 2 4 ... 512] [--modes serial batched]
+#                              [--flows-per-host 1 8 32] [--output bench.json]
+#
+# Every measurement runs in a fresh interpreter, so that NeST deletes the namespaces
+# of one build (when that interpreter exits) before the next one starts.
+# Only the topology is built: no experiment is run.
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+DEFAULT_FLOWS = [1, 2, 4, 8, 16, 32, 64, 128, 256, 512]
+MODES = ["serial", "batched"]
+
+
+## Number of processes forked while building the topology
+forked_processes = 0
+
+
+## This method returns the `/proc/meminfo` fields (in kB) used to measure kernel memory
+def read_meminfo():
+    meminfo = {}
+    with open("/proc/meminfo") as proc_meminfo:
+        for line in proc_meminfo:
+            (field, value) = line.split(":", 1)
+            if field in ("MemAvailable", "Slab", "SUnreclaim", "KernelStack", "PageTables"):
+                meminfo[field] = int(value.split()[0])
+    return meminfo
+
+
+## This method returns the number of named network namespaces
+def count_namespaces():
+    if not os.path.isdir("/var/run/netns"):
+        return 0
+    return len(os.listdir("/var/run/netns"))
+
+
+## This method runs inside the child interpreter: it builds one dumbbell and
+## prints the measurements as a single JSON line
+def measure(NO_TCP_FLOWS, mode, flows_per_host):
+
+    # Count every `ip`/`tc`/`sysctl` process forked by NeST or by a `BatchPlan`
+    class CountingPopen(subprocess.Popen):
+        def __init__(self, *args, **kwargs):
+            global forked_processes
+            forked_processes += 1
+            super().__init__(*args, **kwargs)
+
+    subprocess.Popen = CountingPopen
+
+    from tcp_up_down import build_dumbbell
+
+    namespaces_before = count_namespaces()
+    meminfo_before = read_meminfo()
+
+    start = time.monotonic()
+    build_dumbbell(NO_TCP_FLOWS, "fq_codel", batched=(mode == "batched"), flows_per_host=flows_per_host)
+    setup_time = time.monotonic() - start
+
+    meminfo_after = read_meminfo()
+
+    print(json.dumps({
+        "flows": NO_TCP_FLOWS,
+        "mode": mode,
+        "flows_per_host": flows_per_host,
+        "setup_time": setup_time,
+        "processes": forked_processes,
+        "namespaces": count_namespaces() - namespaces_before,
+        # Kernel memory taken by the topology, in kB
+        "slab_kb": meminfo_after["Slab"] - meminfo_before["Slab"],
+        "memory_kb": meminfo_before["MemAvailable"] - meminfo_after["MemAvailable"],
+    }))
+
+
+## This method runs `measure` in a child interpreter and returns its result,
+## along with the total wall time of the child (which includes the teardown)
+def run_child(NO_TCP_FLOWS, mode, flows_per_host):
+    start = time.monotonic()
+    proc = subprocess.run(
+        [sys.executable, __file__, "--child", str(NO_TCP_FLOWS), mode, str(flows_per_host)],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+    )
+    wall_time = time.monotonic() - start
+
+    result = {"flows": NO_TCP_FLOWS, "mode": mode, "flows_per_host": flows_per_host, "wall_time": wall_time}
+    for line in proc.stdout.splitlines():
+        if line.startswith("{"):
+            result.update(json.loads(line))
+
+    if proc.returncode != 0 or "setup_time" not in result:
+        # Keep the last line of the error (e.g. the address space running out)
+        errors = proc.stderr.strip().splitlines()
+        result["error"] = errors[-1] if errors else "exit code " + str(proc.returncode)
+
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the setup time of the tcp_up/tcp_down dumbbell")
+    parser.add_argument("--flows", type=int, nargs="+", default=DEFAULT_FLOWS)
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=MODES)
+    parser.add_argument("--flows-per-host", type=int, nargs="+", default=[1])
+    parser.add_argument("--output", help="also write the results to this JSON file")
+    parser.add_argument("--child", nargs=3, metavar=("FLOWS", "MODE", "FLOWS_PER_HOST"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        measure(int(args.child[0]), args.child[1], int(args.child[2]))
+        return
+
+    results = []
+    print("%8s %8s %6s %12s %12s %10s %11s %10s %12s" % (
+        "flows", "mode", "K", "setup (s)", "total (s)", "processes", "namespaces", "slab (kB)", "memory (kB)"
+    ))
+    for NO_TCP_FLOWS in args.flows:
+        for flows_per_host in args.flows_per_host:
+            for mode in args.modes:
+                result = run_child(NO_TCP_FLOWS, mode, flows_per_host)
+                results.append(result)
+                if "error" in result:
+                    print("%8d %8s %6d  failed: %s" % (NO_TCP_FLOWS, mode, flows_per_host, result["error"]))
+                else:
+                    print("%8d %8s %6d %12.3f %12.3f %10d %11d %10d %12d" % (
+                        NO_TCP_FLOWS, mode, flows_per_host, result["setup_time"], result["wall_time"],
+                        result["processes"], result["namespaces"], result["slab_kb"], result["memory_kb"]
+                    ))
+
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=4)
+
+
+if __name__ == "__main__":
+    main()
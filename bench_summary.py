@@ -0,0 +1,161 @@
+# SPDX-License-Identifier: GPL-2.0-only
+# Copyright (c) 2019-2022 NITK Surathkal
+
+# This program benchmarks `summary.py` on a synthetic dump of about `--size` bytes.
+#
+# The dump has the layout NeST writes: netperf, ping and ss samples (with retransmissions)
+# every 0.2 seconds for every flow, from `--flows` flows spread over `--hosts` namespaces.
+# The run lasts as long as needed for the dump to reach `--size`. It reports the time spent
+# loading the samples and computing the metrics, and the throughput in MB of dump per second.
+#
+# Usage:
+#   python bench_summary.py [--size 1G] [--flows 1000] [--hosts 10] [--dump DIR] [--keep]
+#
+# No experiment is run, and root is not needed.
+
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from result_cache import parse_size
+from summary import load_dump, summarize_series
+
+## Seconds between two samples of a flow
+INTERVAL = 0.2
+
+## Start of the synthetic run (a Unix timestamp, as NeST records them)
+START = 1650000000.0
+
+
+# Each of these returns one sample of a tool, as NeST writes it
+def _netperf_sample(timestamp, rng):
+    return {"timestamp": "%.6f" % timestamp, "sending_rate": "%.2f" % rng.uniform(5, 15)}
+
+
+def _ping_sample(timestamp, rng):
+    return {"timestamp": "%.6f" % timestamp, "rtt": "%.3f" % rng.uniform(20, 120)}
+
+
+def _ss_sample(timestamp, rng, i):
+    return {
+        "timestamp": "%.6f" % timestamp, "cwnd": str(rng.randint(10, 400)), "rwnd": "65535",
+        "rtt": "%.3f" % rng.uniform(20, 120), "dev_rtt": "%.3f" % rng.uniform(0, 10),
+        "ssthresh": str(rng.randint(10, 400)), "rto": "220", "delivery_rate": "%.3f" % rng.uniform(5, 15),
+        "pacing_rate": "%.3f" % rng.uniform(5, 30), "retrans": "0/%d" % (i // 50), "segs_out": str(i * 170),
+    }
+
+
+## Writes the `tool` dump of `flows` flows of `samples` samples each to `path`
+# The file is written one sample at a time, so that it never has to fit in memory.
+def write_tool_dump(path, tool, flows, hosts, samples, seed):
+    rng = random.Random(seed)
+    meta = json.dumps({"meta": True, "start_time": "0", "stop_time": "0"})
+
+    with open(path, "w") as dump_file:
+        dump_file.write("{")
+        for host in range(hosts):
+            dump_file.write((", " if host else "") + json.dumps("h" + str(host)) + ": [")
+            host_flows = range(host, flows, hosts)
+            for (k, flow) in enumerate(host_flows):
+                destination = "10.1.%d.%d" % (flow // 250, flow % 250 + 2)
+                if tool == "netperf":
+                    destination += ":" + str(40000 + flow)
+                dump_file.write((", " if k else "") + "{" + json.dumps(destination) + ": ")
+                if tool == "ss":
+                    dump_file.write("{" + json.dumps(str(50000 + flow)) + ": ")
+
+                dump_file.write("[" + meta)
+                for i in range(samples):
+                    timestamp = START + i * INTERVAL + flow * 0.001
+                    if tool == "netperf":
+                        sample = _netperf_sample(timestamp, rng)
+                    elif tool == "ping":
+                        sample = _ping_sample(timestamp, rng)
+                    else:
+                        sample = _ss_sample(timestamp, rng, i)
+                    dump_file.write(", " + json.dumps(sample))
+                dump_file.write("]")
+
+                if tool == "ss":
+                    dump_file.write("}")
+                dump_file.write("}")
+            dump_file.write("]")
+        dump_file.write("}")
+
+
+## This method writes a synthetic dump of about `size` bytes in `dump`, and returns its actual size
+def write_dump(dump, size, flows, hosts, seed=1):
+    rng = random.Random(seed)
+    # Bytes of the three samples of one flow at one instant
+    sample_size = sum(
+        len(json.dumps(sample)) + 2
+        for sample in (_netperf_sample(START, rng), _ping_sample(START, rng), _ss_sample(START, rng, 1000))
+    )
+    samples = max(1, int(size / (flows * sample_size)))
+
+    os.makedirs(dump, exist_ok=True)
+    for tool in ("netperf", "ping", "ss"):
+        write_tool_dump(os.path.join(dump, tool + ".json"), tool, flows, hosts, samples, seed)
+
+    return sum(os.path.getsize(os.path.join(dump, tool + ".json")) for tool in ("netperf", "ping", "ss"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark summary.py on a synthetic dump")
+    parser.add_argument("--size", type=parse_size, default=parse_size("1G"), help="size of the dump, e.g. 1G")
+    parser.add_argument("--flows", type=int, default=1000)
+    parser.add_argument("--hosts", type=int, default=10, help="namespaces the flows start from")
+    parser.add_argument("--dump", help="dump directory (a temporary one by default)")
+    parser.add_argument("--keep", action="store_true", help="keep the dump after the benchmark")
+    parser.add_argument("--output", help="file the measurements are written to (JSON)")
+    args = parser.parse_args()
+
+    dump = args.dump or tempfile.mkdtemp(prefix="bench_summary_", suffix="_dump")
+    try:
+        if os.path.isfile(os.path.join(dump, "netperf.json")):
+            size = sum(
+                os.path.getsize(os.path.join(dump, name)) for name in os.listdir(dump) if name.endswith(".json")
+            )
+            print("Reusing the dump in " + dump)
+        else:
+            print("Writing a %d MB dump of %d flows to %s" % (args.size >> 20, args.flows, dump))
+            size = write_dump(dump, args.size, args.flows, args.hosts)
+
+        start = time.perf_counter()
+        series = load_dump(dump)
+        load_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        summary = summarize_series(series)
+        metrics_time = time.perf_counter() - start
+    finally:
+        if not args.keep and not args.dump:
+            shutil.rmtree(dump, ignore_errors=True)
+
+    result = {
+        "size": size,
+        "flows": summary["flows"],
+        "samples": summary["samples"],
+        "load_time": load_time,
+        "metrics_time": metrics_time,
+        # MB of dump summarized per second, loading included
+        "throughput": size / (load_time + metrics_time) / 1e6,
+    }
+    print(
+        "%d MB, %d samples: loaded in %.2f s, metrics in %.2f s, %.1f MB/s"
+        % (size / 1e6, result["samples"], load_time, metrics_time, result["throughput"])
+    )
+
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(result, output_file, indent=4)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,275 @@
+# SPDX-License-Identifier: GPL-2.0-only
+# Copyright (c) 2019-2022 NITK Surathkal
+
+# This program converts the dumps of experiments (the `<name>(<timestamp>)_dump` directories
+# written by `Experiment.run()`) into typed columnar tables, stored as Parquet or Arrow IPC files.
+#
+# Every dump adds one file to each of these tables:
+#
+#   goodput:  experiment, source, destination, port, timestamp, goodput (Mbps)
+#             from netperf (TCP) and iperf3 (UDP)
+#   rtt:      experiment, source, destination, timestamp, rtt (ms)                 from ping
+#   socket:   experiment, source, destination, port, timestamp, cwnd, rwnd, rtt, dev_rtt,
+#             ssthresh, rto, delivery_rate, pacing_rate, retrans,                   from ss
+#             unrecovered_retrans
+#   qdisc:    experiment, node, device, handle, kind, timestamp, bytes, packets, drops,
+#             overlimits, requeues, backlog, qlen                                   from tc
+#
+# i.e. `<output>/<table>/<dump>.parquet` (or `.arrow`), so that all the dumps of a sweep form one
+# dataset per table. The Arrow IPC files are read back memory-mapped by `load_table()`, without
+# parsing anything.
+#
+# The dumps are streamed: the samples of every tool's JSON file are read one at a time (see
+# `json_stream.py`) and written as record batches of at most `BATCH_ROWS` rows of one flow, so
+# only one batch is held in memory at any time, whatever the size of the dump.
+#
+# Usage:
+#   python columnar_export.py <dump> [<dump> ...] [--output columnar] [--format parquet|arrow]
+#
+# pyarrow is needed (`pip install pyarrow`), but only by this program.
+
+import argparse
+import os
+import sys
+
+from json_stream import batches, flows
+
+## Columns of every table, with their types. Every table starts with the name of the experiment.
+TABLES = {
+    "goodput": [
+        ("experiment", "string"), ("source", "string"), ("destination", "string"), ("port", "int32"),
+        ("timestamp", "float64"), ("goodput", "float64"),
+    ],
+    "rtt": [
+        ("experiment", "string"), ("source", "string"), ("destination", "string"),
+        ("timestamp", "float64"), ("rtt", "float64"),
+    ],
+    "socket": [
+        ("experiment", "string"), ("source", "string"), ("destination", "string"), ("port", "int32"),
+        ("timestamp", "float64"), ("cwnd", "float64"), ("rwnd", "float64"), ("rtt", "float64"),
+        ("dev_rtt", "float64"), ("ssthresh", "float64"), ("rto", "float64"), ("delivery_rate", "float64"),
+        ("pacing_rate", "float64"), ("retrans", "float64"), ("unrecovered_retrans", "float64"),
+    ],
+    "qdisc": [
+        ("experiment", "string"), ("node", "string"), ("device", "string"), ("handle", "string"),
+        ("kind", "string"), ("timestamp", "float64"), ("bytes", "float64"), ("packets", "float64"),
+        ("drops", "float64"), ("overlimits", "float64"), ("requeues", "float64"), ("backlog", "float64"),
+        ("qlen", "float64"),
+    ],
+}
+
+## File extension of each output format
+FORMATS = {"parquet": ".parquet", "arrow": ".arrow"}
+
+## Rows of a record batch, at most: longer flows are written as several batches
+BATCH_ROWS = 65536
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError("Exporting to Parquet or Arrow needs pyarrow: pip install pyarrow")
+    return pyarrow
+
+
+## This method returns the pyarrow schema of `table`
+def table_schema(table):
+    pa = _import_pyarrow()
+    return pa.schema([(name, getattr(pa, column_type)()) for (name, column_type) in TABLES[table]])
+
+
+# Returns `value` as a float, or None if it is missing or not a number (e.g. "" in an ss sample)
+def _number(value):
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+# Returns the (total, unrecovered) retransmissions of an ss sample's "retrans", which `ss` writes as
+# "<unrecovered>/<total>" (e.g. "0/3")
+def _retrans(value):
+    if isinstance(value, str) and "/" in value:
+        (unrecovered, total) = value.rsplit("/", 1)
+        return (_number(total), _number(unrecovered))
+    return (_number(value), None)
+
+
+# Each of these returns the rows (as {column: list of values}) of a batch of `samples` of one
+# flow, from the `path` of keys leading to the flow in the tool's JSON dump
+
+def _goodput_rows(experiment, path, samples):
+    (source, _, destination) = path
+    (address, port) = destination.rsplit(":", 1) if ":" in destination else (destination, None)
+    return {
+        "experiment": [experiment] * len(samples),
+        "source": [source] * len(samples),
+        "destination": [address] * len(samples),
+        "port": [int(port) if port else None] * len(samples),
+        "timestamp": [_number(sample.get("timestamp")) for sample in samples],
+        "goodput": [_number(sample.get("sending_rate")) for sample in samples],
+    }
+
+
+def _rtt_rows(experiment, path, samples):
+    (source, _, destination) = path
+    return {
+        "experiment": [experiment] * len(samples),
+        "source": [source] * len(samples),
+        "destination": [destination] * len(samples),
+        "timestamp": [_number(sample.get("timestamp")) for sample in samples],
+        "rtt": [_number(sample.get("rtt")) for sample in samples],
+    }
+
+
+def _socket_rows(experiment, path, samples):
+    (source, _, destination, port) = path
+    rows = {
+        "experiment": [experiment] * len(samples),
+        "source": [source] * len(samples),
+        "destination": [destination] * len(samples),
+        "port": [int(port)] * len(samples),
+        "timestamp": [_number(sample.get("timestamp")) for sample in samples],
+    }
+    for (metric, column_type) in TABLES["socket"][5:-2]:
+        rows[metric] = [_number(sample.get(metric)) for sample in samples]
+    retrans = [_retrans(sample.get("retrans")) for sample in samples]
+    rows["retrans"] = [total for (total, unrecovered) in retrans]
+    rows["unrecovered_retrans"] = [unrecovered for (total, unrecovered) in retrans]
+    return rows
+
+
+def _qdisc_rows(experiment, path, samples):
+    (node, _, device, handle) = path
+    rows = {
+        "experiment": [experiment] * len(samples),
+        "node": [node] * len(samples),
+        "device": [device] * len(samples),
+        "handle": [handle] * len(samples),
+        "kind": [sample.get("kind") for sample in samples],
+        "timestamp": [_number(sample.get("timestamp")) for sample in samples],
+    }
+    for (metric, column_type) in TABLES["qdisc"][6:]:
+        rows[metric] = [_number(sample.get(metric)) for sample in samples]
+    return rows
+
+
+## Tool dumps (in the order they are read), the table of each, how deep its samples are in
+## its JSON (see `json_stream.py`) and its converter
+SOURCES = [
+    ("netperf.json", "goodput", 4, _goodput_rows),
+    ("iperf3.json", "goodput", 4, _goodput_rows),
+    ("ping.json", "rtt", 4, _rtt_rows),
+    ("ss.json", "socket", 5, _socket_rows),
+    ("tc.json", "qdisc", 5, _qdisc_rows),
+]
+
+
+## Writes the record batches of one table to a Parquet or Arrow IPC file
+class TableWriter:
+
+    def __init__(self, path, table, output_format):
+        self.pa = _import_pyarrow()
+        self.schema = table_schema(table)
+        self.parquet = output_format == "parquet"
+        self.rows = 0
+
+        if self.parquet:
+            import pyarrow.parquet
+
+            self.writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+        else:
+            import pyarrow.ipc
+
+            self.writer = pyarrow.ipc.new_file(path, self.schema)
+
+    def write(self, rows):
+        batch = self.pa.RecordBatch.from_pydict(rows, schema=self.schema)
+        if self.parquet:
+            self.writer.write_table(self.pa.Table.from_batches([batch]))
+        else:
+            self.writer.write_batch(batch)
+        self.rows += batch.num_rows
+
+    def close(self):
+        self.writer.close()
+
+
+## This method converts the dump in `dump` into the tables under `output`,
+## and returns the number of rows written to each table
+def export_dump(dump, output, output_format="parquet"):
+    experiment = os.path.basename(os.path.normpath(dump))
+    writers = {}
+    rows = {}
+
+    try:
+        for (filename, table, depth, converter) in SOURCES:
+            path = os.path.join(dump, filename)
+            if not os.path.isfile(path):
+                continue
+
+            if table not in writers:
+                os.makedirs(os.path.join(output, table), exist_ok=True)
+                writers[table] = TableWriter(
+                    os.path.join(output, table, experiment + FORMATS[output_format]), table, output_format
+                )
+
+            with open(path) as stats_file:
+                for (flow_path, samples) in flows(stats_file, depth):
+                    # NeST's "meta" items are not samples
+                    samples = (sample for sample in samples if not sample.get("meta"))
+                    for batch in batches(samples, BATCH_ROWS):
+                        writers[table].write(converter(experiment, flow_path, batch))
+    finally:
+        for (table, writer) in writers.items():
+            writer.close()
+            rows[table] = writer.rows
+
+    return rows
+
+
+## This method loads `table` of all the dumps exported under `output` as one pyarrow Table.
+## Arrow IPC files are memory-mapped, so their columns are not copied into memory.
+def load_table(output, table):
+    pa = _import_pyarrow()
+    directory = os.path.join(output, table)
+
+    tables = []
+    for filename in sorted(os.listdir(directory)):
+        path = os.path.join(directory, filename)
+        if filename.endswith(FORMATS["arrow"]):
+            import pyarrow.ipc
+
+            tables.append(pyarrow.ipc.open_file(pa.memory_map(path)).read_all())
+        elif filename.endswith(FORMATS["parquet"]):
+            import pyarrow.parquet
+
+            tables.append(pyarrow.parquet.read_table(path, memory_map=True))
+
+    if not tables:
+        return table_schema(table).empty_table()
+    return pa.concat_tables(tables)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert experiment dumps into Parquet or Arrow tables")
+    parser.add_argument("dumps", nargs="+", help="dump directories written by Experiment.run()")
+    parser.add_argument("--output", default="columnar", help="directory the tables are written to")
+    parser.add_argument("--format", choices=sorted(FORMATS), default="parquet")
+    args = parser.parse_args()
+
+    try:
+        _import_pyarrow()
+    except ImportError as error:
+        sys.exit(str(error))
+
+    for dump in args.dumps:
+        rows = export_dump(dump, args.output, args.format)
+        print(dump + ": " + ", ".join(table + " " + str(count) + " rows" for (table, count) in rows.items()))
+
+
+if __name__ == "__main__":
+    main()
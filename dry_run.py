@@ -0,0 +1,696 @@
+# SPDX-License-Identifier: GPL-2.0-only
+# Copyright (c) 2019-2022 NITK Surathkal
+
+import argparse
+import ipaddress
+import json
+import os
+import runpy
+import shutil
+import sys
+import tempfile
+import time
+import types
+
+## This program contains the dry-run backend of the experiments: the NeST calls they make are
+## recorded, along with the `ip`/`tc`/tool commands NeST would run for them, without root and
+## without touching the kernel.
+#
+# `install()` puts stand-ins for the parts of NeST the experiments use in `sys.modules` (`Node`,
+# `Router`, `connect`, `Interface.set_address`/`set_attributes`/`set_qdisc`, `Node.add_route`,
+# `AddressHelper.assign_addresses`, `Experiment`, `Flow`, `Pack`, `TopologyMap`, ...). Every
+# call is appended to the plan of the current `DryRun`, and expands to the commands NeST forks
+# for it, following NeST's layout:
+#
+#   Node            ip netns add, lo up (and the forwarding sysctls for a Router)
+#   connect         a veth pair moved into the two namespaces, set up, DAD disabled, and the
+#                   htb 1: --> class 1:1 --> netem 11: structure on both ends
+#   set_attributes  the rate of class 1:1, the delay of netem 11:, and with an AQM, an IFB
+#                   the egress is redirected to, carrying htb 1: --> class 1:1 --> <AQM> 11:
+#   Experiment.run  the netserver/netperf, iperf3, ss, tc and ping commands of its flows
+#
+# `BatchPlan`s are recorded as the `ip -batch`/`tc -batch` processes they would fork, and the
+# samplers that need the kernel (`host_monitor`, `qdisc_sampler`, `latency_prober`, `adaptive`)
+# only record that they would have run. Experiments do not wait for their flows: a dry run of
+# a 200 s scenario takes milliseconds.
+#
+# The number of commands and of processes of a dry run is a measure of the setup cost of a
+# scenario, which can be tracked as scenarios and build modes change.
+#
+# Usage:
+#   python dry_run.py [--commands] [--output plan.json] tcp_nup.py fq_codel 8 --batched
+#   python dry_run.py [--commands] [--output plans.json] --scenario scenarios/*.json [--set aqm=pie]
+
+## Prefix of the namespace and interface ids, as NeST's `TOPOLOGY_ID` (fixed, so dry runs are repeatable)
+TOPOLOGY_ID = "dryrun"
+
+## Default rate of the htb class of every interface, as NeST's "default_bandwidth"
+DEFAULT_BANDWIDTH = "1024mbit"
+
+## Seconds between two `ss` and `ping` samples, as NeST's iterators
+SAMPLE_INTERVAL = 0.2
+
+# The `DryRun` recording the calls being made, None before `install()`
+_current = None
+
+# Every interface created in the current dry run, in order, for `AddressHelper`
+_all_interfaces = []
+
+
+## The plan and the commands recorded for one script or scenario
+class DryRun:
+
+    def __init__(self, name):
+        self.name = name
+        # (operation, arguments...) tuples, in the order the calls were made
+        self.plan = []
+        # (process, command) tuples: every command NeST runs forks a process of its own, while
+        # the commands of a `BatchPlan` share the process of their batch
+        self.commands = []
+        self.processes = 0
+        self.started = time.monotonic()
+        self.elapsed = None
+        self.error = None
+
+    def step(self, *step):
+        self.plan.append(step)
+
+    def run(self, command):
+        self.processes += 1
+        self.commands.append((self.processes, command))
+
+    def batch(self, process, commands):
+        self.processes += 1
+        for command in commands:
+            self.commands.append((self.processes, process + " " + command))
+
+    ## Returns the number of commands run by every tool, e.g. {"ip": 120, "tc": 48, "netperf": 8}
+    def tool_counts(self):
+        counts = {}
+        for (process, command) in self.commands:
+            tool = _tool(command)
+            counts[tool] = counts.get(tool, 0) + 1
+        return counts
+
+    def finish(self, error=None):
+        self.elapsed = time.monotonic() - self.started
+        self.error = error
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "error": self.error,
+            "elapsed": self.elapsed,
+            "steps": len(self.plan),
+            "commands": len(self.commands),
+            "processes": self.processes,
+            "tools": self.tool_counts(),
+            "plan": [[_plain(value) for value in step] for step in self.plan],
+            "command_list": [command for (process, command) in self.commands],
+        }
+
+
+# Returns the tool a command runs, without the `ip netns exec <ns>` prefix
+def _tool(command):
+    words = command.split()
+    if words[:3] == ["ip", "netns", "exec"]:
+        words = words[4:]
+    return os.path.basename(words[0]) if words else ""
+
+
+# Returns `value` as it is written to the plan in JSON
+def _plain(value):
+    if isinstance(value, (DryNode, DryInterface)):
+        return value.name
+    if isinstance(value, (list, tuple)):
+        return [_plain(item) for item in value]
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)
+
+
+# Returns the id of a new namespace or interface, as NeST's `IdGen` with random names
+def _new_id():
+    DryTopologyMap.counter += 1
+    return TOPOLOGY_ID + "-" + str(DryTopologyMap.counter)
+
+
+## Stand-in for NeST's `Address`
+class DryAddress:
+
+    def __init__(self, address):
+        if isinstance(address, DryAddress):
+            address = address.address
+        self.address = address
+
+    def get_addr(self, with_subnet=True):
+        return self.address if with_subnet else self.address.split("/")[0]
+
+    def is_ipv6(self):
+        return ":" in self.address
+
+    def is_subnet(self):
+        if "/" not in self.address:
+            return False
+        interface = ipaddress.ip_interface(self.address)
+        return interface.ip == interface.network.network_address
+
+    def __str__(self):
+        return self.address
+
+    def __repr__(self):
+        return "Address(" + repr(self.address) + ")"
+
+
+## Stand-in for NeST's `Network`: the addresses `AddressHelper` hands out to the links connected under it
+class DryNetwork:
+
+    def __init__(self, network):
+        self.network = ipaddress.ip_network(network)
+        self.hosts = self.network.hosts()
+
+    def __repr__(self):
+        return "Network(" + repr(str(self.network)) + ")"
+
+
+## Stand-in for NeST's `TopologyMap`
+class DryTopologyMap:
+
+    namespaces = {}
+    counter = 0
+
+    @staticmethod
+    def get_namespace(ns_id):
+        return {"id": ns_id, "name": DryTopologyMap.namespaces[ns_id]}
+
+    @staticmethod
+    def delete_all_mapping():
+        DryTopologyMap.namespaces = {}
+
+
+## Stand-in for NeST's `Node`
+class DryNode:
+
+    # Operation of the plan a new node is recorded as
+    kind = "node"
+
+    def __init__(self, name):
+        self._name = name
+        self._id = _new_id()
+        self._interfaces = []
+        DryTopologyMap.namespaces[self._id] = name
+
+        _current.step(self.kind, name)
+        _current.run("ip netns add " + self._id)
+        _current.run("ip netns exec " + self._id + " ip link set dev lo up")
+
+    @property
+    def id(self):
+        return self._id
+
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def interfaces(self):
+        return self._interfaces
+
+    def add_route(self, dest_addr, via_interface, next_hop_addr=""):
+        _current.step("route", self, str(dest_addr), via_interface)
+        if str(dest_addr) == "DEFAULT":
+            destination = "default"
+        else:
+            address = DryAddress(dest_addr)
+            destination = address.get_addr(with_subnet=address.is_subnet())
+        if next_hop_addr == "":
+            next_hop_addr = via_interface.pair.address
+        _current.run(
+            "ip netns exec " + self.id + " ip route add " + destination + " via "
+            + DryAddress(next_hop_addr).get_addr(with_subnet=False) + " dev " + via_interface.id
+        )
+
+    def configure_tcp_param(self, param, value):
+        _current.step("tcp_param", self, param, value)
+        _current.run("ip netns exec " + self.id + " sysctl -q -w net.ipv4.tcp_" + param + "=" + str(value))
+
+    def ping(self, destination_address, packets=1, verbose=True):
+        _current.step("ping", self, str(destination_address))
+        address = DryAddress(destination_address)
+        _current.run(
+            "ip netns exec " + self.id + " ping " + ("-6 " if address.is_ipv6() else "") + "-c " + str(packets)
+            + " -q " + address.get_addr(with_subnet=False)
+        )
+        if verbose:
+            print("SUCCESS: ping from " + self.name + " to " + address.get_addr(with_subnet=False))
+        return True
+
+    def enable_ip_forwarding(self, ipv4=True, ipv6=True):
+        if ipv6:
+            _current.run("ip netns exec " + self.id + " sysctl -w net.ipv6.conf.all.forwarding=1")
+        if ipv4:
+            _current.run("ip netns exec " + self.id + " sysctl -w net.ipv4.ip_forward=1")
+
+    def __repr__(self):
+        return "Node(" + repr(self.name) + ")"
+
+
+## Stand-in for NeST's `Router`: a node that forwards
+class DryRouter(DryNode):
+
+    kind = "router"
+
+    def __init__(self, name):
+        super().__init__(name)
+        self.enable_ip_forwarding()
+
+    def __repr__(self):
+        return "Router(" + repr(self.name) + ")"
+
+
+## Stand-in for NeST's `Interface`
+class DryInterface:
+
+    def __init__(self, name, node):
+        self.name = name
+        self.id = _new_id()
+        self.node = node
+        self.pair = None
+        self.ifb = None
+        self._address = None
+        self.network = None
+        node.interfaces.append(self)
+        _all_interfaces.append(self)
+
+    @property
+    def address(self):
+        return self._address
+
+    @address.setter
+    def address(self, address):
+        self.set_address(address)
+
+    def get_address(self):
+        return self._address
+
+    def set_address(self, address):
+        address = DryAddress(address)
+        _current.step("address", self, address.get_addr())
+        _current.run("ip netns exec " + self.node.id + " ip address add " + address.get_addr() + " dev " + self.id)
+        self._address = address
+
+    def set_attributes(self, bandwidth, delay, qdisc=None, **kwargs):
+        _current.step("attributes", self, bandwidth, delay, qdisc)
+        self._tc("class change dev " + self.id + " parent 1: classid 1:1 htb rate " + bandwidth)
+        self._tc("qdisc change dev " + self.id + " parent 1:1 handle 11: netem delay " + delay)
+        if qdisc is not None:
+            self._set_qdisc(qdisc, bandwidth, **kwargs)
+
+    def set_qdisc(self, qdisc, bandwidth, **kwargs):
+        _current.step("qdisc", self, qdisc, bandwidth)
+        self._set_qdisc(qdisc, bandwidth, **kwargs)
+
+    def _set_qdisc(self, qdisc, bandwidth, **kwargs):
+        if self.ifb is None:
+            self._create_ifb()
+        parameters = "".join(" " + key + " " + str(value) for (key, value) in kwargs.items())
+        self._tc("class change dev " + self.ifb.id + " parent 1: classid 1:1 htb rate " + bandwidth, self.ifb)
+        self._tc("qdisc del dev " + self.ifb.id + " parent 1:1 handle 11:", self.ifb)
+        self._tc("qdisc add dev " + self.ifb.id + " parent 1:1 handle 11: " + qdisc + parameters, self.ifb)
+
+    # The htb 1: --> class 1:1 --> netem 11: structure NeST puts on every interface
+    def _set_structure(self, interface=None, leaf="netem"):
+        interface = interface or self
+        self._tc("qdisc add dev " + interface.id + " root handle 1: htb default 1", interface)
+        self._tc("class add dev " + interface.id + " parent 1: classid 1:1 htb rate " + DEFAULT_BANDWIDTH, interface)
+        self._tc("qdisc add dev " + interface.id + " parent 1:1 handle 11: " + leaf, interface)
+
+    # An IFB the egress of the interface is redirected to, which carries its AQM
+    def _create_ifb(self):
+        self.ifb = DryInterface("ifb-" + self.name, self.node)
+        _current.run("ip link add " + self.ifb.id + " type ifb")
+        _current.run("ip link set " + self.ifb.id + " netns " + self.node.id)
+        _current.run("ip netns exec " + self.node.id + " ip link set dev " + self.ifb.id + " up")
+        self._set_structure(self.ifb, "pfifo")
+        self._tc(
+            "filter add dev " + self.id + " parent 1: protocol all u32 match u32 0 0"
+            " action mirred egress redirect dev " + self.ifb.id
+        )
+
+    def _tc(self, command, interface=None):
+        _current.run("tc -n " + (interface or self).node.id + " " + command)
+
+    def __repr__(self):
+        return "Interface(" + repr(self.name) + ")"
+
+
+## Stand-in for NeST's `connect()`
+def dry_connect(node1, node2, interface1_name="", interface2_name="", network=None):
+    connections = sum(1 for interface in node1.interfaces if interface.pair is not None and interface.pair.node is node2)
+    interface1_name = interface1_name or node1.name + "-" + node2.name + "-" + str(connections)
+    interface2_name = interface2_name or node2.name + "-" + node1.name + "-" + str(connections)
+
+    _current.step("connect", node1, node2)
+    interface1 = DryInterface(interface1_name, node1)
+    interface2 = DryInterface(interface2_name, node2)
+    interface1.pair = interface2
+    interface2.pair = interface1
+
+    _current.run("ip link add " + interface1.id + " type veth peer name " + interface2.id)
+    for interface in (interface1, interface2):
+        _current.run("ip link set " + interface.id + " netns " + interface.node.id)
+    for interface in (interface1, interface2):
+        interface._set_structure()
+    for interface in (interface1, interface2):
+        _current.run("ip netns exec " + interface.node.id + " ip link set dev " + interface.id + " up")
+    for interface in (interface1, interface2):
+        _current.run("ip netns exec " + interface.node.id + " sysctl -w net.ipv6.conf." + interface.id + ".accept_dad=0")
+
+    if network is not None:
+        interface1.network = network
+        interface2.network = network
+    return (interface1, interface2)
+
+
+## Stand-in for NeST's `AddressHelper`: the n-th interface connected under a network gets its n-th host
+class DryAddressHelper:
+
+    @staticmethod
+    def assign_addresses():
+        _current.step("assign_addresses")
+        for interface in _all_interfaces:
+            network = interface.network
+            if network is not None and interface.address is None:
+                interface.set_address(str(next(network.hosts)) + "/" + str(network.network.prefixlen))
+
+
+## Stand-in for NeST's `Flow`
+class DryFlow:
+
+    def __init__(self, source_node, destination_node, destination_address, start_time, stop_time, number_of_streams):
+        self.source_node = source_node
+        self.destination_node = destination_node
+        self.destination_address = DryAddress(destination_address)
+        self.start_time = start_time
+        self.stop_time = stop_time
+        self.number_of_streams = number_of_streams
+        self.options = {}
+
+    def _get_props(self):
+        return [
+            self.source_node.id, self.destination_node.id, self.destination_address, self.start_time,
+            self.stop_time, self.number_of_streams, self.options,
+        ]
+
+
+## Stand-in for NeST's `Experiment`
+class DryExperiment:
+
+    def __init__(self, name):
+        self.name = name
+        self.flows = []
+        self.qdisc_stats = []
+        _current.step("experiment", name)
+
+    def add_flow(self, flow):
+        self.flows.append(flow)
+
+    def add_tcp_flow(self, flow, congestion_algorithm="cubic"):
+        _current.step("tcp_flow", flow.source_node, flow.destination_node, flow.destination_address.get_addr(),
+                      flow.start_time, flow.stop_time, flow.number_of_streams, congestion_algorithm)
+        flow.options = {"protocol": "TCP", "cong_algo": congestion_algorithm}
+        self.flows.append(flow)
+
+    def add_udp_flow(self, flow, target_bandwidth="1mbit"):
+        _current.step("udp_flow", flow.source_node, flow.destination_node, flow.destination_address.get_addr(),
+                      flow.start_time, flow.stop_time, flow.number_of_streams, target_bandwidth)
+        flow.options = {"protocol": "UDP", "target_bw": target_bandwidth}
+        self.flows.append(flow)
+
+    def require_qdisc_stats(self, interface, stats=""):
+        self.qdisc_stats.append({"ns_id": interface.node.id, "int_id": interface.id})
+
+    ## Records the commands of the tools NeST runs for the flows, without waiting for them
+    def run(self):
+        from nest.experiment import run_exp
+
+        _current.step("run", self.name)
+        Pack.init(self.name)
+
+        servers = set()
+        ss_schedules = {}
+        ping_schedules = {}
+        end = 0
+        for flow in self.flows:
+            (src_ns, dst_ns, address, start, stop, streams, options) = flow._get_props()
+            destination = address.get_addr(with_subnet=False)
+            family = "-6" if address.is_ipv6() else "-4"
+            duration = stop - start
+            end = max(end, stop)
+            _widen(ping_schedules, (src_ns, destination), start, stop)
+
+            if options["protocol"] == "TCP":
+                if ("netserver", dst_ns) not in servers:
+                    servers.add(("netserver", dst_ns))
+                    _current.run("ip netns exec " + dst_ns + " netserver")
+                for stream in range(streams):
+                    _current.run(
+                        "ip netns exec " + src_ns + " netperf " + family + " -s " + str(start) + " -H " + destination
+                        + " -t TCP_STREAM -l " + str(duration) + " -D -" + str(SAMPLE_INTERVAL)
+                        + " -- -K " + options["cong_algo"]
+                    )
+                _widen(ss_schedules, (src_ns, destination), start, stop)
+            else:
+                if ("iperf3", dst_ns) not in servers:
+                    servers.add(("iperf3", dst_ns))
+                    _current.run("ip netns exec " + dst_ns + " iperf3 -s -D")
+                _current.run(
+                    "ip netns exec " + src_ns + " iperf3 " + family + " -u -c " + destination + " -b "
+                    + options["target_bw"] + " -t " + str(duration) + " -P " + str(streams) + " -J"
+                )
+
+        # The socket stats are collected by `ss`, unless something (e.g. `tcp_info.py`) replaced its runners
+        runners = run_exp.setup_ss_runners(True, ss_schedules)
+        for runner in runners:
+            if isinstance(runner, str):
+                _current.run(runner)
+            else:
+                _current.step("collector", type(runner).__name__)
+        for stats in self.qdisc_stats:
+            _current.run("ip netns exec " + stats["ns_id"] + " tc -s -j qdisc show dev " + stats["int_id"])
+        for ((src_ns, destination), (start, stop)) in run_exp.setup_ping_runners(True, ping_schedules):
+            _current.run(
+                "ip netns exec " + src_ns + " ping " + destination + " -w " + str(stop - start) + " -D -i "
+                + str(SAMPLE_INTERVAL)
+            )
+
+        run_exp.dump_json_ouputs()
+
+
+# Widens the (start, stop) of `key` in `schedules` to include `start` and `stop`
+def _widen(schedules, key, start, stop):
+    (first, last) = schedules.get(key, (start, stop))
+    schedules[key] = (min(first, start), max(last, stop))
+
+
+# The `ss` commands of the flows from every namespace to every destination
+def _setup_ss_runners(dependency, ss_schedules):
+    return [
+        "ip netns exec " + src_ns + " ss -t -i -m -n dst " + destination
+        for ((src_ns, destination), (start, stop)) in ss_schedules.items()
+    ]
+
+
+def _setup_ping_runners(dependency, ping_schedules):
+    return list(ping_schedules.items())
+
+
+## Stand-in for NeST's `Pack`: the dumps of dry runs are empty directories under `Pack.ROOT`
+class Pack:
+
+    ROOT = None
+    FOLDER = None
+
+    @staticmethod
+    def init(name):
+        Pack.FOLDER = os.path.join(Pack.ROOT, name + "(" + time.strftime("%d-%m-%Y-%H:%M:%S") + ")_dump")
+        os.makedirs(Pack.FOLDER, exist_ok=True)
+
+
+## Stand-in for NeST's `delete_namespaces()`
+def dry_delete_namespaces():
+    _current.step("teardown")
+    for ns_id in list(DryTopologyMap.namespaces):
+        _current.run("ip netns del " + ns_id)
+
+
+## This method puts the stand-ins of NeST in `sys.modules`, and makes the tools of this repository
+## that need the kernel record that they would have run. Dumps go under `dump_root`.
+# It has to be called before anything imports NeST.
+def install(dump_root):
+    global _current
+
+    if "nest" in sys.modules and not getattr(sys.modules["nest"], "DRY_RUN", False):
+        raise RuntimeError("NeST was imported before the dry run was installed")
+    _current = DryRun("")
+    Pack.ROOT = dump_root
+
+    def module(name, **attributes):
+        created = types.ModuleType(name)
+        created.__dict__.update(attributes)
+        created.__path__ = []
+        sys.modules[name] = created
+        return created
+
+    topology = dict(
+        Node=DryNode, Router=DryRouter, Interface=DryInterface, connect=dry_connect, Address=DryAddress,
+        Network=DryNetwork, AddressHelper=DryAddressHelper, TOPOLOGY_ID=TOPOLOGY_ID,
+    )
+    topology["__all__"] = list(topology)
+    nest = module("nest", DRY_RUN=True)
+    nest.topology = module("nest.topology", **topology)
+    nest.topology.address = module("nest.topology.address", Address=DryAddress)
+    nest.topology.interface = module("nest.topology.interface", Interface=DryInterface, connect=dry_connect)
+    nest.topology.address_helper = module("nest.topology.address_helper", AddressHelper=DryAddressHelper)
+    nest.topology_map = module("nest.topology_map", TopologyMap=DryTopologyMap)
+    nest.clean_up = module("nest.clean_up", delete_namespaces=dry_delete_namespaces)
+    nest.experiment = module("nest.experiment", Experiment=DryExperiment, Flow=DryFlow, __all__=["Experiment", "Flow"])
+    nest.experiment.pack = module("nest.experiment.pack", Pack=Pack)
+    nest.experiment.run_exp = module(
+        "nest.experiment.run_exp", setup_ss_runners=_setup_ss_runners, setup_ping_runners=_setup_ping_runners,
+        dump_json_ouputs=lambda: None,
+    )
+    nest.experiment.results = module(
+        "nest.experiment.results", **{name: type(name, (), {"add_result": staticmethod(lambda ns_id, result: None)})
+                                      for name in ("SsResults", "NetperfResults", "Iperf3Results", "PingResults")}
+    )
+
+    import adaptive
+    import batch_build
+    import host_monitor
+    import latency_prober
+    import qdisc_sampler
+    import teardown
+
+    def recorded(operation):
+        def run_recorded(run, *args, **kwargs):
+            _current.step(operation)
+            return run()
+        return run_recorded
+
+    def run_batch(tool, ns, commands):
+        _current.batch(tool + (" -n " + ns if ns is not None else "") + " -batch -", commands)
+
+    def run_monitored(run, capacity, interval=0.5):
+        _current.step("monitor")
+        return (run(), {"host_limited": False, "overloaded": [], "throughput_ratio": None})
+
+    def run_adaptive(experiment, criterion=None):
+        _current.step("adaptive")
+        experiment.run()
+        return {"reason": "dry run", "stop_time": None}
+
+    batch_build.run_batch = run_batch
+    host_monitor.run_monitored = run_monitored
+    qdisc_sampler.run_sampled = recorded("sample_qdiscs")
+    latency_prober.run_probed = recorded("probe_latency")
+    adaptive.run_adaptive = run_adaptive
+    # Dry runs record the teardown of `dry_delete_namespaces()`
+    teardown.parallel_teardown = lambda jobs=teardown.DEFAULT_JOBS: None
+
+
+## This method starts recording the dry run of `name`, and returns its `DryRun`
+def start(name):
+    global _current
+
+    _current = DryRun(name)
+    DryTopologyMap.namespaces = {}
+    DryTopologyMap.counter = 0
+    del _all_interfaces[:]
+    return _current
+
+
+## This method dry-runs the script in `path` with the arguments `argv`, and returns its `DryRun`
+def dry_run_script(path, argv):
+    dry_run = start(os.path.basename(path) + (" " + " ".join(argv) if argv else ""))
+    saved_argv = sys.argv
+    sys.argv = [path] + list(argv)
+    try:
+        runpy.run_path(path, run_name="__main__")
+        dry_run.finish()
+    except SystemExit as error:
+        dry_run.finish(None if error.code in (None, 0) else str(error.code))
+    except Exception as error:
+        dry_run.finish(type(error).__name__ + ": " + str(error))
+    finally:
+        sys.argv = saved_argv
+    return dry_run
+
+
+## This method dry-runs the scenarios of the scenario or batch files in `paths`, and returns their `DryRun`s
+def dry_run_scenarios(paths, overrides):
+    import scenario
+
+    dry_runs = []
+    for path in paths:
+        for (scenario_path, scenario_overrides) in scenario.read_batch(path, overrides):
+            dry_run = start(scenario_path)
+            try:
+                compiled = scenario.compile_scenario(scenario.load_scenario(scenario_path, **scenario_overrides))
+                dry_run.name = compiled.name
+                scenario.execute(compiled)
+                scenario.teardown()
+                dry_run.finish()
+            except Exception as error:
+                dry_run.finish(type(error).__name__ + ": " + str(error))
+            dry_runs.append(dry_run)
+    return dry_runs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record the NeST calls and commands of experiments, without running them")
+    parser.add_argument("--scenario", nargs="+", metavar="FILE", help="dry-run scenario or batch files")
+    parser.add_argument("--set", nargs="+", default=[], metavar="KEY=VALUE", help="override keys of every scenario")
+    parser.add_argument("--commands", action="store_true", help="print every command")
+    parser.add_argument("--output", help="file the plans and commands are written to (JSON)")
+    parser.add_argument("--dump-dir", help="directory the (empty) dumps are kept in, instead of a temporary one")
+    parser.add_argument("script", nargs="?", help="experiment script, e.g. tcp_nup.py")
+    parser.add_argument("args", nargs=argparse.REMAINDER, help="arguments of the script")
+    args = parser.parse_args()
+
+    if (args.script is None) == (args.scenario is None):
+        parser.error("give either a script or --scenario files")
+
+    dump_root = args.dump_dir or tempfile.mkdtemp(prefix="dry-run-")
+    install(dump_root)
+    if args.scenario is not None:
+        import scenario
+
+        dry_runs = dry_run_scenarios(args.scenario, scenario.parse_overrides(args.set))
+    else:
+        dry_runs = [dry_run_script(args.script, args.args)]
+
+    failed = False
+    for dry_run in dry_runs:
+        if args.commands:
+            for (process, command) in dry_run.commands:
+                print("  [" + str(process) + "] " + command)
+        tools = ", ".join(tool + " " + str(count) for (tool, count) in sorted(dry_run.tool_counts().items()))
+        print("%s: %d steps, %d commands (%s), %d processes, %.1f ms%s" % (
+            dry_run.name, len(dry_run.plan), len(dry_run.commands), tools, dry_run.processes,
+            dry_run.elapsed * 1000, "" if dry_run.error is None else ", FAILED: " + dry_run.error,
+        ))
+        failed = failed or dry_run.error is not None
+
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump([dry_run.to_dict() for dry_run in dry_runs], output_file, indent=4)
+    if args.dump_dir is None:
+        shutil.rmtree(dump_root)
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
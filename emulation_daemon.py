@@ -0,0 +1,601 @@
+# SPDX-License-Identifier: GPL-2.0-only
+# Copyright (c) 2019-2022 NITK Surathkal
+
+########################
+# SHOULD BE RUN AS ROOT
+########################
+
+import argparse
+import functools
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+import time
+
+## This program runs a long-lived emulation daemon that experiments are submitted to as scenarios
+## (see `scenario.py`), and a client to submit them.
+#
+# Every `python tcp_8up.py pie` pays for starting the interpreter, importing NeST, building the
+# dumbbell, running, tearing it down and plotting. The daemon pays for the first three once:
+#   - NeST and the experiment modules stay imported,
+#   - the dumbbells stay built between experiments, in a pool of idle dumbbells (optionally built
+#     before the first submission with `--warm`). A dumbbell scenario is given the smallest idle
+#     dumbbell built for at least as many flows (with the same `batched` and `flows_per_host`),
+#     whose bottleneck AQM is replaced and TCP metrics are flushed as in `sweep.py`, and is only
+#     built when none fits. At most `--pool-size` dumbbells are kept, the least recently used
+#     ones being deleted first,
+#   - with `--netns-pool SLOTS`, the dumbbells are built on a `NamespacePool` instead (see
+#     `netns_pool.py`): its namespaces and veth pairs are created once, configured for every
+#     submission and flushed after it, so that one set of them serves any flow count,
+#   - "chain" scenarios are built for every submission, and their namespaces deleted afterwards,
+#   - plotting can be left out with `--no-plots` (the dumps can still be plotted later).
+#
+# Submissions are queued and run one at a time, by priority and then in the order they came in.
+#
+# The API is a Unix socket, with one JSON object per line each way. A client sends one request:
+#   {"op": "submit", "scenario": {...}, "priority": 0}     <-- with its overrides already applied
+#   {"op": "status"}
+#   {"op": "cancel", "id": 3}                             <-- only while the submission is queued
+#   {"op": "shutdown"}
+# and a submission is answered with its events until it is done (or the client hangs up, which
+# leaves it queued):
+#   {"event": "queued", "id": 3, "name": "tcp-up", "position": 1}
+#   {"event": "started", "id": 3}
+#   {"event": "phase", "id": 3, "phase": "build" | "setup" | "run", "warm": true}
+#   {"event": "progress", "id": 3, "elapsed": 12.0, "duration": 200}     <-- every `--progress-interval`
+#   {"event": "done", "id": 3, "results": "<dump>", "summary": {...}, "phases": {...}, "elapsed": 201.3}
+#   {"event": "failed", "id": 3, "error": "..."}
+#
+# Usage:
+#   python emulation_daemon.py serve [--socket PATH] [--warm 12 --warm 4] [--batched] [--flows-per-host K]
+#                                    [--pool-size 2] [--netns-pool SLOTS] [--no-plots] [--tcp-info-interval MS] [--sketches]
+#   python emulation_daemon.py submit scenarios/tcp_up.json [--set aqm=pie flows=4] [--priority 1] [--detach]
+#   python emulation_daemon.py status | cancel ID | shutdown
+
+## Socket the daemon listens on
+DEFAULT_SOCKET = "/run/nest-emulation.sock"
+
+## Seconds between the progress events of a running submission
+PROGRESS_INTERVAL = 5
+
+## Phase of a scenario's steps, as reported in its events
+STEP_PHASES = {
+    "node": "build",
+    "router": "build",
+    "connect": "build",
+    "address": "build",
+    "attributes": "build",
+    "route": "build",
+    "dumbbell": "build",
+    "experiment": "setup",
+    "tcp_flow": "setup",
+    "udp_flow": "setup",
+    "dumbbell_experiment": "setup",
+    "run": "run",
+}
+
+
+## This method returns the seconds the flows of a scenario (with its defaults) run for at most
+def expected_duration(scenario):
+    if scenario["topology"] == "dumbbell":
+        jitter = scenario["jitter"]
+        return scenario["duration"] + (jitter["max"] if jitter else 0)
+    return max(flow["stop"] for flow in scenario["flows"]) + (scenario["jitter"] or {"max": 0})["max"]
+
+
+## A submitted scenario, and the queues of the clients following its events
+class Submission:
+
+    def __init__(self, number, compiled, priority):
+        self.id = number
+        self.compiled = compiled
+        self.priority = priority
+        self.submitted = time.time()
+        self.subscribers = []
+        self.phase = None
+        self.started = None
+        self.state = "queued"
+
+    ## Sends `event` (with the id of the submission) to every client following it
+    def publish(self, event, **fields):
+        message = {"event": event, "id": self.id}
+        message.update(fields)
+        for subscriber in list(self.subscribers):
+            subscriber.put(message)
+
+    def to_dict(self):
+        return {"id": self.id, "name": self.compiled.name, "priority": self.priority, "state": self.state}
+
+
+## The idle dumbbells, least recently used first
+class DumbbellPool:
+
+    def __init__(self, size, warm=(), batched=False, flows_per_host=1):
+        self.size = size
+        self.idle = []
+        self.builds = 0
+        self.reuses = 0
+
+        # Flow counts of the dumbbells built before the first submission, and how they are built
+        self.warm_flows = list(warm)
+        self.batched = batched
+        self.flows_per_host = flows_per_host
+
+    ## Builds the dumbbells of `warm_flows`
+    def warm(self):
+        from tcp_up_down import build_dumbbell
+
+        for flows in self.warm_flows:
+            self.builds += 1
+            self.release(build_dumbbell(flows, "pfifo", self.batched, flows_per_host=self.flows_per_host))
+
+    ## Returns a dumbbell for `flows` flows with `AQM` on its bottleneck, and whether it was already built
+    def acquire(self, flows, AQM, batched, flows_per_host):
+        from tcp_up_down import build_dumbbell, host_streams, reset_tcp_state, set_bottleneck_aqm
+
+        nodes = len(host_streams(flows, flows_per_host))
+        fitting = [
+            dumbbell for dumbbell in self.idle
+            if dumbbell.batched == batched and dumbbell.flows_per_host == flows_per_host
+            and len(dumbbell.left_nodes) >= nodes
+        ]
+        if fitting:
+            dumbbell = min(fitting, key=lambda dumbbell: len(dumbbell.left_nodes))
+            self.idle.remove(dumbbell)
+            set_bottleneck_aqm(dumbbell, AQM)
+            reset_tcp_state(dumbbell)
+            self.reuses += 1
+            return (dumbbell, True)
+
+        self.builds += 1
+        return (build_dumbbell(flows, AQM, batched, flows_per_host=flows_per_host), False)
+
+    ## Gives `dumbbell` back to the pool, deleting the least recently used dumbbells beyond its size
+    def release(self, dumbbell):
+        self.idle.append(dumbbell)
+        while len(self.idle) > self.size:
+            self.discard(self.idle.pop(0))
+
+    ## Deletes the namespaces of `dumbbell`, e.g. after a failed experiment left it in an unknown state
+    def discard(self, dumbbell):
+        from scenario import release_namespaces
+
+        release_namespaces(_namespace_ids(dumbbell))
+
+    ## Returns the ids of the namespaces of the idle dumbbells
+    def namespace_ids(self):
+        ids = []
+        for dumbbell in self.idle:
+            ids += _namespace_ids(dumbbell)
+        return ids
+
+    def to_dict(self):
+        return {
+            "idle": [
+                {
+                    "flows": len(dumbbell.left_nodes) * dumbbell.flows_per_host,
+                    "flows_per_host": dumbbell.flows_per_host,
+                    "batched": dumbbell.batched,
+                }
+                for dumbbell in self.idle
+            ],
+            "size": self.size,
+            "builds": self.builds,
+            "reuses": self.reuses,
+        }
+
+
+# Returns the ids of the namespaces of `dumbbell`
+def _namespace_ids(dumbbell):
+    nodes = [dumbbell.left_router, dumbbell.right_router] + dumbbell.left_nodes + dumbbell.right_nodes
+    return [node.id for node in nodes]
+
+
+## Dumbbells built on (and recycled into) a `NamespacePool` of namespaces and veth pairs, see `netns_pool.py`.
+## Unlike a `DumbbellPool`, one set of slots serves any number of flows.
+class LeasedDumbbells:
+
+    def __init__(self, size):
+        from netns_pool import NamespacePool
+
+        self.pool = NamespacePool(size)
+        self.builds = 0
+
+    ## Creates the slots of the pool
+    def warm(self):
+        self.pool.fill()
+
+    ## Returns a dumbbell on the slots of the pool, and whether they were already there
+    def acquire(self, flows, AQM, batched, flows_per_host):
+        from tcp_up_down import build_dumbbell, host_streams
+
+        warm = len(host_streams(flows, flows_per_host)) <= len(self.pool.left_nodes)
+        self.builds += 1
+        return (build_dumbbell(flows, AQM, flows_per_host=flows_per_host, pool=self.pool), warm)
+
+    def release(self, dumbbell):
+        self.pool.recycle(dumbbell)
+        # A pool whose slots had to be deleted creates them again while the next submissions wait
+        if not self.pool.left_nodes:
+            self.pool.fill(background=True)
+
+    ## Recycling falls back to deleting the slots when they are in an unknown state
+    def discard(self, dumbbell):
+        self.release(dumbbell)
+
+    def namespace_ids(self):
+        self.pool.wait()
+        return self.pool.namespace_ids()
+
+    def to_dict(self):
+        return dict(self.pool.to_dict(), builds=self.builds)
+
+
+## The queue of submissions, and the thread that runs them one at a time
+class EmulationDaemon:
+
+    def __init__(self, pool, progress_interval=PROGRESS_INTERVAL, tcp_info_interval=None):
+        self.pool = pool
+        self.progress_interval = progress_interval
+        # Seconds between the netlink samples of the TCP sockets, None to run `ss` (see `tcp_info.py`)
+        self.tcp_info_interval = tcp_info_interval
+
+        self.queue = []
+        self.current = None
+        self.counter = 0
+        self.done = 0
+        self.stopping = False
+        # When the running submission entered its current phase
+        self._phase_start = None
+        self.condition = threading.Condition()
+
+    ## Queues the (compiled) scenario and returns its submission, with `subscriber` following its events
+    def submit(self, compiled, priority=0, subscriber=None):
+        with self.condition:
+            self.counter += 1
+            submission = Submission(self.counter, compiled, priority)
+            if subscriber is not None:
+                submission.subscribers.append(subscriber)
+
+            # Higher priorities first, in the order they came in otherwise
+            position = len(self.queue)
+            while position > 0 and self.queue[position - 1].priority < priority:
+                position -= 1
+            self.queue.insert(position, submission)
+
+            submission.publish("queued", name=compiled.name, position=position + (self.current is not None))
+            self.condition.notify_all()
+        return submission
+
+    ## Removes a queued submission, and returns whether it was still queued
+    def cancel(self, number):
+        with self.condition:
+            for submission in self.queue:
+                if submission.id == number:
+                    self.queue.remove(submission)
+                    submission.state = "cancelled"
+                    submission.publish("failed", error="cancelled")
+                    return True
+        return False
+
+    def status(self):
+        with self.condition:
+            current = None
+            if self.current is not None:
+                current = self.current.to_dict()
+                current["phase"] = self.current.phase
+                current["elapsed"] = time.time() - self.current.started
+            return {
+                "running": current,
+                "queued": [submission.to_dict() for submission in self.queue],
+                "done": self.done,
+                "pool": self.pool.to_dict(),
+            }
+
+    ## Stops taking submissions; the queued ones are still run
+    def stop(self):
+        with self.condition:
+            self.stopping = True
+            self.condition.notify_all()
+
+    ## Runs the submissions until `stop()` is called and the queue is empty
+    def run(self):
+        self.pool.warm()
+
+        ticker = threading.Thread(target=self._report_progress, daemon=True)
+        ticker.start()
+
+        while True:
+            with self.condition:
+                while not self.queue and not self.stopping:
+                    self.condition.wait()
+                if not self.queue:
+                    return
+                submission = self.current = self.queue.pop(0)
+                submission.state = "running"
+                submission.started = time.time()
+
+            submission.publish("started")
+            try:
+                self._run_submission(submission)
+            except Exception as error:
+                # Whatever failed around the experiment (e.g. deleting its namespaces), the daemon
+                # keeps serving the queue
+                if submission.state == "running":
+                    submission.state = "failed"
+                    submission.publish("failed", error=_describe(error))
+                else:
+                    print("Submission " + str(submission.id) + ": " + _describe(error), file=sys.stderr)
+
+            with self.condition:
+                self.current = None
+                self.done += 1
+
+    def _run_submission(self, submission):
+        from nest.topology_map import TopologyMap
+        from result_cache import summarize_dump
+        from scenario import execute, release_namespaces
+        from tcp_info import collected_run
+
+        compiled = submission.compiled
+        used = []
+        phases = {}
+
+        def dumbbells(flows, AQM, batched, flows_per_host):
+            (dumbbell, warm) = self.pool.acquire(flows, AQM, batched, flows_per_host)
+            used.append(dumbbell)
+            submission.publish("phase", phase="build", warm=warm)
+            return dumbbell
+
+        def on_step(operation):
+            phase = STEP_PHASES.get(operation)
+            if phase is None or phase == submission.phase:
+                return
+            now = time.time()
+            if submission.phase is not None:
+                phases[submission.phase] = phases.get(submission.phase, 0) + now - self._phase_start
+            self._phase_start = now
+            submission.phase = phase
+            # Dumbbells report whether they were reused once they are handed out
+            if operation != "dumbbell":
+                submission.publish("phase", phase=phase)
+
+        before = set(namespace["id"] for namespace in TopologyMap.get_namespaces())
+        try:
+            dump = collected_run(functools.partial(execute, compiled, dumbbells, on_step), self.tcp_info_interval)()
+            phases[submission.phase] = phases.get(submission.phase, 0) + time.time() - self._phase_start
+            # The dumbbells served the experiment whole, whatever becomes of its summary
+            while used:
+                self.pool.release(used[0])
+                used.pop(0)
+            summary = summarize_dump(dump)
+        except Exception as error:
+            submission.state = "failed"
+            for dumbbell in used:
+                self.pool.discard(dumbbell)
+            submission.publish("failed", error=_describe(error))
+        else:
+            submission.state = "done"
+            submission.publish(
+                "done", results=dump, summary=summary, phases=phases, elapsed=time.time() - submission.started,
+            )
+        finally:
+            submission.phase = None
+            # Everything else the scenario built, i.e. its chain
+            pooled = set(self.pool.namespace_ids())
+            built = [
+                namespace["id"] for namespace in TopologyMap.get_namespaces()
+                if namespace["id"] not in before and namespace["id"] not in pooled
+            ]
+            if built:
+                release_namespaces(built)
+
+    # Publishes the progress of the running submission every `progress_interval` seconds
+    def _report_progress(self):
+        while True:
+            time.sleep(self.progress_interval)
+            with self.condition:
+                submission = self.current
+            if submission is not None and submission.phase == "run":
+                submission.publish(
+                    "progress", elapsed=round(time.time() - self._phase_start, 1),
+                    duration=expected_duration(submission.compiled.scenario),
+                )
+
+
+## Serves the requests of one client
+class RequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        import queue
+        from scenario import ScenarioError, compile_scenario
+
+        daemon = self.server.emulation
+        try:
+            request = json.loads(self.rfile.readline())
+            operation = request.get("op")
+        except (ValueError, AttributeError):
+            self._send({"event": "error", "error": "expected one JSON object per line"})
+            return
+
+        if operation == "status":
+            self._send(daemon.status())
+        elif operation == "cancel":
+            self._send({"cancelled": daemon.cancel(request.get("id"))})
+        elif operation == "shutdown":
+            daemon.stop()
+            self._send({"stopping": True})
+            threading.Thread(target=self.server.shutdown).start()
+        elif operation == "submit":
+            try:
+                compiled = compile_scenario(request["scenario"])
+            except (ScenarioError, KeyError, TypeError, ValueError) as error:
+                self._send({"event": "error", "error": str(error)})
+                return
+            if daemon.stopping:
+                self._send({"event": "error", "error": "the daemon is shutting down"})
+                return
+
+            events = queue.Queue()
+            submission = daemon.submit(compiled, request.get("priority", 0), events)
+            try:
+                while True:
+                    event = events.get()
+                    self._send(event)
+                    if event["event"] in ("done", "failed"):
+                        return
+            except OSError:
+                # The client hung up, the submission carries on without it
+                submission.subscribers.remove(events)
+        else:
+            self._send({"event": "error", "error": "unknown op " + repr(operation)})
+
+    def _send(self, message):
+        self.wfile.write((json.dumps(message) + "\n").encode())
+        self.wfile.flush()
+
+
+class DaemonServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+## This method serves `daemon` on the Unix socket `path` until it is shut down
+def serve(daemon, path):
+    if os.path.exists(path):
+        os.unlink(path)
+
+    server = DaemonServer(path, RequestHandler)
+    server.emulation = daemon
+    os.chmod(path, 0o660)
+
+    worker = threading.Thread(target=daemon.run)
+    worker.start()
+    print("Listening on " + path)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        daemon.stop()
+    finally:
+        server.server_close()
+        os.unlink(path)
+    worker.join()
+
+
+## This method sends `request` to the daemon on `path` and returns an iterator over its replies
+def request_daemon(path, request):
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.connect(path)
+    stream = client.makefile("rw")
+    stream.write(json.dumps(request) + "\n")
+    stream.flush()
+    return _replies(client, stream)
+
+
+# Returns the message of a failed submission's `error`
+def _describe(error):
+    return type(error).__name__ + ": " + str(error)
+
+
+def _replies(client, stream):
+    with client, stream:
+        for line in stream:
+            yield json.loads(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run experiments submitted to a long-lived emulation daemon")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET, help="Unix socket of the daemon")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = commands.add_parser("serve", help="run the daemon")
+    serve_parser.add_argument("--warm", type=int, action="append", default=[], metavar="FLOWS",
+                              help="build a dumbbell for FLOWS flows before the first submission")
+    serve_parser.add_argument("--batched", action="store_true", help="build the --warm dumbbells in batches")
+    serve_parser.add_argument("--flows-per-host", type=int, default=1, help="flows per node of the --warm dumbbells")
+    serve_parser.add_argument("--pool-size", type=int, default=2, help="idle dumbbells kept between submissions")
+    serve_parser.add_argument("--netns-pool", type=int, default=0, metavar="SLOTS",
+                              help="build every dumbbell on a pool of SLOTS pairs of nodes (see netns_pool.py)")
+    serve_parser.add_argument("--no-plots", action="store_true", help="do not plot the results of the experiments")
+    serve_parser.add_argument("--progress-interval", type=float, default=PROGRESS_INTERVAL)
+    serve_parser.add_argument("--tcp-info-interval", type=float, default=0,
+                              help="ms between samples of the TCP sockets over netlink (0 to run ss instead)")
+    serve_parser.add_argument("--sketches", action="store_true", help="write the percentile sketches of every flow to the dumps")
+
+    submit_parser = commands.add_parser("submit", help="submit scenario or batch files")
+    submit_parser.add_argument("files", nargs="+")
+    submit_parser.add_argument("--set", nargs="+", default=[], metavar="KEY=VALUE", help="override keys of every scenario")
+    submit_parser.add_argument("--priority", type=int, default=0, help="higher priorities run first")
+    submit_parser.add_argument("--detach", action="store_true", help="return once the scenarios are queued")
+
+    commands.add_parser("status", help="print the queue and the pool of the daemon")
+    cancel_parser = commands.add_parser("cancel", help="cancel a queued submission")
+    cancel_parser.add_argument("id", type=int)
+    commands.add_parser("shutdown", help="stop the daemon once the queued submissions are done")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        from nest import config
+        from sketches import stream_sketches
+        from teardown import parallel_teardown
+
+        parallel_teardown()
+        if args.no_plots:
+            config.set_value("plot_results", False)
+        if args.sketches:
+            stream_sketches()
+
+        if args.netns_pool:
+            pool = LeasedDumbbells(args.netns_pool)
+        else:
+            pool = DumbbellPool(args.pool_size, args.warm, args.batched, args.flows_per_host)
+        daemon = EmulationDaemon(pool, args.progress_interval, args.tcp_info_interval / 1000 or None)
+        serve(daemon, args.socket)
+        return
+
+    try:
+        if args.command == "submit":
+            submit(args)
+        elif args.command == "cancel":
+            for reply in request_daemon(args.socket, {"op": "cancel", "id": args.id}):
+                print(json.dumps(reply))
+        else:
+            for reply in request_daemon(args.socket, {"op": args.command}):
+                print(json.dumps(reply, indent=4))
+    except OSError as error:
+        sys.exit(args.socket + ": " + str(error))
+
+
+# Submits every scenario of the files (read here, so that their paths are the client's) and
+# prints their events, each submission on its own connection so that they are queued together
+def submit(args):
+    from scenario import ScenarioError, load_scenario, parse_overrides, read_batch
+
+    overrides = parse_overrides(args.set)
+    scenarios = []
+    for path in args.files:
+        try:
+            for (scenario_path, scenario_overrides) in read_batch(path, overrides):
+                scenarios.append(load_scenario(scenario_path, **scenario_overrides))
+        except (ScenarioError, OSError, ValueError) as error:
+            sys.exit(path + ": " + str(error))
+
+    streams = [
+        request_daemon(args.socket, {"op": "submit", "scenario": scenario, "priority": args.priority})
+        for scenario in scenarios
+    ]
+    failed = False
+    for stream in streams:
+        for event in stream:
+            print(json.dumps(event))
+            failed = failed or event["event"] in ("failed", "error")
+            if args.detach and event["event"] == "queued":
+                break
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
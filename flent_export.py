@@ -0,0 +1,262 @@
+# SPDX-License-Identifier: GPL-2.0-only
+# Copyright (c) 2019-2022 NITK Surathkal
+
+# This program converts the dumps of experiments (the `<name>(<timestamp>)_dump` directories
+# written by `Experiment.run()`) into flent's data format: gzipped JSON files that
+# `flent --plot` and flent's GUI open like the results of flent's own tests.
+#
+# The experiments keep their names as flent test names (`tcp-bidirectional` becomes
+# `tcp_bidirectional`), and their flows become the series flent names for those tests:
+#
+#   "TCP upload", "TCP download"              netperf flows, with "::1", "::2", ... and the
+#                                             "sum" and "avg" series when there are several
+#   "UDP upload", "UDP download"              iperf3 flows, likewise
+#   "Ping (ms) ICMP"                          ping flows, likewise (without "sum")
+#
+# A flow is an upload if it starts from one of the `--clients` namespaces (the left side of
+# the dumbbell and `h1` of the chain scenarios by default), and a download otherwise.
+# Every series is resampled every `--step` seconds (flent's "results"), and its samples are
+# kept as they were measured (flent's "raw_values").
+#
+# The dump is streamed, one flow at a time (see `json_stream.py`): a first pass over the tools'
+# JSON files finds the flows and the time span of the run, and a second one reads the samples of
+# every flow, resamples them and writes the series to disk right away, with the raw values
+# spooled to a temporary file until the resampled ones are all written. Only one flow's samples
+# and the "sum" of every group are held, so memory does not grow with the number of flows or
+# the length of the run, which matters for runs of 1,000 flows.
+#
+# Usage:
+#   python flent_export.py <dump> [<dump> ...] [--output flent] [--name tcp_4up] [--step 0.2]
+#                          [--clients left-* h1]
+
+import argparse
+import datetime
+import fnmatch
+import gzip
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+
+from json_stream import flows
+
+## Version of flent's data format that is written
+DATA_VERSION = 4
+
+## Namespaces flows are uploads from, by default
+DEFAULT_CLIENTS = ["left-*", "h1"]
+
+## Tools exported, with the protocol and units of their series
+TOOLS = [
+    ("netperf", "sending_rate", "TCP", "Mbits/s"),
+    ("iperf3", "sending_rate", "UDP", "Mbits/s"),
+    ("ping", "rtt", None, "ms"),
+]
+
+
+## This method returns the flent test name of the experiment in `dump`
+def test_name(dump):
+    name = os.path.basename(os.path.normpath(dump))
+    if "(" in name:
+        name = name[: name.index("(")]
+    return name.replace("-", "_")
+
+
+## This method returns whether `ns_name` is one of the `clients` namespaces (shell patterns)
+def is_client(ns_name, clients):
+    return any(fnmatch.fnmatchcase(ns_name, pattern) for pattern in clients)
+
+
+## This method returns the flent series name of every group of flows of a tool, from the
+## names of its flows, as a list of (series name, flow indices)
+def series_groups(names, protocol, clients):
+    groups = {}
+    for (i, name) in enumerate(names):
+        source = name.split(" -> ", 1)[0]
+        if protocol is None:
+            base = "Ping (ms) ICMP"
+        else:
+            base = protocol + (" upload" if is_client(source, clients) else " download")
+        groups.setdefault(base, []).append(i)
+    return sorted(groups.items())
+
+
+## Writes a flent data file one series at a time
+class FlentWriter:
+
+    def __init__(self, path, x_values):
+        self.path = path
+        self.output = gzip.open(path, "wt")
+        # The raw values are written after all the resampled ones
+        self.raw = tempfile.TemporaryFile("w+t")
+        self.count = 0
+        self.series_meta = {}
+
+        self.output.write('{"version": ' + str(DATA_VERSION) + ', "x_values": ' + json.dumps(x_values))
+        self.output.write(', "results": {')
+
+    ## Writes one series: its values resampled on the x values (NaN where it has none),
+    ## and its raw samples as (times, values)
+    def add(self, name, values, raw=None, units=None):
+        separator = ", " if self.count else ""
+        resampled = [None if np.isnan(value) else round(float(value), 6) for value in values]
+        self.output.write(separator + json.dumps(name) + ": " + json.dumps(resampled))
+
+        if raw is not None:
+            (times, raw_values) = raw
+            samples = [{"t": float(t), "val": float(value)} for (t, value) in zip(times, raw_values)]
+            self.raw.write(separator + json.dumps(name) + ": " + json.dumps(samples))
+
+        present = values[~np.isnan(values)]
+        self.series_meta[name] = {"UNITS": units, "MEAN_VALUE": float(present.mean()) if len(present) else None}
+        self.count += 1
+
+    ## Writes the raw values and the metadata, and closes the file
+    def close(self, metadata):
+        self.output.write('}, "raw_values": {')
+        self.raw.seek(0)
+        shutil.copyfileobj(self.raw, self.output)
+        self.raw.close()
+
+        metadata = dict(metadata, SERIES_META=self.series_meta)
+        self.output.write('}, "metadata": ' + json.dumps(metadata) + "}")
+        self.output.close()
+
+
+# Returns the values of one flow resampled on `grid` (seconds since `t0`), NaN outside its samples
+def _resample(times, values, grid, t0):
+    valid = ~np.isnan(values)
+    (times, values) = (times[valid] - t0, values[valid])
+    resampled = np.full(len(grid), np.nan)
+    if len(times):
+        order = np.argsort(times, kind="stable")
+        (times, values) = (times[order], values[order])
+        inside = (grid >= times[0]) & (grid <= times[-1])
+        resampled[inside] = np.interp(grid[inside], times, values)
+    return resampled
+
+
+# Returns `value` as a float, NaN if it is missing or not a number
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+# Yields the (name, times, values) of every flow of `tool` in `dump` with samples, as NumPy arrays,
+# reading one flow at a time
+def _flow_samples(dump, tool, field):
+    path = os.path.join(dump, tool + ".json")
+    if not os.path.isfile(path):
+        return
+
+    with open(path) as stats_file:
+        for ((ns_name, _, destination), samples) in flows(stats_file, 4):
+            # NeST's "meta" items have no timestamp
+            rows = [
+                (_number(sample["timestamp"]), _number(sample.get(field))) for sample in samples if "timestamp" in sample
+            ]
+            if rows:
+                rows = np.array(rows, dtype=np.float64)
+                yield (ns_name + " -> " + destination, rows[:, 0], rows[:, 1])
+
+
+## This method converts the dump in `dump` into a flent data file in `output`, and returns its path
+def export_dump(dump, output, name=None, clients=None, step=0.2):
+    name = name or test_name(dump)
+    clients = DEFAULT_CLIENTS if clients is None else clients
+
+    # First pass: the flows of every tool, and when the run starts and ends
+    found = []
+    (t0, end) = (np.inf, -np.inf)
+    for (tool, field, protocol, units) in TOOLS:
+        names = []
+        for (flow, times, values) in _flow_samples(dump, tool, field):
+            names.append(flow)
+            if not np.isnan(times).all():
+                (t0, end) = (min(t0, float(np.nanmin(times))), max(end, float(np.nanmax(times))))
+        if names:
+            found.append((tool, field, protocol, units, names))
+    if not found or t0 > end:
+        raise ValueError(dump + ": no netperf, iperf3 or ping samples")
+
+    grid = np.arange(0, end - t0 + step / 2, step)
+
+    start = datetime.datetime.fromtimestamp(t0, datetime.timezone.utc).replace(tzinfo=None)
+    filename = name + "-" + start.strftime("%Y-%m-%dT%H%M%S.%f") + ".flent.gz"
+    os.makedirs(output, exist_ok=True)
+    writer = FlentWriter(os.path.join(output, filename), [round(float(x), 6) for x in grid])
+
+    # Second pass: every flow is resampled and written as it is read, and added to its group's totals
+    hosts = set()
+    for (tool, field, protocol, units, names) in found:
+        groups = series_groups(names, protocol, clients)
+        # The group of every flow, its series name and the totals of the group
+        series_names = {}
+        totals = {base: (np.zeros(len(grid)), np.zeros(len(grid))) for (base, indices) in groups}
+        for (base, indices) in groups:
+            for (k, i) in enumerate(indices):
+                series_names[i] = (base, base if len(indices) == 1 else base + "::" + str(k + 1))
+
+        for (i, (flow, times, values)) in enumerate(_flow_samples(dump, tool, field)):
+            hosts.add(flow.split(" -> ", 1)[1].rsplit(":", 1)[0])
+            resampled = _resample(times, values, grid, t0)
+
+            valid = ~np.isnan(values)
+            (base, series_name) = series_names[i]
+            writer.add(series_name, resampled, (times[valid], values[valid]), units)
+
+            (total, present) = totals[base]
+            total += np.nan_to_num(resampled)
+            present += ~np.isnan(resampled)
+
+        for (base, indices) in groups:
+            if len(indices) > 1:
+                (total, present) = totals[base]
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    total = np.where(present > 0, total, np.nan)
+                    average = total / present
+                # Summing RTTs means nothing
+                if protocol is not None:
+                    writer.add(base + " sum", total, units=units)
+                writer.add(base + " avg", average, units=units)
+
+    writer.close({
+        "NAME": name,
+        "TITLE": "",
+        "NOTE": "Exported from " + os.path.basename(os.path.normpath(dump)),
+        "TIME": start.isoformat(),
+        "T0": start.isoformat(),
+        "LENGTH": round(float(grid[-1]), 6),
+        "TOTAL_LENGTH": round(float(grid[-1]), 6),
+        "STEP_SIZE": step,
+        "DATA_FILENAME": filename,
+        "HOSTS": sorted(hosts),
+        "IP_VERSION": 4,
+    })
+    return writer.path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert experiment dumps into flent data files")
+    parser.add_argument("dumps", nargs="+", help="dump directories written by Experiment.run()")
+    parser.add_argument("--output", default="flent", help="directory the .flent.gz files are written to")
+    parser.add_argument("--name", help="flent test name (the experiment's name by default)")
+    parser.add_argument("--step", type=float, default=0.2, help="seconds between the resampled values")
+    parser.add_argument("--clients", nargs="+", default=DEFAULT_CLIENTS, help="namespaces uploads start from")
+    args = parser.parse_args()
+
+    for dump in args.dumps:
+        try:
+            path = export_dump(dump, args.output, args.name, args.clients, args.step)
+        except ValueError as error:
+            sys.exit(str(error))
+        print(dump + ": " + path)
+
+
+if __name__ == "__main__":
+    main()
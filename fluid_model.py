@@ -0,0 +1,549 @@
+# SPDX-License-Identifier: GPL-2.0-only
+# Copyright (c) 2019-2022 NITK Surathkal
+
+import argparse
+import itertools
+import json
+import math
+import random
+import sys
+
+import numpy as np
+
+from host_monitor import parse_rate
+from scenario import (
+    DUMBBELL_ACCESS,
+    DUMBBELL_BOTTLENECK,
+    ScenarioError,
+    load_scenario,
+    parse_overrides,
+    read_batch,
+    start_delays,
+    validate,
+    with_defaults,
+)
+from summary import jain_index
+
+## This program contains a fluid model of the scenarios of `scenario.py`, which previews their
+## results in seconds, without root, namespaces or 200 seconds of wall clock.
+#
+# Every TCP flow is a congestion window (in packets) sending `cwnd / RTT` packets per second into
+# the queue of the bottleneck it crosses. Every `dt` seconds, the bottleneck serves its rate's
+# worth of packets from the queue, the packets served clock the growth of the windows (slow
+# start, Reno or CUBIC), and the queue's AQM decides which flows lose packets. A flow reacts to
+# at most one loss per RTT, as with SACK recovery. UDP flows send at their target rate.
+#
+# The AQMs modelled are:
+#   pfifo      one FIFO of 1000 packets (also the default when a scenario has no AQM), tail drop
+#   codel      CoDel (target 5 ms, interval 100 ms) on one FIFO
+#   fq_codel   a queue and a CoDel per flow, served max-min fairly (what DRR converges to)
+#   pie        PIE (target 15 ms, updated every 15 ms) on one FIFO
+#
+# Reno and CUBIC are modelled; the other congestion controls (westwood, cdg, ledbat, lp, ...)
+# are run as Reno and listed as "approximated" in the preview.
+#
+# The preview has, for every flow, its goodput and its share of its bottleneck, and for every
+# bottleneck, its utilization, the percentiles of its queueing delay and its drops, and how long
+# the flows took to converge to a fair share after every change in the set of flows crossing it:
+# until Jain's index of their goodputs over 1 s windows, averaged over the last
+# `FAIRNESS_WINDOWS` windows, stays above `CONVERGED_FAIRNESS` for `CONVERGED_HOLD` seconds, and
+# then does not fall below `DIVERGED_FAIRNESS` again.
+#
+# This is a model: it is meant to prune sweep grids and to tell which points are worth the
+# emulation time, not to replace the experiments. ACKs, the access links and the kernel's
+# timers are not modelled.
+#
+# Usage:
+#   python fluid_model.py scenarios/tcp_up.json --set aqm=fq_codel flows=8 [--dt 0.002] [--output preview.json]
+#   python fluid_model.py scenarios/tcp_up.json --grid aqm=pfifo,fq_codel flows=1,4,16 cc=reno,cubic
+
+## Bytes of the packets on the wire, and of their payload
+PACKET_SIZE = 1500
+MSS = 1448
+
+## Parameters of the AQMs, as Linux's defaults
+AQM_PARAMETERS = {
+    "pfifo": {"limit": 1000},
+    "codel": {"limit": 1000, "target": 0.005, "interval": 0.1},
+    "fq_codel": {"limit": 10240, "target": 0.005, "interval": 0.1},
+    "pie": {"limit": 1000, "target": 0.015, "tupdate": 0.015, "alpha": 0.125, "beta": 1.25},
+}
+
+## Congestion controls modelled, and the multiplicative decrease of their window on a loss
+CONGESTION_CONTROLS = {"reno": 0.5, "cubic": 0.7}
+
+## CUBIC's scaling constant (packets / s^3)
+CUBIC_C = 0.4
+
+## Initial congestion window and slow start threshold (packets)
+INITIAL_WINDOW = 10
+INITIAL_SSTHRESH = 1e9
+
+## Seconds between two samples of the goodputs and the queues, and seconds of the windows
+## the goodputs are averaged over to judge convergence
+SAMPLE_INTERVAL = 0.01
+WINDOW = 1.0
+
+## Jain's index of the goodputs of the flows, averaged over the last `FAIRNESS_WINDOWS` windows,
+## that the flows have converged at once it stays above it for `CONVERGED_HOLD` seconds (or until
+## the set of flows changes), and that they have diverged again at once it falls below
+CONVERGED_FAIRNESS = 0.95
+DIVERGED_FAIRNESS = 0.9
+FAIRNESS_WINDOWS = 5
+CONVERGED_HOLD = 5.0
+
+## Percentiles of the queueing delay
+DELAY_PERCENTILES = [50, 95, 99]
+
+
+## This method returns a `tc` time such as "10ms" in seconds
+def parse_delay(delay):
+    delay = delay.strip().lower()
+    for (unit, scale) in (("us", 1e-6), ("ms", 1e-3), ("s", 1.0)):
+        if delay.endswith(unit):
+            return float(delay[: -len(unit)]) * scale
+    return float(delay) * 1e-6
+
+
+## A flow of the model (one stream of a scenario's flow)
+class ModelFlow:
+
+    def __init__(self, name, protocol, start, stop, base_rtt, cc=None, rate=None):
+        self.name = name
+        self.protocol = protocol
+        self.start = start
+        self.stop = stop
+        self.base_rtt = base_rtt
+        self.cc = cc
+        # Sending rate of a UDP flow (packets/s)
+        self.rate = rate
+
+
+## The queue of one direction of the bottleneck and the flows crossing it
+class Bottleneck:
+
+    def __init__(self, name, bandwidth, aqm, flows):
+        if aqm is None:
+            aqm = "pfifo"
+        if aqm not in AQM_PARAMETERS:
+            raise ScenarioError("the fluid model has no '" + aqm + "' AQM (only " + ", ".join(sorted(AQM_PARAMETERS)) + ")")
+
+        self.name = name
+        self.aqm = aqm
+        self.parameters = AQM_PARAMETERS[aqm]
+        # Packets per second
+        self.capacity = parse_rate(bandwidth) * 1e6 / (PACKET_SIZE * 8)
+        self.flows = flows
+
+
+## This method returns the (bottlenecks, flows) of `scenario` (with its defaults filled in)
+def model_scenario(scenario):
+    flows = []
+
+    if scenario["topology"] == "dumbbell":
+        base_rtt = 2 * (2 * parse_delay(DUMBBELL_ACCESS["delay"]) + parse_delay(DUMBBELL_BOTTLENECK["delay"]))
+        # As `host_streams()`, one start time for every pair of nodes
+        streams = [
+            min(scenario["flows_per_host"], scenario["flows"] - first)
+            for first in range(0, scenario["flows"], scenario["flows_per_host"])
+        ]
+        start_times = start_delays(scenario["jitter"], len(streams))
+        (left, right) = ("left-node-", "right-node-") if scenario["direction"] == "up" else ("right-node-", "left-node-")
+        for (i, (count, start)) in enumerate(zip(streams, start_times)):
+            for stream in range(count):
+                name = left + str(i) + " -> " + right + str(i) + (" #" + str(stream) if count > 1 else "")
+                flows.append(ModelFlow(name, "tcp", start, start + scenario["duration"], base_rtt, scenario["cc"]))
+        direction = "left-router -> right-router" if scenario["direction"] == "up" else "right-router -> left-router"
+        return ([Bottleneck(direction, DUMBBELL_BOTTLENECK["bandwidth"], scenario["aqm"], flows)], flows)
+
+    access = parse_delay(scenario["access"]["delay"])
+    base_rtt = 2 * (2 * access + parse_delay(scenario["bottleneck"]["delay"]))
+    delays = start_delays(scenario["jitter"], len(scenario["flows"]))
+    by_source = {"h1": [], "h2": []}
+    for (i, (flow, delay)) in enumerate(zip(scenario["flows"], delays)):
+        for stream in range(flow["streams"]):
+            name = str(i) + ": " + flow["src"] + " -> " + flow["dst"] + (" #" + str(stream) if flow["streams"] > 1 else "")
+            start = flow["start"] + delay
+            stop = flow["stop"] + delay
+            if flow["protocol"] == "tcp":
+                model_flow = ModelFlow(name, "tcp", start, stop, base_rtt, flow["cc"])
+            else:
+                rate = parse_rate(flow["target_bandwidth"]) * 1e6 / (PACKET_SIZE * 8)
+                model_flow = ModelFlow(name, "udp", start, stop, base_rtt, rate=rate)
+            flows.append(model_flow)
+            by_source[flow["src"]].append(model_flow)
+
+    bottlenecks = []
+    if by_source["h1"]:
+        bottlenecks.append(Bottleneck("r1 -> r2", scenario["bottleneck"]["bandwidth"], scenario["aqm"], by_source["h1"]))
+    if by_source["h2"]:
+        bottlenecks.append(
+            Bottleneck("r2 -> r1", scenario["bottleneck"]["bandwidth"], scenario["reverse_aqm"], by_source["h2"])
+        )
+    return (bottlenecks, flows)
+
+
+# The state of one bottleneck and its flows while the model runs, one array element per flow
+class _BottleneckState:
+
+    def __init__(self, bottleneck, dt, generator):
+        flows = bottleneck.flows
+        n = len(flows)
+        self.bottleneck = bottleneck
+        self.dt = dt
+        self.generator = generator
+        self.served_per_step = bottleneck.capacity * dt
+
+        self.start = np.array([flow.start for flow in flows], dtype=float)
+        self.stop = np.array([flow.stop for flow in flows], dtype=float)
+        self.base_rtt = np.array([flow.base_rtt for flow in flows], dtype=float)
+        self.tcp = np.array([flow.protocol == "tcp" for flow in flows])
+        self.udp_rate = np.array([flow.rate or 0.0 for flow in flows], dtype=float)
+        self.cubic = np.array([flow.cc == "cubic" for flow in flows])
+        self.beta = np.array([CONGESTION_CONTROLS.get(flow.cc, 0.5) for flow in flows], dtype=float)
+
+        self.cwnd = np.full(n, float(INITIAL_WINDOW))
+        self.ssthresh = np.full(n, INITIAL_SSTHRESH)
+        self.w_max = np.zeros(n)
+        self.epoch = np.zeros(n)
+        self.recovery_until = np.zeros(n)
+
+        # Packets queued, served and dropped
+        self.queue = np.zeros(n)
+        self.delivered = np.zeros(n)
+        self.drops = np.zeros(n)
+        self.queue_delay = np.zeros(n)
+
+        # CoDel state, per flow for fq_codel and in element 0 otherwise
+        size = n if bottleneck.aqm == "fq_codel" else 1
+        self.first_above = np.zeros(size)
+        self.dropping = np.zeros(size, dtype=bool)
+        self.count = np.zeros(size)
+        self.drop_next = np.zeros(size)
+
+        # PIE state
+        self.probability = 0.0
+        self.old_delay = 0.0
+        self.next_update = 0.0
+
+        # Samples of the delivered packets of every flow and of the queueing delay
+        self.delivered_samples = []
+        self.delay_samples = []
+
+    def step(self, t):
+        dt = self.dt
+        active = (self.start <= t) & (t < self.stop)
+
+        rtt = self.base_rtt + self.queue_delay
+        rate = np.where(self.tcp, self.cwnd / rtt, self.udp_rate)
+        arrivals = np.where(active, rate * dt, 0.0)
+
+        # Service: a FIFO serves the flows in proportion to their backlog, fq_codel max-min fairly
+        demand = self.queue + arrivals
+        if self.bottleneck.aqm == "fq_codel":
+            served = _max_min_fair(demand, self.served_per_step)
+        else:
+            total = demand.sum()
+            served = demand * (min(1.0, self.served_per_step / total) if total > 0 else 0.0)
+        self.queue = demand - served
+        self.delivered += served
+
+        losses = self._drop(t, arrivals)
+        self._react(t, active, served, losses, rtt)
+
+    # Applies the AQM to the queues, and returns whether every flow lost a packet
+    def _drop(self, t, arrivals):
+        aqm = self.bottleneck.aqm
+        parameters = self.bottleneck.parameters
+        capacity = self.bottleneck.capacity
+        drops = np.zeros(len(self.queue))
+
+        if aqm == "fq_codel":
+            backlogged = max(1, int(np.count_nonzero(self.queue > 0.5)))
+            self.queue_delay = self.queue * backlogged / capacity
+            drops += self._codel(t, self.queue_delay, self.queue)
+        else:
+            total = self.queue.sum()
+            self.queue_delay = np.full(len(self.queue), total / capacity)
+            if aqm == "codel":
+                if self._codel(t, self.queue_delay[:1], np.array([total]))[0]:
+                    drops[self._pick(self.queue)] += 1
+            elif aqm == "pie":
+                drops += self._pie(t, total / capacity, arrivals)
+
+        # Tail drops once the queue is full, from the packets that just arrived
+        excess = self.queue.sum() - parameters["limit"]
+        if excess > 0 and arrivals.sum() > 0:
+            drops += excess * arrivals / arrivals.sum()
+
+        drops = np.minimum(drops, self.queue)
+        self.queue -= drops
+        self.drops += drops
+        return drops > 1e-9
+
+    # Runs CoDel on queues of `delay` seconds and `backlog` packets, and returns the packets dropped
+    def _codel(self, t, delay, backlog):
+        target = self.bottleneck.parameters["target"]
+        interval = self.bottleneck.parameters["interval"]
+
+        # CoDel does not drop from a queue of less than one packet
+        above = (delay > target) & (backlog > 1)
+        if not above.any() and not self.dropping.any():
+            self.first_above[:] = 0.0
+            return np.zeros(len(delay))
+        self.first_above[~above] = 0.0
+        starting = above & (self.first_above == 0)
+        self.first_above[starting] = t + interval
+        ok_to_drop = above & (self.first_above > 0) & (t >= self.first_above)
+
+        self.dropping &= ok_to_drop
+        dropped = np.zeros(len(delay))
+
+        # In the dropping state, drops come closer and closer together
+        due = self.dropping & (t >= self.drop_next)
+        self.count[due] += 1
+        self.drop_next[due] += interval / np.sqrt(self.count[due])
+        dropped[due] = 1
+
+        # Entering the dropping state, with the drop rate it left it with if that was recent
+        entering = ~self.dropping & ok_to_drop
+        recent = entering & (t - self.drop_next < 16 * interval) & (self.count > 2)
+        self.count[entering] = np.where(recent[entering], self.count[entering] - 2, 1)
+        self.drop_next[entering] = t + interval / np.sqrt(self.count[entering])
+        self.dropping |= entering
+        dropped[entering] = 1
+        return dropped
+
+    # Runs PIE on a FIFO of `delay` seconds, and returns the packets dropped from every flow
+    def _pie(self, t, delay, arrivals):
+        parameters = self.bottleneck.parameters
+        if t >= self.next_update:
+            self.probability += parameters["alpha"] * (delay - parameters["target"]) + parameters["beta"] * (
+                delay - self.old_delay
+            )
+            self.probability = min(max(self.probability, 0.0), 1.0)
+            self.old_delay = delay
+            self.next_update = t + parameters["tupdate"]
+
+        drops = np.zeros(len(arrivals))
+        if self.probability > 0:
+            for i in np.flatnonzero(arrivals):
+                # Every flow loses at least one of its packets with probability 1 - (1 - p)^arrivals
+                if self.generator.random() < 1 - (1 - self.probability) ** arrivals[i]:
+                    drops[i] = max(1.0, self.probability * arrivals[i])
+        return drops
+
+    # Returns the flow a packet dropped from the head of a FIFO belongs to
+    def _pick(self, weights):
+        total = weights.sum()
+        point = self.generator.random() * total
+        return min(int(np.searchsorted(np.cumsum(weights), point)), len(weights) - 1)
+
+    # Grows the windows of the TCP flows with the packets served, and reduces those that lost packets
+    def _react(self, t, active, served, losses, rtt):
+        tcp = self.tcp & active
+
+        # One reduction per RTT at most, as SACK recovery
+        reducing = tcp & losses & (t >= self.recovery_until)
+        if reducing.any():
+            cwnd = self.cwnd[reducing]
+            # CUBIC's fast convergence: give up more bandwidth when the window keeps shrinking
+            self.w_max[reducing] = np.where(
+                self.cubic[reducing] & (cwnd < self.w_max[reducing]), cwnd * (1 + self.beta[reducing]) / 2, cwnd
+            )
+            self.cwnd[reducing] = np.maximum(cwnd * self.beta[reducing], 2.0)
+            self.ssthresh[reducing] = self.cwnd[reducing]
+            self.epoch[reducing] = t
+            self.recovery_until[reducing] = t + rtt[reducing]
+
+        growing = tcp & ~reducing & (t >= self.recovery_until)
+        if not growing.any():
+            return
+        cwnd = self.cwnd
+
+        # CUBIC's window follows W(t) = C (t - K)^3 + W_max from its last reduction, but does
+        # not fall below the window Reno would have
+        elapsed = t - self.epoch
+        k = np.cbrt(self.w_max * (1 - CONGESTION_CONTROLS["cubic"]) / CUBIC_C)
+        target = CUBIC_C * (elapsed - k) ** 3 + self.w_max
+        target = np.maximum(target, self.w_max * CONGESTION_CONTROLS["cubic"] + 3 * 0.3 / 1.7 * elapsed / rtt)
+        cubic_growth = np.where(target > cwnd, (target - cwnd) / cwnd, 0.01 / cwnd)
+
+        # Slow start grows the window by the packets served, congestion avoidance by 1 per window
+        growth = np.where(cwnd < self.ssthresh, 1.0, np.where(self.cubic, cubic_growth, 1 / cwnd))
+        self.cwnd = np.where(growing, cwnd + served * growth, cwnd)
+
+    def sample(self):
+        self.delivered_samples.append(self.delivered.copy())
+        self.delay_samples.append(float((self.queue * self.queue_delay).sum() / self.queue.sum()) if self.queue.sum() > 0.5 else 0.0)
+
+
+# Returns the max-min fair share of `capacity` among `demands`
+def _max_min_fair(demands, capacity):
+    if demands.sum() <= capacity:
+        return demands.copy()
+
+    order = np.sort(demands)
+    remaining = capacity - np.concatenate(([0.0], np.cumsum(order)[:-1]))
+    levels = remaining / (len(order) - np.arange(len(order)))
+    level = levels[np.argmax(order >= levels)]
+    return np.minimum(demands, level)
+
+
+## This method runs the fluid model of `scenario` with steps of `dt` seconds, and returns its preview
+# `seed` seeds the choice of the flows CoDel and PIE drop from, so previews are reproducible.
+def predict(scenario, dt=0.002, seed=0):
+    scenario = with_defaults(scenario)
+    validate(scenario)
+
+    (bottlenecks, flows) = model_scenario(scenario)
+    generator = random.Random(seed)
+    states = [_BottleneckState(bottleneck, dt, generator) for bottleneck in bottlenecks]
+
+    end = max(flow.stop for flow in flows)
+    steps = int(math.ceil(end / dt))
+    sample_every = max(1, int(round(SAMPLE_INTERVAL / dt)))
+    for step in range(steps):
+        t = step * dt
+        for state in states:
+            state.step(t)
+        if step % sample_every == 0:
+            for state in states:
+                state.sample()
+
+    preview = {"scenario": scenario["name"], "dt": dt, "duration": end, "flows": {}, "bottlenecks": {}}
+    approximated = sorted(set(flow.cc for flow in flows if flow.protocol == "tcp" and flow.cc not in CONGESTION_CONTROLS))
+    if approximated:
+        preview["approximated"] = approximated
+
+    for state in states:
+        preview["bottlenecks"][state.bottleneck.name] = _bottleneck_preview(state, sample_every * dt, preview["flows"])
+    return preview
+
+
+# Returns the preview of one bottleneck, and adds the previews of its flows to `flow_previews`
+def _bottleneck_preview(state, interval, flow_previews):
+    bottleneck = state.bottleneck
+    to_mbps = MSS * 8 / 1e6
+
+    goodputs = []
+    for (i, flow) in enumerate(bottleneck.flows):
+        goodput = state.delivered[i] * to_mbps / (flow.stop - flow.start)
+        goodputs.append(goodput)
+        flow_previews[flow.name] = {
+            "protocol": flow.protocol, "cc": flow.cc, "start": flow.start, "stop": flow.stop,
+            "goodput": goodput, "drops": float(state.drops[i]),
+        }
+    busy = max(flow.stop for flow in bottleneck.flows) - min(flow.start for flow in bottleneck.flows)
+    for (i, flow) in enumerate(bottleneck.flows):
+        flow_previews[flow.name]["share"] = float(state.delivered[i] / state.delivered.sum()) if state.delivered.sum() else None
+
+    delays = np.array(state.delay_samples) * 1000
+    return {
+        "aqm": bottleneck.aqm,
+        "utilization": float(state.delivered.sum() / (bottleneck.capacity * busy)),
+        "queue_delay": {"p%g" % q: float(np.percentile(delays, q)) for q in DELAY_PERCENTILES},
+        "drops": float(state.drops.sum()),
+        "fairness": jain_index(np.array(goodputs)) if len(goodputs) > 1 else None,
+        "convergence": _convergence(state, interval),
+    }
+
+
+# Returns the seconds the flows of a bottleneck took to converge after every change in the set
+# of flows crossing it (None if they did not), as [{"at": time of the change, "after": seconds}]
+def _convergence(state, interval):
+    delivered = np.array(state.delivered_samples)
+    times = np.arange(len(delivered)) * interval
+    window = max(1, int(round(WINDOW / interval)))
+    hold = max(1, int(math.ceil(CONVERGED_HOLD / WINDOW)))
+    changes = sorted(set(state.start.tolist() + state.stop.tolist()))
+
+    epochs = []
+    for (begin, end) in zip(changes, changes[1:]):
+        active = (state.start <= begin) & (begin < state.stop)
+        if np.count_nonzero(active) < 2:
+            continue
+
+        # Jain's index of the goodputs of the flows over every whole window of the epoch
+        first = int(np.searchsorted(times, begin))
+        last = int(np.searchsorted(times, end))
+        fairness = []
+        for offset in range(first, last - window, window):
+            goodputs = delivered[offset + window][active] - delivered[offset][active]
+            fairness.append(jain_index(goodputs))
+
+        # A single unlucky window (e.g. a loss shared unevenly) does not undo convergence: the
+        # index is averaged over the last windows, and the flows only count as converged if they
+        # are at the end of the epoch, having last converged when the average started to stay above
+        # `CONVERGED_FAIRNESS` (for `hold` windows at least) without falling below `DIVERGED_FAIRNESS`
+        averaged = [
+            np.mean(fairness[max(0, k + 1 - FAIRNESS_WINDOWS):k + 1]) for k in range(len(fairness))
+        ]
+        after = None
+        above = 0
+        for (k, value) in enumerate(averaged):
+            if value < DIVERGED_FAIRNESS:
+                after = None
+            above = above + 1 if value >= CONVERGED_FAIRNESS else 0
+            if after is None and above >= min(hold, len(averaged)):
+                after = (k + 2 - above) * window * interval
+        epochs.append({"at": begin, "after": after})
+    return epochs
+
+
+# Returns the line printed for a preview
+def _preview_line(preview):
+    parts = []
+    for (name, bottleneck) in preview["bottlenecks"].items():
+        converged = [epoch["after"] for epoch in bottleneck["convergence"]]
+        parts.append("%s %s: utilization %.2f, queue p50 %.1f ms, p99 %.1f ms, fairness %s, converged %s" % (
+            name, bottleneck["aqm"], bottleneck["utilization"], bottleneck["queue_delay"]["p50"],
+            bottleneck["queue_delay"]["p99"],
+            "-" if bottleneck["fairness"] is None else "%.3f" % bottleneck["fairness"],
+            "-" if not converged else ("never" if None in converged else "in %.0f s" % max(converged)),
+        ))
+    return "; ".join(parts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Preview scenarios with a fluid model, without running them")
+    parser.add_argument("files", nargs="+", help="scenario or batch files")
+    parser.add_argument("--set", nargs="+", default=[], metavar="KEY=VALUE", help="override keys of every scenario")
+    parser.add_argument(
+        "--grid", nargs="+", default=[], metavar="KEY=V1,V2", help="preview every combination of these values"
+    )
+    parser.add_argument("--dt", type=float, default=0.002, help="seconds of every step of the model")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="file the previews are written to (JSON)")
+    args = parser.parse_args()
+
+    overrides = parse_overrides(args.set)
+    keys = []
+    values = []
+    for assignment in args.grid:
+        (key, choices) = assignment.split("=", 1)
+        keys.append(key)
+        values.append([parse_overrides(["value=" + choice])["value"] for choice in choices.split(",")])
+
+    previews = []
+    for path in args.files:
+        for (scenario_path, scenario_overrides) in read_batch(path, overrides):
+            for point in itertools.product(*values):
+                point_overrides = dict(scenario_overrides, **dict(zip(keys, point)))
+                try:
+                    preview = predict(load_scenario(scenario_path, **point_overrides), args.dt, args.seed)
+                except (ScenarioError, OSError, ValueError) as error:
+                    sys.exit(scenario_path + ": " + str(error))
+                preview["overrides"] = dict(zip(keys, point))
+                previews.append(preview)
+
+                label = " ".join(key + "=" + json.dumps(value) for (key, value) in zip(keys, point))
+                print(preview["scenario"] + (" [" + label + "]" if label else "") + ": " + _preview_line(preview))
+
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(previews if len(previews) > 1 else previews[0], output_file, indent=4)
+
+
+if __name__ == "__main__":
+    main()
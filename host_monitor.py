@@ -0,0 +1,219 @@
+# SPDX-License-Identifier: GPL-2.0-only
+# Copyright (c) 2019-2022 NITK Surathkal
+
+import json
+import os
+import threading
+import time
+
+from host_stats import (
+    cpu_utilization,
+    read_cpu_times,
+    read_memory_pressure,
+    read_net_softirqs,
+    read_softirq_times,
+    read_softnet_stat,
+)
+from run_stats import percentile
+
+## This program contains the monitor of the emulation host, which tells whether a run
+## measured the emulated network or the limits of the host it was emulated on.
+#
+# While an experiment runs, the monitor samples every `interval` seconds:
+#   - the utilization of every CPU, and the share of it spent in softirqs (`/proc/stat`),
+#   - the NET_RX and NET_TX softirqs handled by every CPU (`/proc/softirqs`),
+#   - the packets dropped and the budget squeezes of every CPU's backlog (`/proc/net/softnet_stat`),
+#   - the memory pressure (`/proc/pressure/memory`) and the available memory.
+#
+# Afterwards, the throughput measured through the bottleneck (the median of the sum of the
+# flows' goodputs, see `summary.py`) is compared with the configured bottleneck rate. A run is
+# host-limited when that throughput is off the configured rate while the host was overloaded
+# (saturated CPUs, softirqs hogging a CPU, backlog drops or memory pressure). Backlog drops
+# make a run host-limited on their own: the host, not the bottleneck, dropped those packets.
+#
+# The samples and the verdict are written to `host.json` in the dump, and `summary.py`
+# reports the verdict along with the metrics of the run.
+
+## Thresholds a run is judged on
+THRESHOLDS = {
+    # 95th percentile of the utilization of the busiest CPU
+    "cpu": 0.95,
+    # 95th percentile of the share of the busiest CPU spent in softirqs
+    "softirq": 0.5,
+    # Average share of time (%) tasks stalled on memory over 10 s (PSI "some")
+    "memory_pressure": 10.0,
+    # Measured over configured throughput below which the bottleneck is underused,
+    # and above which it is not enforced
+    "throughput_low": 0.85,
+    "throughput_high": 1.05,
+}
+
+## Multipliers of the rate units of `tc`, to Mbps
+RATE_UNITS = {"bit": 1e-6, "kbit": 1e-3, "mbit": 1.0, "gbit": 1e3, "bps": 8e-6, "kbps": 8e-3, "mbps": 8.0, "gbps": 8e3}
+
+
+## This method returns a `tc` rate such as "10mbit" in Mbps
+def parse_rate(rate):
+    rate = rate.strip().lower()
+    for unit in sorted(RATE_UNITS, key=len, reverse=True):
+        if rate.endswith(unit):
+            return float(rate[: -len(unit)]) * RATE_UNITS[unit]
+    return float(rate) * RATE_UNITS["bit"]
+
+
+## Samples the load of the host while an experiment runs
+class HostMonitor(threading.Thread):
+
+    def __init__(self, interval=0.5):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.samples = []
+        self.finished = threading.Event()
+
+    def run(self):
+        start = time.monotonic()
+        cpu_times = read_cpu_times()
+        softirq_times = read_softirq_times()
+        net_softirqs = read_net_softirqs()
+        softnet = read_softnet_stat()
+        previous_time = 0.0
+
+        while not self.finished.wait(self.interval):
+            elapsed = time.monotonic() - start
+            current_cpu_times = read_cpu_times()
+            current_softirq_times = read_softirq_times()
+            current_net_softirqs = read_net_softirqs()
+            current_softnet = read_softnet_stat()
+            cpus = sorted(current_cpu_times)
+
+            utilization = cpu_utilization(cpu_times, current_cpu_times, cpus)
+            softirq = {}
+            for cpu in cpus:
+                total = current_cpu_times[cpu][1] - cpu_times[cpu][1]
+                softirq[cpu] = (current_softirq_times[cpu] - softirq_times[cpu]) / total if total > 0 else 0.0
+
+            seconds = elapsed - previous_time
+            sample = {
+                "time": elapsed,
+                "cpu": [utilization[cpu] for cpu in cpus],
+                "softirq": [softirq[cpu] for cpu in cpus],
+                # Softirqs handled per second, over all CPUs
+                "net_rx": sum(
+                    current_net_softirqs[cpu]["NET_RX"] - net_softirqs[cpu]["NET_RX"] for cpu in current_net_softirqs
+                ) / seconds,
+                "net_tx": sum(
+                    current_net_softirqs[cpu]["NET_TX"] - net_softirqs[cpu]["NET_TX"] for cpu in current_net_softirqs
+                ) / seconds,
+                "softnet_dropped": sum(
+                    current_softnet[cpu][1] - softnet[cpu][1] for cpu in current_softnet if cpu in softnet
+                ),
+                "time_squeeze": sum(
+                    current_softnet[cpu][2] - softnet[cpu][2] for cpu in current_softnet if cpu in softnet
+                ),
+            }
+            sample.update(read_memory_pressure())
+            self.samples.append(sample)
+
+            (cpu_times, softirq_times, net_softirqs, softnet) = (
+                current_cpu_times, current_softirq_times, current_net_softirqs, current_softnet
+            )
+            previous_time = elapsed
+
+    ## Returns the host metrics over the run, and what was overloaded
+    def overload(self, thresholds=THRESHOLDS):
+        if not self.samples:
+            return ({}, [])
+
+        busiest_cpu = [max(sample["cpu"]) for sample in self.samples]
+        busiest_softirq = [max(sample["softirq"]) for sample in self.samples]
+        pressures = [sample["some_avg10"] for sample in self.samples if sample["some_avg10"] is not None]
+        metrics = {
+            "cpu_p95": percentile(busiest_cpu, 95),
+            "softirq_p95": percentile(busiest_softirq, 95),
+            "softnet_dropped": sum(sample["softnet_dropped"] for sample in self.samples),
+            "time_squeeze": sum(sample["time_squeeze"] for sample in self.samples),
+            "memory_pressure_max": max(pressures) if pressures else None,
+            "available_kb_min": min(sample["available_kb"] for sample in self.samples),
+        }
+
+        overloaded = []
+        if metrics["cpu_p95"] >= thresholds["cpu"]:
+            overloaded.append("cpu")
+        if metrics["softirq_p95"] >= thresholds["softirq"]:
+            overloaded.append("softirq")
+        if metrics["softnet_dropped"] > 0:
+            overloaded.append("softnet_drops")
+        if metrics["time_squeeze"] > 0:
+            overloaded.append("time_squeeze")
+        if metrics["memory_pressure_max"] is not None and metrics["memory_pressure_max"] >= thresholds["memory_pressure"]:
+            overloaded.append("memory_pressure")
+        return (metrics, overloaded)
+
+
+## This method returns the throughput (Mbps) measured through the bottleneck in `dump`:
+## the median over time of the sum of the goodputs of the flows, or None without flows
+def measured_throughput(dump):
+    from summary import goodput_summary, load_series
+
+    total = 0.0
+    measured = False
+    for tool in ("netperf", "iperf3"):
+        series = load_series(dump, tool)
+        if series is None or not series.names:
+            continue
+        totals = goodput_summary(series)["totals"]
+        if totals["box"] is not None:
+            total += totals["box"][2]
+            measured = True
+    return total if measured else None
+
+
+## This method judges the run in `dump` from the samples of `monitor`, writes the verdict
+## to `host.json` in the dump and returns it
+# `capacity` is (configured bottleneck rate, e.g. "10mbit", number of directions flows use it in).
+def assess(monitor, dump, capacity, thresholds=THRESHOLDS):
+    (metrics, overloaded) = monitor.overload(thresholds)
+
+    configured = parse_rate(capacity[0]) * capacity[1]
+    measured = measured_throughput(dump)
+    ratio = measured / configured if measured is not None and configured > 0 else None
+    off_rate = ratio is not None and not thresholds["throughput_low"] <= ratio <= thresholds["throughput_high"]
+
+    record = {
+        "host_limited": "softnet_drops" in overloaded or (off_rate and bool(overloaded)),
+        "overloaded": overloaded,
+        "configured_mbps": configured,
+        "measured_mbps": measured,
+        "throughput_ratio": ratio,
+        "metrics": metrics,
+        "thresholds": thresholds,
+        "interval": monitor.interval,
+        "samples": monitor.samples,
+    }
+    with open(os.path.join(dump, "host.json"), "w") as host_file:
+        json.dump(record, host_file, indent=4)
+
+    if record["host_limited"]:
+        print(
+            "Warning: the host limited this run (" + ", ".join(overloaded) + "): its results do not reflect"
+            + " the configured bottleneck, see " + os.path.join(dump, "host.json")
+        )
+    elif overloaded:
+        print("Warning: the host was overloaded during this run (" + ", ".join(overloaded) + ")")
+    return record
+
+
+## This method calls `run` (which runs an experiment) while monitoring the host, judges the run,
+## and returns what `run` returned along with the verdict
+def run_monitored(run, capacity, interval=0.5):
+    from nest.experiment.pack import Pack
+
+    monitor = HostMonitor(interval)
+    monitor.start()
+    try:
+        result = run()
+    finally:
+        monitor.finished.set()
+        monitor.join()
+
+    return (result, assess(monitor, Pack.FOLDER, capacity))
@@ -0,0 +1,105 @@
+# SPDX-License-Identifier: GPL-2.0-only
+# Copyright (c) 2019-2022 NITK Surathkal
+
+import os
+
+## This program contains helpers to read the load of the host the experiments run on.
+#
+# Experiments sharing a host only give trustworthy results as long as none of them is
+# starved of CPU: a saturated CPU delays packets in the emulated links and throttles the
+# traffic generators, which shows up as lower throughput and higher latency.
+
+
+## This method returns the (busy, total) jiffies of every CPU, as read from `/proc/stat`
+def read_cpu_times():
+    cpu_times = {}
+    with open("/proc/stat") as proc_stat:
+        for line in proc_stat:
+            fields = line.split()
+            # Only the per-CPU lines ("cpu0", "cpu1", ...), not the "cpu" total
+            if not fields[0].startswith("cpu") or fields[0] == "cpu":
+                continue
+
+            values = [int(value) for value in fields[1:]]
+            # idle and iowait are the idle time of the CPU
+            idle = values[3] + values[4]
+            # guest and guest_nice are already accounted in user and nice
+            total = sum(values[:8])
+            cpu_times[int(fields[0][3:])] = (total - idle, total)
+    return cpu_times
+
+
+## This method returns the utilization (0 to 1) of each of `cpus` between two `read_cpu_times()`
+def cpu_utilization(before, after, cpus):
+    utilization = {}
+    for cpu in cpus:
+        busy = after[cpu][0] - before[cpu][0]
+        total = after[cpu][1] - before[cpu][1]
+        utilization[cpu] = busy / total if total > 0 else 0.0
+    return utilization
+
+
+## This method returns the CPUs this process may run on, in ascending order
+def available_cpus():
+    return sorted(os.sched_getaffinity(0))
+
+
+## This method returns the softirq jiffies of every CPU, as read from `/proc/stat`
+def read_softirq_times():
+    softirq_times = {}
+    with open("/proc/stat") as proc_stat:
+        for line in proc_stat:
+            fields = line.split()
+            if not fields[0].startswith("cpu") or fields[0] == "cpu":
+                continue
+            # user nice system idle iowait irq softirq ...
+            softirq_times[int(fields[0][3:])] = int(fields[7])
+    return softirq_times
+
+
+## This method returns the NET_RX and NET_TX softirqs handled by every CPU so far,
+## as read from `/proc/softirqs`
+def read_net_softirqs():
+    softirqs = {}
+    with open("/proc/softirqs") as proc_softirqs:
+        cpus = [int(cpu[3:]) for cpu in proc_softirqs.readline().split()]
+        for line in proc_softirqs:
+            fields = line.split()
+            if fields[0] in ("NET_RX:", "NET_TX:"):
+                for (cpu, count) in zip(cpus, fields[1:]):
+                    softirqs.setdefault(cpu, {})[fields[0][:-1]] = int(count)
+    return softirqs
+
+
+## This method returns the (processed, dropped, time_squeeze) packet counters of the
+## backlog of every CPU, as read from `/proc/net/softnet_stat`
+# `dropped` counts packets dropped because a backlog was full, `time_squeeze` the times the
+# NET_RX softirq ran out of budget with packets left: both mean the CPU could not keep up.
+def read_softnet_stat():
+    softnet = {}
+    with open("/proc/net/softnet_stat") as softnet_stat:
+        for (row, line) in enumerate(softnet_stat):
+            fields = [int(field, 16) for field in line.split()]
+            # Since Linux 5.10 the CPU of a row is its 13th field; before, rows are online CPUs in order
+            cpu = fields[12] if len(fields) > 12 else row
+            softnet[cpu] = (fields[0], fields[1], fields[2])
+    return softnet
+
+
+## This method returns the memory pressure (`/proc/pressure/memory`, None without PSI)
+## and the available memory in kB
+def read_memory_pressure():
+    pressure = {"some_avg10": None, "full_avg10": None}
+    try:
+        with open("/proc/pressure/memory") as proc_pressure:
+            for line in proc_pressure:
+                fields = line.split()
+                pressure[fields[0] + "_avg10"] = float(fields[1].split("=")[1])
+    except OSError:
+        pass
+
+    with open("/proc/meminfo") as proc_meminfo:
+        for line in proc_meminfo:
+            if line.startswith("MemAvailable:"):
+                pressure["available_kb"] = int(line.split()[1])
+    return pressure
@@ -0,0 +1,176 @@
+# SPDX-License-Identifier: GPL-2.0-only
+# Copyright (c) 2019-2022 NITK Surathkal
+
+import itertools
+import json
+import re
+
+## This program contains an incremental reader of the JSON dumps of the tools (`netperf.json`,
+## `ping.json`, `ss.json`, ...), which yields their samples one at a time instead of loading the
+## whole document.
+#
+# NeST writes the samples of every tool at the same depth of nested objects and lists, e.g.
+#   {"<namespace>": [{"<destination>": [<sample>, <sample>, ...]}, ...], ...}
+# for netperf and ping, with one more object level ("<port>" or "<handle>") for ss and tc. The
+# containers above the samples are walked a character at a time, and every sample (a small
+# object) is decoded on its own with `json.JSONDecoder.raw_decode()`, from a buffer that is read
+# from the file `READ_SIZE` characters at a time. So memory does not grow with the file: only the
+# samples being used are held.
+#
+# `flows()` groups the samples by the path of keys leading to them, i.e. by flow, and hands
+# every flow out as an iterator over its samples, which is read lazily as well.
+
+## Characters read from the file at a time
+READ_SIZE = 1 << 16
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_COMMA = re.compile(r"[ \t\n\r]*,[ \t\n\r]*")
+
+## Characters that can follow a value
+_DELIMITERS = " \t\n\r,:]}"
+
+
+## Raised when the document is not the JSON it should be
+class JsonStreamError(ValueError):
+    pass
+
+
+## Reads the values of a JSON document at a given depth, one at a time
+class JsonStream:
+
+    def __init__(self, stats_file):
+        self.file = stats_file
+        self.buffer = ""
+        self.position = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    ## Yields (path, value) for every value `depth` containers deep, where `path` is the keys
+    ## (and list indices) leading to it
+    # The containers are walked with a stack rather than recursively, since every level of
+    # generators a value is yielded through costs as much as decoding it.
+    def values(self, depth):
+        # The closing character of every open container, and the key of its current member
+        closings = []
+        path = []
+
+        while True:
+            self._skip_whitespace()
+            opening = self._peek()
+            if len(closings) == depth or opening not in ("{", "["):
+                yield (tuple(path), self._value())
+
+                # Most often, the next value of the same list follows right away
+                while closings and len(closings) == depth and closings[-1] == "]":
+                    match = _COMMA.match(self.buffer, self.position)
+                    if match is None or match.end() == len(self.buffer):
+                        break
+                    self.position = match.end()
+                    path[-1] += 1
+                    yield (tuple(path), self._value())
+            else:
+                self.position += 1
+                closings.append("}" if opening == "{" else "]")
+                self._skip_whitespace()
+                if self._peek() != closings[-1]:
+                    path.append(self._key() if opening == "{" else 0)
+                    continue
+                # An empty container
+                self.position += 1
+                closings.pop()
+
+            # Past a value: close the containers it ends, and move on to the next member
+            while closings:
+                self._skip_whitespace()
+                if self._peek() == closings[-1]:
+                    self.position += 1
+                    closings.pop()
+                    path.pop()
+                    continue
+
+                self._expect(",")
+                if closings[-1] == "}":
+                    path[-1] = self._key()
+                else:
+                    path[-1] += 1
+                break
+
+            if not closings:
+                break
+
+        self._skip_whitespace()
+        if self._peek() != "":
+            raise JsonStreamError("Extra data after the JSON document at character " + str(self.position))
+
+    # Reads the key of an object's member, up to its value
+    def _key(self):
+        self._skip_whitespace()
+        key = self._value()
+        if not isinstance(key, str):
+            raise JsonStreamError("Expected a key at character " + str(self.position))
+        self._skip_whitespace()
+        self._expect(":")
+        return key
+
+    # Decodes the value at the current position (past any whitespace), reading more of the file
+    # until it is whole
+    def _value(self):
+        while True:
+            try:
+                (value, end) = self.decoder.raw_decode(self.buffer, self.position)
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+                self._read()
+                continue
+
+            # A number cut short by the end of the buffer (e.g. "2." of "2.5") decodes as well
+            if not self.eof and (end == len(self.buffer) or self.buffer[end] not in _DELIMITERS):
+                self._read()
+                continue
+
+            self.position = end
+            return value
+
+    def _expect(self, character):
+        if self._peek() != character:
+            raise JsonStreamError("Expected '" + character + "' at character " + str(self.position))
+        self.position += 1
+
+    # Returns the character at the current position ("" at the end of the document)
+    def _peek(self):
+        if self.position == len(self.buffer) and not self.eof:
+            self._read()
+        return self.buffer[self.position:self.position + 1]
+
+    def _skip_whitespace(self):
+        while True:
+            self.position = _WHITESPACE.match(self.buffer, self.position).end()
+            if self.position < len(self.buffer) or self.eof:
+                return
+            self._read()
+
+    # Drops what was read and appends the next `READ_SIZE` characters of the file to the buffer
+    def _read(self):
+        chunk = self.file.read(READ_SIZE)
+        self.buffer = self.buffer[self.position:] + chunk
+        self.position = 0
+        self.eof = not chunk
+
+
+## This method yields the (path, samples) of every flow of a tool's JSON dump, whose samples are
+## `depth` containers deep: 4 for netperf, iperf3 and ping, 5 for ss and tc (see above).
+## `samples` is an iterator, to be used up before the next flow is read.
+def flows(stats_file, depth):
+    for (path, items) in itertools.groupby(JsonStream(stats_file).values(depth), key=lambda item: item[0][:-1]):
+        yield (path, (sample for (sample_path, sample) in items))
+
+
+## This method yields the lists of at most `size` items of `iterable`, in order
+def batches(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
@@ -0,0 +1,341 @@
+# SPDX-License-Identifier: GPL-2.0-only
+# Copyright (c) 2019-2022 NITK Surathkal
+
+########################
+# SHOULD BE RUN AS ROOT
+########################
+
+import asyncio
+import json
+import os
+import socket
+import struct
+import threading
+import time
+from array import array
+
+from netlink_socket import in_namespace
+from sketches import HIGHEST_DELAY, HdrHistogram, add_sketches, sketches_enabled
+
+## This program contains a UDP latency prober in the style of irtt, to measure the latency
+## under load at a finer grain than NeST's `ping`.
+#
+# Every `interval` seconds (1 to 10 ms), a client in the namespace a flow starts from sends a
+# small UDP probe to a reflector in the namespace the flow goes to, which sends it straight back
+# with the times it received and returned it. The emulated hosts all share the clock of the
+# emulation host, so the probe gives the one-way delays as well as the RTT:
+#
+#   up     reflector receive time - client send time
+#   down   client receive time - reflector send time
+#   rtt    the round trip, less the time the probe spent in the reflector
+#
+# Receive times are taken by the kernel with SO_TIMESTAMPING (software timestamps) where it is
+# available, SO_TIMESTAMPNS otherwise, and by the prober when neither is. Send times are taken
+# just before the probe is sent, as irtt does.
+#
+# All the clients and reflectors are sockets opened in their namespace (see `in_namespace`)
+# and driven by one asyncio event loop in a thread of the experiment's process, so probing
+# many pairs costs no process, and no thread, per pair.
+#
+# Every delay (in us) is recorded in a fixed-size HDR histogram (see `sketches.py`) for the
+# whole run, and the last `trace_size` probes of every pair are kept in a ring buffer as the
+# raw trace. Both are written to `latency.json` in the dump, in the layout of NeST's stats:
+# {source: [{destination: [meta, sample, ...]}]}, with the histograms and the probes sent and
+# lost in the meta item, and samples in ms like `ping`'s.
+
+## Bounds and default of the probing interval (seconds)
+MIN_INTERVAL = 0.001
+MAX_INTERVAL = 0.01
+DEFAULT_INTERVAL = 0.005
+
+## UDP port of the reflectors (irtt's)
+PORT = 2112
+
+## Probes kept in the raw trace of every pair
+DEFAULT_TRACE_SIZE = 1 << 16
+
+## Seconds replies are waited for after the last probe
+GRACE_TIME = 1.0
+
+## Probe: magic, sequence number, client send time, reflector receive and send times (ns)
+PROBE = struct.Struct("=4sIqqq")
+MAGIC = b"NSTL"
+
+## Timestamping options (linux/net_tstamp.h, asm-generic/socket.h)
+SO_TIMESTAMPNS = getattr(socket, "SO_TIMESTAMPNS", 35)
+SO_TIMESTAMPING = getattr(socket, "SO_TIMESTAMPING", 37)
+SOF_TIMESTAMPING_RX_SOFTWARE = 1 << 3
+SOF_TIMESTAMPING_SOFTWARE = 1 << 4
+TIMESPECS = struct.Struct("=qqqqqq")
+
+## Ancillary data received with a probe
+ANCILLARY_SIZE = socket.CMSG_SPACE(TIMESPECS.size)
+
+
+# Opens a non-blocking UDP socket bound to `port`, with kernel receive timestamps if possible.
+# Returns the socket and the kind of timestamps it gets ("timestamping", "timestampns" or "user").
+def _open_socket(family, port):
+    sock = socket.socket(family, socket.SOCK_DGRAM)
+    sock.setblocking(False)
+    sock.bind(("::" if family == socket.AF_INET6 else "0.0.0.0", port))
+    try:
+        sock.setsockopt(
+            socket.SOL_SOCKET, SO_TIMESTAMPING, SOF_TIMESTAMPING_RX_SOFTWARE | SOF_TIMESTAMPING_SOFTWARE
+        )
+        return (sock, "timestamping")
+    except OSError:
+        pass
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, SO_TIMESTAMPNS, 1)
+        return (sock, "timestampns")
+    except OSError:
+        return (sock, "user")
+
+
+# Returns the time (ns) a datagram was received at, from its ancillary data if the kernel timestamped it
+def _receive_time(ancdata):
+    for (level, kind, data) in ancdata:
+        if level != socket.SOL_SOCKET:
+            continue
+        if kind == SO_TIMESTAMPING and len(data) >= TIMESPECS.size:
+            (seconds, nanoseconds) = TIMESPECS.unpack_from(data)[:2]
+            if seconds:
+                return seconds * 1_000_000_000 + nanoseconds
+        elif kind == SO_TIMESTAMPNS and len(data) >= 16:
+            (seconds, nanoseconds) = struct.unpack_from("=qq", data)
+            return seconds * 1_000_000_000 + nanoseconds
+    return time.time_ns()
+
+
+## This method returns the address in `address`: a NeST `Address`, or a string with or without a prefix length
+def plain_address(address):
+    if hasattr(address, "get_addr"):
+        return address.get_addr(with_subnet=False)
+    return str(address).split("/")[0]
+
+
+## The last `capacity` probes of a pair: (timestamp, sequence number, rtt, up, down)
+class RingTrace:
+
+    WIDTH = 5
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.values = array("d", bytes(8 * self.WIDTH * capacity))
+        self.count = 0
+
+    def append(self, timestamp, sequence, rtt, up, down):
+        offset = (self.count % self.capacity) * self.WIDTH
+        self.values[offset : offset + self.WIDTH] = array("d", (timestamp, sequence, rtt, up, down))
+        self.count += 1
+
+    ## Probes overwritten by later ones
+    def dropped(self):
+        return max(0, self.count - self.capacity)
+
+    ## Yields the probes kept, oldest first
+    def __iter__(self):
+        first = self.count - min(self.count, self.capacity)
+        for i in range(first, self.count):
+            offset = (i % self.capacity) * self.WIDTH
+            yield tuple(self.values[offset : offset + self.WIDTH])
+
+
+## The client end of a probed pair, in the namespace of `source`
+class ProbeClient:
+
+    def __init__(self, source, destination, address, trace_size):
+        self.source = source
+        self.destination = destination
+        self.address = address
+        family = socket.AF_INET6 if ":" in address else socket.AF_INET
+
+        (self.sock, self.timestamps) = in_namespace(source.id, _open_socket, family, 0)
+        self.sock.connect((address, PORT))
+
+        self.sent = 0
+        self.received = 0
+        self.reordered = 0
+        self.last_sequence = -1
+        self.histograms = {kind: HdrHistogram(HIGHEST_DELAY) for kind in ("rtt", "up", "down")}
+        self.trace = RingTrace(trace_size)
+
+    def send(self):
+        try:
+            self.sock.send(PROBE.pack(MAGIC, self.sent & 0xFFFFFFFF, time.time_ns(), 0, 0))
+        except (BlockingIOError, ConnectionRefusedError):
+            # Counted as lost: the probe did not make it out, or the reflector was not there yet
+            pass
+        self.sent += 1
+
+    def receive(self):
+        while True:
+            try:
+                (data, ancdata, flags, sender) = self.sock.recvmsg(PROBE.size, ANCILLARY_SIZE)
+            except (BlockingIOError, ConnectionRefusedError):
+                return
+            received = _receive_time(ancdata)
+            if len(data) < PROBE.size:
+                continue
+            (magic, sequence, sent, reflected, returned) = PROBE.unpack(data)
+            if magic != MAGIC:
+                continue
+
+            self.received += 1
+            if sequence < self.last_sequence:
+                self.reordered += 1
+            self.last_sequence = max(self.last_sequence, sequence)
+
+            up = (reflected - sent) / 1000
+            down = (received - returned) / 1000
+            rtt = ((received - sent) - (returned - reflected)) / 1000
+            self.histograms["rtt"].record(rtt)
+            self.histograms["up"].record(up)
+            self.histograms["down"].record(down)
+            self.trace.append(sent / 1e9, sequence, rtt / 1000, up / 1000, down / 1000)
+
+
+## The reflector in the namespace of `node`, which returns every probe it receives
+class Reflector:
+
+    def __init__(self, node, family):
+        self.node = node
+        (self.sock, self.timestamps) = in_namespace(node.id, _open_socket, family, PORT)
+
+    def receive(self):
+        while True:
+            try:
+                (data, ancdata, flags, sender) = self.sock.recvmsg(PROBE.size, ANCILLARY_SIZE)
+            except BlockingIOError:
+                return
+            received = _receive_time(ancdata)
+            if len(data) < PROBE.size:
+                continue
+            (magic, sequence, sent, reflected, returned) = PROBE.unpack(data)
+            if magic != MAGIC:
+                continue
+            try:
+                self.sock.sendto(PROBE.pack(MAGIC, sequence, sent, received, time.time_ns()), sender)
+            except BlockingIOError:
+                pass
+
+
+## Probes the latency between pairs of nodes every `interval` seconds while an experiment runs
+class LatencyProber(threading.Thread):
+
+    # `pairs` holds the (source node, destination node, destination address) to probe
+    def __init__(self, pairs, interval=DEFAULT_INTERVAL, trace_size=DEFAULT_TRACE_SIZE):
+        super().__init__(daemon=True)
+        if not MIN_INTERVAL <= interval <= MAX_INTERVAL:
+            raise ValueError("The probing interval should be between 1 and 10 ms")
+
+        self.interval = interval
+        self.finished = threading.Event()
+        # Rounds of probes skipped because the previous one was late
+        self.missed = 0
+
+        # One reflector per destination namespace and address family
+        self.reflectors = {}
+        self.clients = []
+        for (source, destination, address) in pairs:
+            address = plain_address(address)
+            family = socket.AF_INET6 if ":" in address else socket.AF_INET
+            if (destination.id, family) not in self.reflectors:
+                self.reflectors[(destination.id, family)] = Reflector(destination, family)
+            self.clients.append(ProbeClient(source, destination, address, trace_size))
+
+    def run(self):
+        loop = asyncio.new_event_loop()
+        try:
+            for reflector in self.reflectors.values():
+                loop.add_reader(reflector.sock.fileno(), reflector.receive)
+            for client in self.clients:
+                loop.add_reader(client.sock.fileno(), client.receive)
+            loop.run_until_complete(self._probe(loop))
+        finally:
+            loop.close()
+
+    async def _probe(self, loop):
+        deadline = loop.time()
+        while not self.finished.is_set():
+            for client in self.clients:
+                client.send()
+
+            # The event loop sleeps in whole milliseconds: a round that is late by less than
+            # an interval is sent right away, so that the rate holds on average
+            deadline += self.interval
+            delay = deadline - loop.time()
+            if delay <= -self.interval:
+                skipped = int(-delay / self.interval)
+                self.missed += skipped
+                deadline += skipped * self.interval
+                delay += skipped * self.interval
+            await asyncio.sleep(max(delay, 0))
+
+        # The last probes are still on their way
+        await asyncio.sleep(GRACE_TIME)
+
+    def stop(self):
+        self.finished.set()
+        self.join()
+        for endpoint in list(self.reflectors.values()) + self.clients:
+            endpoint.sock.close()
+
+    ## Writes the histograms and traces to `latency.json` in `dump`
+    def write(self, dump):
+        by_source = {}
+        for client in self.clients:
+            by_source.setdefault(client.source.name, []).append(client)
+
+        with open(os.path.join(dump, "latency.json"), "w") as latency_file:
+            latency_file.write("{")
+            for (i, (source, clients)) in enumerate(by_source.items()):
+                latency_file.write((", " if i else "") + json.dumps(source) + ": [")
+                for (k, client) in enumerate(clients):
+                    meta = {
+                        "meta": True,
+                        "destination": client.destination.name,
+                        "interval": self.interval,
+                        "timestamps": client.timestamps,
+                        "sent": client.sent,
+                        "received": client.received,
+                        "lost": client.sent - client.received,
+                        "reordered": client.reordered,
+                        "missed": self.missed,
+                        "trace_dropped": client.trace.dropped(),
+                        "histograms": {kind: histogram.to_dict() for (kind, histogram) in client.histograms.items()},
+                    }
+                    latency_file.write((", " if k else "") + "{" + json.dumps(client.address) + ": [" + json.dumps(meta))
+                    for (timestamp, sequence, rtt, up, down) in client.trace:
+                        latency_file.write(", " + json.dumps({
+                            "timestamp": "%.6f" % timestamp, "seq": int(sequence),
+                            "rtt": round(rtt, 4), "up": round(up, 4), "down": round(down, 4),
+                        }))
+                    latency_file.write("]}")
+                latency_file.write("]")
+            latency_file.write("}")
+
+        # The histograms are the prober's sketches (see `sketches.py`)
+        if sketches_enabled():
+            add_sketches(dump, "latency", {
+                client.source.name + " -> " + client.address: client.histograms for client in self.clients
+            })
+
+
+## This method calls `run` (which runs an experiment) while probing the latency of `pairs`
+## (as (source node, destination node, destination address)), writes the results to the dump,
+## and returns what `run` returned
+def run_probed(run, pairs, interval=DEFAULT_INTERVAL, trace_size=DEFAULT_TRACE_SIZE):
+    from nest.experiment.pack import Pack
+
+    prober = LatencyProber(pairs, interval, trace_size)
+    prober.start()
+    try:
+        result = run()
+    finally:
+        prober.stop()
+
+    prober.write(Pack.FOLDER)
+    if prober.missed:
+        print("Warning: %d rounds of latency probes were missed, try a longer interval" % prober.missed)
+    return result
@@ -0,0 +1,169 @@
+# SPDX-License-Identifier: GPL-2.0-only
+# Copyright (c) 2019-2022 NITK Surathkal
+
+########################
+# SHOULD BE RUN AS ROOT
+########################
+
+import ctypes
+import os
+import socket
+import struct
+import threading
+
+## This program contains a minimal netlink client, to read the kernel's state of a namespace
+## many times a second without forking `tc`, `ss` or `ip` every time.
+#
+# A `NetlinkSocket` is opened inside a namespace once and then reused: every `request()` is one
+# `send()` and a few `recv()`s on the same socket. The namespace is entered by a short-lived
+# thread (setns(2) only moves the calling thread), so the caller never leaves its own namespace:
+# a netlink socket keeps talking to the namespace it was created in.
+#
+# Messages are built and parsed with `struct`:
+#
+#   nlmsghdr   length, type, flags, sequence number, port
+#   <payload>  the family header (e.g. `tcmsg`) followed by attributes,
+#              each a (length, type) header and its value, padded to 4 bytes
+
+## Namespace constants, as in NeST's `engine/setns.py`
+CLONE_NEWNET = 0x40000000
+NETNS_PATH = "/var/run/netns/"
+
+## Netlink protocols
+NETLINK_ROUTE = 0
+NETLINK_SOCK_DIAG = 4
+
+## Message types and flags (linux/netlink.h)
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+NLM_F_REQUEST = 0x1
+NLM_F_MULTI = 0x2
+NLM_F_ECHO = 0x8
+NLM_F_DUMP = 0x300
+
+## Flags in the type of an attribute
+NLA_TYPE_MASK = 0x3FFF
+
+NLMSG_HEADER = struct.Struct("=IHHII")
+NLA_HEADER = struct.Struct("=HH")
+
+## Size of the receive buffer, so that dumps of many sockets come in few `recv()`s
+RECEIVE_BUFFER = 1 << 20
+
+_libc = ctypes.CDLL(None, use_errno=True)
+
+
+## Raised when the kernel rejects a request (an `NLMSG_ERROR` with a non-zero error)
+class NetlinkError(OSError):
+    pass
+
+
+## This method returns `length` rounded up to the netlink alignment (4 bytes)
+def align(length):
+    return (length + 3) & ~3
+
+
+## This method returns one attribute of type `attr_type` holding `payload` (bytes)
+def attribute(attr_type, payload):
+    length = NLA_HEADER.size + len(payload)
+    return NLA_HEADER.pack(length, attr_type) + payload + b"\0" * (align(length) - length)
+
+
+## This method returns the attributes in `data` from `offset` on, as {type: value (bytes)}
+def parse_attributes(data, offset=0):
+    attributes = {}
+    end = len(data)
+    while offset + NLA_HEADER.size <= end:
+        (length, attr_type) = NLA_HEADER.unpack_from(data, offset)
+        if length < NLA_HEADER.size:
+            break
+        attributes[attr_type & NLA_TYPE_MASK] = bytes(data[offset + NLA_HEADER.size : offset + length])
+        offset += align(length)
+    return attributes
+
+
+## This method calls `function(*args)` from a thread inside the namespace `ns`, and returns its
+## result. With `ns` None it is called in the current namespace.
+def in_namespace(ns, function, *args):
+    if ns is None:
+        return function(*args)
+
+    outcome = {}
+
+    def enter():
+        try:
+            fd = os.open(NETNS_PATH + ns, os.O_RDONLY)
+            try:
+                if _libc.setns(fd, CLONE_NEWNET) != 0:
+                    errno = ctypes.get_errno()
+                    raise OSError(errno, "setns " + ns + ": " + os.strerror(errno))
+            finally:
+                os.close(fd)
+            outcome["result"] = function(*args)
+        except BaseException as error:
+            outcome["error"] = error
+
+    # The thread ends in `ns`: it is never reused, so nothing has to switch back
+    thread = threading.Thread(target=enter, name="netns-" + ns)
+    thread.start()
+    thread.join()
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome["result"]
+
+
+def _open(protocol):
+    sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, protocol)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECEIVE_BUFFER)
+    sock.bind((0, 0))
+    return sock
+
+
+## A netlink socket of `protocol` opened in the namespace `ns` (the current one if None)
+class NetlinkSocket:
+
+    def __init__(self, protocol, ns=None):
+        self.ns = ns
+        self.sock = in_namespace(ns, _open, protocol)
+        self.sequence = 0
+        self.buffer = bytearray(RECEIVE_BUFFER)
+
+    ## Sends a `msg_type` message carrying `payload` and returns the replies, as a list of
+    ## (type, payload) with the payloads as memoryviews of the received data.
+    ## With `dump` set, it is a dump request and every reply up to `NLMSG_DONE` is returned.
+    ## `flags` are added to those of the request.
+    def request(self, msg_type, payload, dump=False, flags=0):
+        self.sequence = (self.sequence + 1) & 0xFFFFFFFF
+        flags |= NLM_F_REQUEST | (NLM_F_DUMP if dump else 0)
+        self.sock.send(NLMSG_HEADER.pack(NLMSG_HEADER.size + len(payload), msg_type, flags, self.sequence, 0) + payload)
+
+        replies = []
+        while True:
+            size = self.sock.recv_into(self.buffer)
+            # Copied out of the buffer, so that the replies outlive the next request
+            data = memoryview(bytes(self.buffer[:size]))
+            offset = 0
+            while offset + NLMSG_HEADER.size <= size:
+                (length, reply_type, reply_flags, sequence, port) = NLMSG_HEADER.unpack_from(data, offset)
+                if length < NLMSG_HEADER.size:
+                    break
+                body = data[offset + NLMSG_HEADER.size : offset + length]
+                offset += align(length)
+
+                # Late replies to an earlier request
+                if sequence != self.sequence:
+                    continue
+                if reply_type == NLMSG_DONE:
+                    return replies
+                if reply_type == NLMSG_ERROR:
+                    error = -struct.unpack_from("=i", body)[0]
+                    if error:
+                        raise NetlinkError(error, os.strerror(error))
+                    return replies
+
+                replies.append((reply_type, body))
+                if not reply_flags & NLM_F_MULTI and not dump:
+                    return replies
+
+    def close(self):
+        self.sock.close()
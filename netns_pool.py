@@ -0,0 +1,226 @@
+# SPDX-License-Identifier: GPL-2.0-only
+# Copyright (c) 2019-2022 NITK Surathkal
+
+########################
+# SHOULD BE RUN AS ROOT
+########################
+
+import argparse
+import json
+import threading
+import time
+
+from nest.topology import Node, Router
+from batch_build import BatchError, BatchInterface, BatchPlan
+
+## This program contains a pool of namespaces and veth pairs, wired as the dumbbell of
+## `tcp_up_down.py`, that dumbbells are built on instead of from scratch.
+#
+# Creating `left-node-0..N`, `right-node-0..N`, the two routers and the veth pairs between them
+# is most of the time it takes to build (and delete) a large dumbbell. A `NamespacePool` creates
+# them once, up front or in a background thread (e.g. while an experiment runs):
+#   - the two routers, and `size` pairs of nodes ("slots"), the i-th left (right) node linked to
+#     the left (right) router by a veth pair, `eth0` in the node and `ln-i` (`rn-i`) in the router,
+#   - the veth pair between the routers, `lr-rr` and `rr-lr`,
+# with every link up but without any address, route or qdisc, i.e. the `BatchPlan` layout of
+# `tcp_up_down.py` right after its `connect()`s.
+#
+# `build_dumbbell(..., pool=pool)` leases the first slots it needs and only configures them
+# (addresses, routes and qdiscs, in one `ip` and one `tc` batch per namespace). Once the
+# experiment is done, `recycle()` flushes the addresses, neighbours, routes, qdiscs, IFBs and
+# TCP metrics the lease left, in the same number of batches, and the slots are free again.
+# Should recycling fail (e.g. an experiment crashed halfway through configuring the dumbbell),
+# the namespaces of the pool are deleted and created afresh on the next lease.
+#
+# Namespaces are created through NeST, so that the experiments (and their dumps) know them by
+# their usual names. The pool serves one dumbbell at a time.
+#
+# Usage (benchmarks leasing and recycling):
+#   python netns_pool.py [--size 12] [--flows 12] [--flows-per-host 1] [--aqm fq_codel] [--rounds 5]
+#                        [--background] [--output netns_pool.json]
+
+
+## The nodes and links of a pool handed to one dumbbell
+class Lease:
+
+    def __init__(self, left_router, right_router, left_nodes, right_nodes):
+        self.left_router = left_router
+        self.right_router = right_router
+        self.left_nodes = left_nodes
+        self.right_nodes = right_nodes
+
+        # Fresh ends of the existing veth pairs, which the dumbbell addresses and shapes
+        self.left_links = [_link(node, "eth0", left_router, "ln-" + str(i)) for (i, node) in enumerate(left_nodes)]
+        self.right_links = [_link(node, "eth0", right_router, "rn-" + str(i)) for (i, node) in enumerate(right_nodes)]
+        self.router_link = _link(left_router, "lr-rr", right_router, "rr-lr")
+
+
+# Returns the two ends of an existing veth pair as `BatchInterface`s
+def _link(node1, dev1, node2, dev2):
+    interface1 = BatchInterface(node1, dev1)
+    interface2 = BatchInterface(node2, dev2)
+    interface1.pair = interface2
+    interface2.pair = interface1
+    return (interface1, interface2)
+
+
+class NamespacePool:
+
+    def __init__(self, size):
+        self.size = size
+
+        self.left_router = None
+        self.right_router = None
+        self.left_nodes = []
+        self.right_nodes = []
+
+        # The slots in use
+        self.lease = None
+
+        self.recycles = 0
+        self.resets = 0
+
+        # Held while slots are created, so that a lease waits for a background `fill()`
+        self.lock = threading.Lock()
+        self.filler = None
+
+    ## Creates the slots missing up to `size`, in a background thread with `background` set
+    def fill(self, background=False):
+        if not background:
+            self.provision(self.size)
+            return
+
+        self.wait()
+        self.filler = threading.Thread(target=self.provision, args=(self.size,), daemon=True)
+        self.filler.start()
+
+    ## Waits for a background `fill()` to be done
+    def wait(self):
+        if self.filler is not None:
+            self.filler.join()
+            self.filler = None
+
+    ## Creates the routers (the first time) and the slots missing up to `count`
+    def provision(self, count):
+        with self.lock:
+            plan = BatchPlan()
+
+            if self.left_router is None:
+                self.left_router = Router("left-router")
+                self.right_router = Router("right-router")
+                plan.connect(self.left_router, "lr-rr", self.right_router, "rr-lr")
+
+            for i in range(len(self.left_nodes), count):
+                left_node = Node("left-node-" + str(i))
+                right_node = Node("right-node-" + str(i))
+                plan.connect(left_node, "eth0", self.left_router, "ln-" + str(i))
+                plan.connect(right_node, "eth0", self.right_router, "rn-" + str(i))
+                self.left_nodes.append(left_node)
+                self.right_nodes.append(right_node)
+
+            plan.apply()
+
+    ## Leases the first `count` slots, creating the missing ones
+    def acquire(self, count):
+        self.wait()
+        if self.lease is not None:
+            raise RuntimeError("The namespace pool is already leased")
+
+        if count > len(self.left_nodes):
+            self.provision(count)
+
+        self.lease = Lease(self.left_router, self.right_router, self.left_nodes[:count], self.right_nodes[:count])
+        return self.lease
+
+    ## Frees the slots of `dumbbell` (built on this pool) for the next one
+    def recycle(self, dumbbell):
+        lease = dumbbell.lease
+        if lease is not self.lease:
+            raise ValueError("The dumbbell was not built on this namespace pool")
+
+        plan = BatchPlan()
+        for (node_interface, router_interface) in lease.left_links + lease.right_links + [lease.router_link]:
+            plan.flush_interface(node_interface)
+            plan.flush_interface(router_interface)
+
+        for node in [lease.left_router, lease.right_router] + lease.left_nodes + lease.right_nodes:
+            plan.flush_routes(node)
+            plan.flush_tcp_metrics(node)
+
+        self.lease = None
+        try:
+            plan.apply()
+        except BatchError:
+            self.reset()
+            return
+        self.recycles += 1
+
+    ## Deletes every namespace of the pool, whose slots are then created again on demand
+    def reset(self):
+        from scenario import release_namespaces
+
+        self.wait()
+        release_namespaces(self.namespace_ids())
+
+        self.left_router = None
+        self.right_router = None
+        self.left_nodes = []
+        self.right_nodes = []
+        self.lease = None
+        self.resets += 1
+
+    ## Returns the ids of the namespaces created by the pool
+    def namespace_ids(self):
+        nodes = self.left_nodes + self.right_nodes
+        if self.left_router is not None:
+            nodes = [self.left_router, self.right_router] + nodes
+        return [node.id for node in nodes]
+
+    def to_dict(self):
+        return {
+            "size": self.size,
+            "slots": len(self.left_nodes),
+            "leased": len(self.lease.left_nodes) if self.lease is not None else 0,
+            "recycles": self.recycles,
+            "resets": self.resets,
+        }
+
+
+def main():
+    from tcp_up_down import build_dumbbell
+
+    parser = argparse.ArgumentParser(description="Benchmark building dumbbells on a pool of namespaces")
+    parser.add_argument("--size", type=int, default=12, help="slots (pairs of nodes) to create up front")
+    parser.add_argument("--flows", type=int, default=12)
+    parser.add_argument("--flows-per-host", type=int, default=1)
+    parser.add_argument("--aqm", default="fq_codel")
+    parser.add_argument("--rounds", type=int, default=5, help="dumbbells to build and recycle")
+    parser.add_argument("--background", action="store_true", help="create the slots in a background thread")
+    parser.add_argument("--output", help="also write the timings to this JSON file")
+    args = parser.parse_args()
+
+    pool = NamespacePool(args.size)
+
+    start = time.time()
+    pool.fill(args.background)
+    filled = time.time() - start
+    print("Pool of %d slots %s in %.3f s" % (args.size, "started" if args.background else "created", filled))
+
+    rounds = []
+    for _ in range(args.rounds):
+        start = time.time()
+        dumbbell = build_dumbbell(args.flows, args.aqm, flows_per_host=args.flows_per_host, pool=pool)
+        built = time.time()
+        pool.recycle(dumbbell)
+        recycled = time.time()
+
+        rounds.append({"setup": built - start, "recycle": recycled - built})
+        print("setup %.3f s, recycle %.3f s" % (built - start, recycled - built))
+
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump({"fill": filled, "pool": pool.to_dict(), "rounds": rounds}, output, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+# SPDX-License-Identifier: GPL-2.0-only
+# Copyright (c) 2019-2022 NITK Surathkal
+
+########################
+# SHOULD BE RUN AS ROOT
+########################
+
+# This program runs several independent "TCP upload"/"TCP download" experiments at the same time,
+# e.g. `tcp_4up` with fq_codel alongside `tcp_4up` with pie, instead of one 200 second run after another.
+#
+# Every experiment is described as DIRECTION:FLOWS:AQM[:CC], e.g. "up:4:fq_codel" or "down:8:pie:reno".
+# The host is cut into `--jobs` slots, and every slot runs one experiment at a time:
+#   - in its own interpreter, i.e. its own NeST topology, whose namespaces NeST names after a
+#     random topology id, so the namespace sets of two experiments never overlap,
+#   - with its own address space, a /12 of 10.0.0.0/8 (10.0.0.0/12, 10.16.0.0/12, ...),
+#   - pinned to `--cpus-per-job` dedicated CPUs: through a cgroup v2 cpuset when the host has one,
+#     and through the CPU affinity of the experiment (inherited by everything it starts) otherwise.
+#
+# While the experiments run, the utilization of every slot's CPUs is sampled from `/proc/stat`.
+# An experiment whose CPUs were saturated (busy for more than `--saturation` of a sample) is
+# flagged in the log, as its results are likely distorted by the lack of CPU.
+#
+# Usage:
+#   python parallel_sweep.py up:4:fq_codel up:4:pie up:4:codel [--jobs 2] [--cpus-per-job 2]
+#                            [--batched] [--log parallel_sweep.jsonl]
+#
+# The output of every experiment goes to "<experiment name>.log".
+
+import argparse
+import ipaddress
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+from host_stats import available_cpus, cpu_utilization, read_cpu_times
+
+## Address space the slots' pools are cut from, and the size of a pool
+ADDRESS_SPACE = "10.0.0.0/8"
+POOL_PREFIXLEN = 12
+
+## Where the cpusets of the slots are created (cgroup v2)
+CGROUP_ROOT = "/sys/fs/cgroup"
+
+
+## This method parses an experiment given as DIRECTION:FLOWS:AQM[:CC]
+def parse_experiment(spec):
+    fields = spec.split(":")
+    if len(fields) not in (3, 4) or fields[0] not in ("up", "down"):
+        raise ValueError("expected DIRECTION:FLOWS:AQM[:CC], got " + repr(spec))
+
+    return {
+        "direction": fields[0],
+        "flows": int(fields[1]),
+        "aqm": fields[2],
+        "cc": fields[3] if len(fields) == 4 else "cubic",
+    }
+
+
+## This method returns the name of an experiment, e.g. "tcp_4up-fq_codel-cubic"
+def experiment_name(experiment):
+    return (
+        "tcp_" + str(experiment["flows"]) + experiment["direction"]
+        + "-" + experiment["aqm"] + "-" + experiment["cc"]
+    )
+
+
+## A slot runs one experiment at a time on its own CPUs and address pool
+class Slot:
+
+    def __init__(self, index, cpus, pool):
+        self.index = index
+        self.cpus = cpus
+        self.pool = pool
+        # cgroup directory of the slot, if cpusets are available
+        self.cgroup = None
+
+        # The experiment running in the slot, its process and its CPU samples
+        self.experiment = None
+        self.process = None
+        self.output = None
+        self.started = None
+        self.samples = []
+
+    ## Create a cgroup v2 cpuset for the slot. Returns False if the host has none.
+    def create_cgroup(self):
+        try:
+            with open(os.path.join(CGROUP_ROOT, "cgroup.controllers")) as controllers:
+                if "cpuset" not in controllers.read().split():
+                    return False
+            with open(os.path.join(CGROUP_ROOT, "cgroup.subtree_control"), "w") as subtree_control:
+                subtree_control.write("+cpuset")
+
+            cgroup = os.path.join(CGROUP_ROOT, "nest-sweep-" + str(os.getpid()) + "-" + str(self.index))
+            os.makedirs(cgroup, exist_ok=True)
+            with open(os.path.join(cgroup, "cpuset.cpus"), "w") as cpuset_cpus:
+                cpuset_cpus.write(",".join(str(cpu) for cpu in self.cpus))
+        except OSError:
+            return False
+
+        self.cgroup = cgroup
+        return True
+
+    def remove_cgroup(self):
+        if self.cgroup is not None:
+            try:
+                os.rmdir(self.cgroup)
+            except OSError:
+                pass
+
+
+## This method runs inside the child interpreter: it confines itself to its slot, then builds
+## the dumbbell and runs the experiment
+def run_child(experiment, cpus, pool, cgroup, batched):
+    if cgroup != "-":
+        with open(os.path.join(cgroup, "cgroup.procs"), "w") as cgroup_procs:
+            cgroup_procs.write(str(os.getpid()))
+    os.sched_setaffinity(0, cpus)
+
+    from nest.experiment.pack import Pack
+    from tcp_up_down import build_dumbbell, tcp_down_experiment, tcp_up_experiment
+
+    dumbbell = build_dumbbell(experiment["flows"], experiment["aqm"], batched, address_pool=pool)
+    if experiment["direction"] == "up":
+        nest_experiment = tcp_up_experiment(
+            dumbbell, experiment["flows"], experiment["cc"], experiment_name(experiment)
+        )
+    else:
+        nest_experiment = tcp_down_experiment(
+            dumbbell, experiment["flows"], experiment["cc"], experiment_name(experiment)
+        )
+    nest_experiment.run()
+
+    print(json.dumps({"results": Pack.FOLDER}))
+
+
+## This method starts `experiment` in `slot`
+def start(slot, spec, experiment, batched):
+    cmd = [
+        sys.executable, __file__, spec,
+        "--child", ",".join(str(cpu) for cpu in slot.cpus), slot.pool, slot.cgroup or "-",
+    ]
+    if batched:
+        cmd.append("--batched")
+
+    slot.experiment = experiment
+    slot.output = open(experiment_name(experiment) + ".log", "w")
+    slot.process = subprocess.Popen(cmd, stdout=slot.output, stderr=subprocess.STDOUT)
+    slot.started = time.time()
+    slot.samples = []
+
+
+## This method collects the finished experiment of `slot` and returns its log entry
+def finish(slot, saturation):
+    slot.output.close()
+    entry = dict(slot.experiment)
+    entry.update({
+        "experiment": experiment_name(slot.experiment),
+        "kernel": platform.release(),
+        "slot": slot.index,
+        "cpus": slot.cpus,
+        "address_pool": slot.pool,
+        "cpuset": slot.cgroup is not None,
+        "returncode": slot.process.returncode,
+        "duration": time.time() - slot.started,
+        "results": None,
+        "cpu_mean": None,
+        "cpu_max": None,
+        "saturated": False,
+    })
+
+    with open(experiment_name(slot.experiment) + ".log") as output:
+        for line in output:
+            if line.startswith("{"):
+                entry.update(json.loads(line))
+
+    # Every sample is the mean utilization of the slot's CPUs over one interval
+    if slot.samples:
+        entry["cpu_mean"] = sum(slot.samples) / len(slot.samples)
+        entry["cpu_max"] = max(slot.samples)
+        entry["saturated"] = entry["cpu_max"] > saturation
+
+    slot.experiment = None
+    slot.process = None
+    return entry
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run independent tcp_up/tcp_down experiments side by side")
+    parser.add_argument("experiments", nargs="+", help="DIRECTION:FLOWS:AQM[:CC], e.g. up:4:fq_codel")
+    parser.add_argument("--jobs", type=int, help="experiments run at the same time (as many as the CPUs allow by default)")
+    parser.add_argument("--cpus-per-job", type=int, default=2)
+    parser.add_argument("--batched", action="store_true")
+    parser.add_argument("--saturation", type=float, default=0.9, help="CPU utilization above which a run is flagged")
+    parser.add_argument("--interval", type=float, default=5.0, help="seconds between two CPU samples")
+    parser.add_argument("--log", default="parallel_sweep.jsonl")
+    parser.add_argument("--child", nargs=3, metavar=("CPUS", "POOL", "CGROUP"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        cpus = [int(cpu) for cpu in args.child[0].split(",")]
+        run_child(parse_experiment(args.experiments[0]), cpus, args.child[1], args.child[2], args.batched)
+        return
+
+    experiments = [(spec, parse_experiment(spec)) for spec in args.experiments]
+
+    cpus = available_cpus()
+    pools = list(ipaddress.ip_network(ADDRESS_SPACE).subnets(new_prefix=POOL_PREFIXLEN))
+    max_jobs = min(len(cpus) // args.cpus_per_job, len(pools))
+    if max_jobs < 1:
+        sys.exit("Not enough CPUs for a single job of " + str(args.cpus_per_job) + " CPUs")
+
+    jobs = min(args.jobs or max_jobs, len(experiments))
+    if jobs > max_jobs:
+        sys.exit(
+            str(jobs) + " jobs of " + str(args.cpus_per_job) + " CPUs do not fit on the "
+            + str(len(cpus)) + " CPUs available"
+        )
+
+    slots = []
+    for i in range(jobs):
+        slot = Slot(i, cpus[i * args.cpus_per_job:(i + 1) * args.cpus_per_job], str(pools[i]))
+        if not slot.create_cgroup():
+            print("No cpuset available, pinning slot " + str(i) + " through CPU affinity")
+        slots.append(slot)
+
+    pending = list(experiments)
+    previous = read_cpu_times()
+    try:
+        while pending or any(slot.process is not None for slot in slots):
+            for slot in slots:
+                if slot.process is None and pending:
+                    (spec, experiment) = pending.pop(0)
+                    print("Starting " + experiment_name(experiment) + " on CPUs " + str(slot.cpus))
+                    start(slot, spec, experiment, args.batched)
+
+            time.sleep(args.interval)
+
+            current = read_cpu_times()
+            for slot in slots:
+                if slot.process is None:
+                    continue
+
+                utilization = cpu_utilization(previous, current, slot.cpus)
+                slot.samples.append(sum(utilization.values()) / len(utilization))
+
+                if slot.process.poll() is not None:
+                    entry = finish(slot, args.saturation)
+                    if entry["saturated"]:
+                        print(
+                            "Warning: the CPUs of " + entry["experiment"] + " were saturated ("
+                            + "%.0f%%" % (100 * entry["cpu_max"]) + "), its results may be distorted"
+                        )
+                    print("Finished " + entry["experiment"] + " with exit code " + str(entry["returncode"]))
+                    with open(args.log, "a") as log:
+                        log.write(json.dumps(entry) + "\n")
+            previous = current
+    finally:
+        for slot in slots:
+            if slot.process is not None:
+                slot.process.terminate()
+                slot.process.wait()
+            slot.remove_cgroup()
+
+
+if __name__ == "__main__":
+    main()
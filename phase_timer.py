@@ -0,0 +1,435 @@
+# SPDX-License-Identifier: GPL-2.0-only
+# Copyright (c) 2019-2022 NITK Surathkal
+
+########################
+# SHOULD BE RUN AS ROOT
+########################
+
+# This program records where the wall time of an experiment goes. Once `instrument()` is called,
+# the NeST calls are timed by phase:
+#
+#   namespaces    creating nodes and routers          Node(), Router()
+#   links         creating veth pairs                 connect()
+#   addresses     assigning addresses                 set_address(), AddressHelper.assign_addresses()
+#   routing       adding routes                       add_route(), RoutingHelper.populate_routing_tables()
+#   attributes    configuring links (tc, netem)       set_attributes(), set_qdisc()
+#   batched       applying an `ip -batch`/`tc -batch` plan (see `batch_build.py`)
+#   tool_setup    checking for and preparing the measurement tools of `Experiment.run()`
+#   traffic       running the flows and their measurement tools
+#   parsing       parsing the tools' output
+#   dump          writing the JSON dumps
+#   plotting      plotting the results
+#   cleanup       stopping the tools left running
+#   teardown      deleting the namespaces
+#
+# along with every subprocess started, from this interpreter or from NeST's worker processes:
+# its count and latencies, by command ("tc qdisc", "ip link", "netperf", ...).
+#
+# When an experiment ends, `timing.json` is written in its dump: the monotonic start and end of
+# every phase (relative to when timing started), their durations and call counts, and the
+# subprocesses. The teardown happens later, so the report is written again once it is done.
+# With `profile`, the Python side is also profiled during the experiment, with cProfile
+# (`profile.pstats`) or pyinstrument (`profile.html`, `pip install pyinstrument`).
+#
+# Usage, to time any of the scripts here:
+#   python phase_timer.py [--profile cprofile|pyinstrument] tcp_12up.py [arguments...]
+# `scenario.py` and `sweep.py` take `--timing` (and `--profile`) as well.
+
+import argparse
+import atexit
+import functools
+import inspect
+import json
+import os
+import runpy
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from run_stats import percentile
+
+PROFILERS = ("cprofile", "pyinstrument")
+
+## The timer of this interpreter, once `instrument()` was called
+timer = None
+
+# What `time_teardown()` registered to run when the interpreter exits
+_teardown_at_exit = None
+
+
+## This method returns the name a command is counted under, e.g. "tc qdisc" for
+## `ip netns exec h1 tc qdisc add dev eth0 root fq_codel`
+def command_name(args):
+    argv = args.split() if isinstance(args, str) else [str(arg) for arg in args]
+    # Commands run in a namespace are counted as the command they run
+    if argv[:3] == ["ip", "netns", "exec"] and len(argv) > 4:
+        argv = argv[4:]
+    if not argv:
+        return ""
+
+    name = os.path.basename(argv[0])
+    if name in ("ip", "tc") and len(argv) > 1:
+        # Skip options such as `-n ns` or `-batch`
+        objects = [arg for arg in argv[1:] if not arg.startswith("-")]
+        if "-batch" in argv:
+            return name + " -batch"
+        if argv[1] == "-n" and len(objects) > 1:
+            return name + " " + objects[1]
+        if objects:
+            return name + " " + objects[0]
+    return name
+
+
+## Times the phases of the experiments run in this interpreter
+class PhaseTimer:
+
+    def __init__(self, profile=None):
+        self.origin = time.monotonic()
+        self.origin_wall = time.time()
+        self.profile = profile
+        self.profiler = None
+        self.lock = threading.Lock()
+
+        # {phase: {"calls", "duration"}}, and (phase, start, end) spans of consecutive calls
+        self.phases = {}
+        self.timeline = []
+        # Nesting depth of every phase, so that calls within the same phase count once
+        self.depth = {}
+
+        # Subprocesses are logged to a file, so that NeST's worker processes log theirs too
+        (fd, self.subprocess_log) = tempfile.mkstemp(prefix="phase_timer_", suffix=".log")
+        os.close(fd)
+
+        # Report of the last experiment, written again after its teardown
+        self.report_path = None
+        self.last_report = None
+        self.last_origin = None
+
+    ## Records a call of `phase` from `start` to `end` (monotonic times)
+    def record(self, phase, start, end):
+        with self.lock:
+            stats = self.phases.setdefault(phase, {"calls": 0, "duration": 0.0})
+            stats["calls"] += 1
+            stats["duration"] += end - start
+
+            # Consecutive calls of the same phase extend its last span
+            if self.timeline and self.timeline[-1][0] == phase:
+                self.timeline[-1][2] = end - self.origin
+            else:
+                self.timeline.append([phase, start - self.origin, end - self.origin])
+
+    ## Returns `function` timed as `phase`
+    def timed(self, phase, function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            outermost = self.depth.get(phase, 0) == 0
+            self.depth[phase] = self.depth.get(phase, 0) + 1
+            start = time.monotonic()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.depth[phase] -= 1
+                if outermost:
+                    self.record(phase, start, time.monotonic())
+
+        wrapper.phase_timer_original = function
+        return wrapper
+
+    ## Appends a finished subprocess to the log (from any process)
+    def log_subprocess(self, name, start, latency):
+        line = "%s\t%.6f\t%.6f\n" % (name, start - self.origin, latency)
+        fd = os.open(self.subprocess_log, os.O_WRONLY | os.O_APPEND)
+        try:
+            os.write(fd, line.encode())
+        finally:
+            os.close(fd)
+
+    ## Returns the subprocesses logged so far, as {command: {"count", "total", ...}}
+    def subprocess_stats(self):
+        latencies = {}
+        with open(self.subprocess_log) as log:
+            for line in log:
+                (name, start, latency) = line.rstrip("\n").split("\t")
+                latencies.setdefault(name, []).append(float(latency))
+
+        stats = {}
+        for (name, values) in sorted(latencies.items()):
+            stats[name] = {
+                "count": len(values),
+                "total": sum(values),
+                "mean": sum(values) / len(values),
+                "p50": percentile(values, 50),
+                "p99": percentile(values, 99),
+                "max": max(values),
+            }
+        return stats
+
+    ## Starts profiling the Python side
+    def start_profile(self):
+        if self.profile == "cprofile":
+            import cProfile
+
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        elif self.profile == "pyinstrument":
+            try:
+                import pyinstrument
+            except ImportError:
+                raise ImportError("Profiling with pyinstrument needs it installed: pip install pyinstrument")
+            self.profiler = pyinstrument.Profiler()
+            self.profiler.start()
+
+    ## Stops profiling, and writes the profile to `directory`
+    def stop_profile(self, directory):
+        if self.profiler is None:
+            return None
+
+        if self.profile == "cprofile":
+            self.profiler.disable()
+            path = os.path.join(directory, "profile.pstats")
+            self.profiler.dump_stats(path)
+        else:
+            self.profiler.stop()
+            path = os.path.join(directory, "profile.html")
+            with open(path, "w") as profile_file:
+                profile_file.write(self.profiler.output_html())
+        self.profiler = None
+        return path
+
+    ## Returns the report of what was timed so far
+    def report(self, experiment=None, profile_path=None):
+        phases = {}
+        for (phase, stats) in self.phases.items():
+            spans = [(start, end) for (name, start, end) in self.timeline if name == phase]
+            phases[phase] = dict(stats, start=spans[0][0], end=spans[-1][1])
+
+        return {
+            "experiment": experiment,
+            # Wall clock time the monotonic times below are relative to
+            "origin": self.origin_wall,
+            "elapsed": time.monotonic() - self.origin,
+            "phases": phases,
+            "timeline": [{"phase": phase, "start": start, "end": end} for (phase, start, end) in self.timeline],
+            "subprocesses": self.subprocess_stats(),
+            "profile": profile_path,
+        }
+
+    ## Writes the report of an experiment to `timing.json` in its dump `directory`
+    def write_report(self, directory, experiment=None):
+        profile_path = self.stop_profile(directory)
+        self.last_report = self.report(experiment, profile_path)
+        self.last_origin = self.origin
+        self.report_path = os.path.join(directory, "timing.json")
+        self._write()
+
+    def _write(self):
+        with open(self.report_path, "w") as report_file:
+            json.dump(self.last_report, report_file, indent=4)
+
+    ## Starts timing the next experiment afresh
+    def reset(self):
+        self.origin = time.monotonic()
+        self.origin_wall = time.time()
+        self.phases = {}
+        self.timeline = []
+        open(self.subprocess_log, "w").close()
+        self.start_profile()
+
+    ## Moves the teardown that followed the last experiment into its report
+    def teardown_done(self):
+        with self.lock:
+            stats = self.phases.pop("teardown", None)
+            spans = [span for span in self.timeline if span[0] == "teardown"]
+            self.timeline = [span for span in self.timeline if span[0] != "teardown"]
+        if stats is None or self.last_report is None or not os.path.isdir(os.path.dirname(self.report_path)):
+            return
+
+        # Times since this experiment's origin, rather than since the reset that followed it
+        offset = self.origin - self.last_origin
+        report = self.last_report
+        teardown = report["phases"].get("teardown", {"calls": 0, "duration": 0.0, "start": spans[0][1] + offset})
+        teardown["calls"] += stats["calls"]
+        teardown["duration"] += stats["duration"]
+        teardown["end"] = spans[-1][2] + offset
+        report["phases"]["teardown"] = teardown
+        report["timeline"].extend(
+            {"phase": phase, "start": start + offset, "end": end + offset} for (phase, start, end) in spans
+        )
+        report["elapsed"] = teardown["end"]
+
+        # Nothing else runs between an experiment and its teardown
+        report["teardown_subprocesses"] = self.subprocess_stats()
+        open(self.subprocess_log, "w").close()
+        self._write()
+
+
+## Replaces `attribute` of `owner` by its version timed as `phase`
+def _patch(owner, attribute, phase):
+    function = getattr(owner, attribute, None)
+    if function is None or hasattr(function, "phase_timer_original"):
+        return
+    timed = timer.timed(phase, function)
+    # Static and class methods stay callable from the class and its instances alike
+    if isinstance(inspect.getattr_static(owner, attribute), (staticmethod, classmethod)):
+        timed = staticmethod(timed)
+    setattr(owner, attribute, timed)
+
+
+## This method starts timing the experiments run by this interpreter, and returns the timer
+def instrument(profile=None):
+    global timer
+    if timer is not None:
+        return timer
+    timer = PhaseTimer(profile)
+
+    import batch_build
+    import nest.clean_up
+    import nest.topology
+    import nest.topology.interface
+    from nest.experiment import Experiment
+    from nest.experiment import run_exp
+    from nest.routing.routing_helper import RoutingHelper
+
+    _patch(nest.topology.Node, "__init__", "namespaces")
+    connect = nest.topology.interface.connect
+    _patch(nest.topology.interface, "connect", "links")
+    # Modules such as `tcp_up_down` may already have imported `connect` with `from nest.topology import *`
+    for module in list(sys.modules.values()):
+        if getattr(module, "connect", None) is connect:
+            module.connect = nest.topology.interface.connect
+    _patch(nest.topology.Interface, "set_address", "addresses")
+    try:
+        from nest.topology.address_helper import AddressHelper
+    except ImportError:
+        # NeST versions before `AddressHelper` only have `set_address()`
+        AddressHelper = None
+    _patch(AddressHelper, "assign_addresses", "addresses")
+    _patch(nest.topology.Node, "add_route", "routing")
+    _patch(RoutingHelper, "populate_routing_tables", "routing")
+    _patch(nest.topology.Interface, "set_attributes", "attributes")
+    _patch(nest.topology.Interface, "set_qdisc", "attributes")
+    _patch(batch_build.BatchPlan, "apply", "batched")
+
+    for setup in ("get_dependency_status", "setup_tcp_flows", "setup_udp_flows", "setup_ss_runners",
+                  "setup_tc_runners", "setup_ping_runners"):
+        _patch(run_exp, setup, "tool_setup")
+    _patch(run_exp, "dump_json_ouputs", "dump")
+    _patch(run_exp, "cleanup", "cleanup")
+
+    # `scenario.teardown()` deletes the namespaces between experiments, NeST when the interpreter exits
+    time_teardown(nest.clean_up.delete_namespaces)
+
+    # `run_workers()` runs the traffic, the parsers and the plotters: the phase is
+    # given by which workers were set up last
+    pending = {"phase": "traffic"}
+
+    def setting_up(phase, function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            pending["phase"] = phase
+            return function(*args, **kwargs)
+        return wrapper
+
+    run_exp.setup_flow_workers = setting_up("traffic", run_exp.setup_flow_workers)
+    run_exp.setup_parser_workers = setting_up("parsing", run_exp.setup_parser_workers)
+    run_exp.setup_plotter_workers = setting_up("plotting", run_exp.setup_plotter_workers)
+    run_workers = run_exp.run_workers
+
+    def timed_run_workers(workers):
+        return timer.timed(pending["phase"], run_workers)(workers)
+
+    run_exp.run_workers = timed_run_workers
+
+    # Every experiment writes its report to its dump
+    run = Experiment.run
+
+    @functools.wraps(run)
+    def timed_run(experiment):
+        from nest.experiment.pack import Pack
+
+        run(experiment)
+        timer.write_report(Pack.FOLDER, experiment.name)
+        print("Phase timings written to " + timer.report_path)
+        timer.reset()
+
+    Experiment.run = timed_run
+
+    _patch_subprocesses()
+    timer.start_profile()
+    return timer
+
+
+## This method makes `nest.clean_up.delete_namespaces` time `delete_namespaces` as the teardown, and
+## run it when the interpreter exits, in place of the teardown in place so far (timed or not)
+# `teardown.parallel_teardown()` calls it to replace NeST's teardown once `instrument()` was called.
+def time_teardown(delete_namespaces):
+    global _teardown_at_exit
+    import nest.clean_up
+
+    timed_delete_namespaces = timer.timed("teardown", delete_namespaces)
+
+    @functools.wraps(delete_namespaces)
+    def teardown():
+        timed_delete_namespaces()
+        timer.teardown_done()
+
+    teardown.phase_timer_original = delete_namespaces
+
+    def delete_namespaces_at_exit():
+        teardown()
+        os.remove(timer.subprocess_log)
+
+    atexit.unregister(nest.clean_up.delete_namespaces if _teardown_at_exit is None else _teardown_at_exit)
+    nest.clean_up.delete_namespaces = teardown
+    _teardown_at_exit = delete_namespaces_at_exit
+    atexit.register(delete_namespaces_at_exit)
+
+
+# Every subprocess logs its latency (from its start to when it was waited for) once it is reaped
+def _patch_subprocesses():
+    class TimedPopen(subprocess.Popen):
+
+        def __init__(self, args, *popen_args, **kwargs):
+            self.timer_name = command_name(args)
+            self.timer_start = time.monotonic()
+            self.timer_logged = False
+            super().__init__(args, *popen_args, **kwargs)
+
+        def _timer_log(self):
+            if self.returncode is not None and not self.timer_logged:
+                self.timer_logged = True
+                timer.log_subprocess(self.timer_name, self.timer_start, time.monotonic() - self.timer_start)
+
+        def wait(self, timeout=None):
+            returncode = super().wait(timeout)
+            self._timer_log()
+            return returncode
+
+        def poll(self):
+            returncode = super().poll()
+            self._timer_log()
+            return returncode
+
+    subprocess.Popen = TimedPopen
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the phases of the experiments a script runs")
+    parser.add_argument("--profile", choices=PROFILERS, help="also profile the Python side")
+    parser.add_argument("script", help="script to run, e.g. tcp_12up.py")
+    parser.add_argument("arguments", nargs=argparse.REMAINDER)
+    args = parser.parse_args()
+
+    try:
+        instrument(args.profile)
+    except ImportError as error:
+        sys.exit(str(error))
+
+    sys.argv = [args.script] + args.arguments
+    runpy.run_path(args.script, run_name="__main__")
+
+
+if __name__ == "__main__":
+    main()
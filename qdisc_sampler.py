@@ -0,0 +1,273 @@
+# SPDX-License-Identifier: GPL-2.0-only
+# Copyright (c) 2019-2022 NITK Surathkal
+
+########################
+# SHOULD BE RUN AS ROOT
+########################
+
+import json
+import math
+import os
+import socket
+import struct
+import threading
+import time
+from array import array
+
+from netlink_socket import NETLINK_ROUTE, NLM_F_ECHO, NetlinkError, NetlinkSocket, in_namespace, parse_attributes
+from sketches import add_sketches, new_sketches, record_sample, sketches_enabled
+
+## This program contains the sampler of the queue at the bottleneck of the dumbbell, i.e., the
+## AQM under test, which NeST's own stats (netperf, ping, ss) only see from the end hosts.
+#
+# Every `interval` seconds (1 to 10 ms, 5 ms by default), the qdisc of every target is fetched
+# with an RTM_GETQDISC request on a netlink socket opened once in the router's namespace (see
+# `netlink_socket.py`), i.e., what `tc -s qdisc show` reports, without forking `tc`:
+#
+#   qlen, backlog       packets and bytes queued
+#   drops, overlimits,  counters of the qdisc (TCA_STATS_QUEUE)
+#   requeues
+#   packets, bytes      counters of what the qdisc sent (TCA_STATS_BASIC)
+#   ecn_mark            packets the AQM marked instead of dropping, when it reports them
+#   delay               sojourn time (ms) when the AQM reports it: the last packet's for codel,
+#                       the queue delay for pie, the average delay of the busiest tin for cake
+#
+# The AQM of the dumbbell sits on the IFB of each end of the bottleneck link, with handle 11:
+# (see `batch_build.py`), so those are the qdiscs sampled by default.
+#
+# The samples are kept in arrays while the experiment runs, and then written to `qdisc.json`
+# in the dump, in the layout of NeST's stats: {router: [{device: [meta, sample, ...]}]}, with Unix
+# timestamps like the flows' samples. `summary.py` summarizes them along with the flows.
+
+## Bounds and default of the sampling interval (seconds)
+MIN_INTERVAL = 0.001
+MAX_INTERVAL = 0.01
+DEFAULT_INTERVAL = 0.005
+
+## Handle of the AQM on the IFB of an interface ("11:")
+AQM_HANDLE = 0x00110000
+
+## rtnetlink constants (linux/rtnetlink.h, linux/gen_stats.h)
+RTM_GETQDISC = 38
+TCA_KIND = 1
+TCA_STATS2 = 7
+TCA_STATS_BASIC = 1
+TCA_STATS_QUEUE = 3
+TCA_STATS_APP = 4
+
+TCMSG = struct.Struct("=BxxxiIII")
+STATS_BASIC = struct.Struct("=QI")
+STATS_QUEUE = struct.Struct("=IIIII")
+
+## Fields of every sample, in the order they are stored
+FIELDS = ["timestamp", "qlen", "backlog", "drops", "overlimits", "requeues", "packets", "bytes", "ecn_mark", "delay"]
+
+## Fields of the `TCA_STATS_APP` statistics (all u32) of the AQMs that report marks or delays.
+# Only the ones this sampler records are named; the others are None.
+XSTATS = {
+    "codel": [None, None, None, "ldelay", None, None, "ecn_mark"],
+    "fq_codel": [None, None, "ecn_mark"],
+    "fq_pie": [None, None, None, None, "ecn_mark"],
+    "red": [None, None, None, "ecn_mark"],
+    "choke": [None, None, None, "ecn_mark"],
+}
+
+## cake's nested statistics (linux/pkt_sched.h)
+TCA_CAKE_STATS_TIN_STATS = 10
+TCA_CAKE_TIN_STATS_ECN_MARKED_PACKETS = 8
+TCA_CAKE_TIN_STATS_AVG_DELAY_US = 19
+
+
+# Returns {"ecn_mark": ..., "delay": ... (ms)} from the `TCA_STATS_APP` statistics of a `kind` qdisc
+def _xstats(kind, data):
+    values = {}
+    if kind == "pie":
+        # `prob` became a u64 in Linux 5.6; `delay` (us) follows it, and `ecn_mark` comes last
+        if len(data) >= 40:
+            (delay,) = struct.unpack_from("=I", data, 8)
+            (ecn_mark,) = struct.unpack_from("=I", data, 36)
+        else:
+            (delay,) = struct.unpack_from("=I", data, 4)
+            (ecn_mark,) = struct.unpack_from("=I", data, 28)
+        values["delay"] = delay / 1000
+        values["ecn_mark"] = ecn_mark
+    elif kind == "cake":
+        tins = parse_attributes(parse_attributes(data).get(TCA_CAKE_STATS_TIN_STATS, b""))
+        marks = 0
+        delays = []
+        for tin in tins.values():
+            tin_stats = parse_attributes(tin)
+            if TCA_CAKE_TIN_STATS_ECN_MARKED_PACKETS in tin_stats:
+                marks += struct.unpack("=I", tin_stats[TCA_CAKE_TIN_STATS_ECN_MARKED_PACKETS][:4])[0]
+            if TCA_CAKE_TIN_STATS_AVG_DELAY_US in tin_stats:
+                delays.append(struct.unpack("=I", tin_stats[TCA_CAKE_TIN_STATS_AVG_DELAY_US][:4])[0])
+        values["ecn_mark"] = marks
+        if delays:
+            values["delay"] = max(delays) / 1000
+    elif kind in XSTATS:
+        names = XSTATS[kind]
+        # fq_codel's statistics start with their type (0 for the qdisc's own)
+        offset = 4 if kind == "fq_codel" else 0
+        count = min(len(names), (len(data) - offset) // 4)
+        for (name, value) in zip(names, struct.unpack_from("=" + str(count) + "I", data, offset)):
+            if name == "ldelay":
+                values["delay"] = value / 1000
+            elif name is not None:
+                values[name] = value
+    return values
+
+
+## This method parses an RTM_NEWQDISC message, and returns (kind, {field: value})
+def parse_qdisc(body):
+    attributes = parse_attributes(body, TCMSG.size)
+    kind = attributes.get(TCA_KIND, b"").rstrip(b"\0").decode()
+    values = {}
+
+    stats = parse_attributes(attributes.get(TCA_STATS2, b""))
+    if TCA_STATS_BASIC in stats:
+        (values["bytes"], values["packets"]) = STATS_BASIC.unpack_from(stats[TCA_STATS_BASIC])
+    if TCA_STATS_QUEUE in stats:
+        (values["qlen"], values["backlog"], values["drops"], values["requeues"], values["overlimits"]) = (
+            STATS_QUEUE.unpack_from(stats[TCA_STATS_QUEUE])
+        )
+    if TCA_STATS_APP in stats:
+        values.update(_xstats(kind, stats[TCA_STATS_APP]))
+    return (kind, values)
+
+
+## One qdisc sampled: `handle` on `device` in the namespace `ns`
+class QdiscTarget:
+
+    def __init__(self, ns, device, handle=AQM_HANDLE):
+        self.ns = ns
+        self.device = device
+        self.handle = handle
+        self.kind = None
+
+        self.sock = NetlinkSocket(NETLINK_ROUTE, ns)
+        self.ifindex = in_namespace(ns, socket.if_nametoindex, device)
+        self.request = TCMSG.pack(socket.AF_UNSPEC, self.ifindex, handle, 0, 0)
+        self.samples = {field: array("d") for field in FIELDS}
+        # The sketches of the backlog and delay, fed every sample (see `sketches.py`)
+        self.sketches = new_sketches("qdisc") if sketches_enabled() else None
+
+    ## Fetches the qdisc and appends a sample of it
+    def sample(self):
+        # Recent kernels only answer a qdisc request (rather than a dump) that asks for an echo
+        replies = self.sock.request(RTM_GETQDISC, self.request, flags=NLM_F_ECHO)
+        timestamp = time.time()
+        if not replies:
+            return
+        (self.kind, values) = parse_qdisc(replies[0][1])
+        values["timestamp"] = timestamp
+        for field in FIELDS:
+            self.samples[field].append(values.get(field, math.nan))
+        if self.sketches is not None:
+            record_sample("qdisc", self.sketches, values)
+
+    def close(self):
+        self.sock.close()
+
+
+## This method returns the (namespace, device) of the AQM of both ends of the dumbbell's
+## bottleneck: the IFB of `left_router_connection` and `right_router_connection`
+# Interfaces without an AQM (no IFB) have their own netem qdisc 11: sampled instead.
+def bottleneck_queues(dumbbell):
+    queues = []
+    for interface in (dumbbell.left_router_connection, dumbbell.right_router_connection):
+        ifb = interface.ifb
+        if ifb is None:
+            device = interface.id
+        else:
+            # NeST's interfaces hold their IFB as an `Interface`, a `BatchPlan`'s as its name
+            device = getattr(ifb, "id", ifb)
+        queues.append((interface.node.id, device))
+    return queues
+
+
+## Samples a set of qdiscs every `interval` seconds while an experiment runs
+class QdiscSampler(threading.Thread):
+
+    def __init__(self, queues, interval=DEFAULT_INTERVAL):
+        super().__init__(daemon=True)
+        if not MIN_INTERVAL <= interval <= MAX_INTERVAL:
+            raise ValueError("The qdisc sampling interval should be between 1 and 10 ms")
+
+        self.interval = interval
+        self.targets = [QdiscTarget(ns, device) for (ns, device) in queues]
+        self.finished = threading.Event()
+        # Samples skipped because a round of requests took longer than the interval
+        self.missed = 0
+        self.errors = []
+
+    def run(self):
+        deadline = time.monotonic()
+        while not self.finished.is_set():
+            for target in self.targets:
+                try:
+                    target.sample()
+                except NetlinkError as error:
+                    # The qdisc is being replaced (see `set_bottleneck_aqm`)
+                    self.errors.append(target.device + ": " + str(error))
+
+            # Keep to a fixed rate rather than sleeping a fixed time after every round
+            deadline += self.interval
+            delay = deadline - time.monotonic()
+            if delay < 0:
+                skipped = math.ceil(-delay / self.interval)
+                self.missed += skipped
+                deadline += skipped * self.interval
+                delay += skipped * self.interval
+            self.finished.wait(delay)
+
+    def stop(self):
+        self.finished.set()
+        self.join()
+        for target in self.targets:
+            target.close()
+
+    ## Writes the samples to `qdisc.json` in `dump`, one sample at a time
+    def write(self, dump):
+        by_ns = {}
+        for target in self.targets:
+            by_ns.setdefault(target.ns, []).append(target)
+
+        with open(os.path.join(dump, "qdisc.json"), "w") as qdisc_file:
+            qdisc_file.write("{")
+            for (i, (ns, targets)) in enumerate(by_ns.items()):
+                qdisc_file.write((", " if i else "") + json.dumps(ns) + ": [")
+                for (k, target) in enumerate(targets):
+                    meta = {
+                        "meta": True, "kind": target.kind, "handle": "%x:" % (target.handle >> 16),
+                        "interval": self.interval, "missed": self.missed, "errors": len(self.errors),
+                    }
+                    qdisc_file.write((", " if k else "") + "{" + json.dumps(target.device) + ": [" + json.dumps(meta))
+                    columns = [target.samples[field] for field in FIELDS]
+                    for values in zip(*columns):
+                        sample = {field: value for (field, value) in zip(FIELDS, values) if not math.isnan(value)}
+                        qdisc_file.write(", " + json.dumps(sample))
+                    qdisc_file.write("]}")
+                qdisc_file.write("]")
+            qdisc_file.write("}")
+
+        if sketches_enabled():
+            add_sketches(dump, "qdisc", {target.ns + " -> " + target.device: target.sketches for target in self.targets})
+
+
+## This method calls `run` (which runs an experiment) while sampling the qdiscs of `queues`
+## (as (namespace, device), see `bottleneck_queues`), writes their samples to the dump, and
+## returns what `run` returned
+def run_sampled(run, queues, interval=DEFAULT_INTERVAL):
+    from nest.experiment.pack import Pack
+
+    sampler = QdiscSampler(queues, interval)
+    sampler.start()
+    try:
+        result = run()
+    finally:
+        sampler.stop()
+
+    sampler.write(Pack.FOLDER)
+    if sampler.missed:
+        print("Warning: %d qdisc samples were missed, try a longer interval" % sampler.missed)
+    return result
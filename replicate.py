@@ -0,0 +1,197 @@
+# SPDX-License-Identifier: GPL-2.0-only
+# Copyright (c) 2019-2022 NITK Surathkal
+
+########################
+# SHOULD BE RUN AS ROOT
+########################
+
+# This program runs a scenario (see `scenario.py`) again and again until its results are precise
+# enough, instead of a fixed number of times.
+#
+# Every replicate runs with its own seed, which delays the start of every flow by a different
+# random amount (up to `--jitter` seconds), so that the replicates do not all start in lockstep.
+# After every replicate, the metrics of all the replicates so far are aggregated:
+#   - the goodput of every flow and their sum (from netperf), flows being told apart by their
+#     source, destination, congestion control and start time (see `summarize_dump()`),
+#   - Jain's fairness index of the flows' goodputs,
+#   - the 50th, 90th and 99th percentiles of the RTT (from ping),
+# each as a mean with its `--confidence` confidence interval (Student's t). Once the interval of
+# every metric in `--metrics` is within `--precision` of its mean (and at least `--min-runs` ran),
+# no more replicates are run. `--max-runs` bounds the emulation time spent on noisy metrics.
+#
+# Usage:
+#   python replicate.py scenarios/reno_cubic_westwood_cdg.json [--precision 0.05] [--min-runs 3]
+#                       [--max-runs 20] [--jitter 1.0] [--seed 1] [--per-flow] [--output report.json]
+#                       [--cache-dir .result_cache]
+#
+# With `--cache-dir`, replicates already in the result cache (see `result_cache.py`) are not run again.
+#
+# NumPy is needed (`pip install numpy`).
+
+import argparse
+import json
+import sys
+
+from result_cache import ResultCache, environment, run_cached, summarize_dump
+from run_stats import confidence_half_width, mean
+from scenario import ScenarioError, compile_scenario, execute, load_scenario, parse_overrides, teardown
+from summary import jain_index
+from teardown import parallel_teardown
+
+## Metrics the precision is required on by default
+DEFAULT_METRICS = ["aggregate_goodput", "fairness", "rtt_p99"]
+
+
+## This method returns the metrics of one experiment's dump, from its summary (see `result_cache.py`)
+def dump_metrics(dump):
+    summary = summarize_dump(dump)
+    goodputs = summary.get("netperf", {}).get("mean", {})
+    rtts = summary.get("ping", {}).get("percentiles", {})
+
+    metrics = {
+        "aggregate_goodput": sum(goodputs.values()) if goodputs else None,
+        "fairness": jain_index(list(goodputs.values())),
+        "rtt_p50": rtts.get("p50"),
+        "rtt_p90": rtts.get("p90"),
+        "rtt_p99": rtts.get("p99"),
+    }
+    for (flow, goodput) in goodputs.items():
+        metrics["goodput " + flow] = goodput
+    return metrics
+
+
+## This method aggregates the metrics of the replicates, as {metric: {mean, half_width, precision, runs}}
+def aggregate(replicates, confidence=0.95):
+    names = []
+    for metrics in replicates:
+        names.extend(name for name in metrics if name not in names)
+
+    summary = {}
+    for name in names:
+        values = [metrics[name] for metrics in replicates if metrics.get(name) is not None]
+        if not values:
+            continue
+
+        m = mean(values)
+        half_width = confidence_half_width(values, confidence)
+        summary[name] = {
+            "mean": m,
+            "half_width": half_width,
+            # Half width relative to the mean, e.g. 0.05 for +-5%
+            "precision": half_width / abs(m) if m else float("inf"),
+            "runs": len(values),
+        }
+    return summary
+
+
+## This method returns the metrics among `required` whose confidence interval is still too wide
+def imprecise_metrics(summary, required, precision):
+    imprecise = []
+    for name in required:
+        if name not in summary or summary[name]["precision"] > precision:
+            imprecise.append(name)
+    return imprecise
+
+
+## This method runs replicates of `scenario` until the `required` metrics reach `precision`,
+## and returns the report of all the replicates
+# `run` is called with a scenario and returns the dump of its experiment.
+def replicate(scenario, run, precision=0.05, min_runs=3, max_runs=20, jitter=1.0, seed=1,
+              required=None, per_flow=False, confidence=0.95):
+
+    replicates = []
+    dumps = []
+    summary = {}
+    imprecise = []
+
+    for i in range(max_runs):
+        replicate_scenario = dict(scenario)
+        replicate_scenario["jitter"] = {"seed": seed + i, "max": jitter}
+
+        dump = run(replicate_scenario)
+        dumps.append(dump)
+        replicates.append(dump_metrics(dump))
+
+        summary = aggregate(replicates, confidence)
+        metrics = list(required or DEFAULT_METRICS)
+        if per_flow:
+            metrics += [name for name in summary if name.startswith("goodput ")]
+        imprecise = imprecise_metrics(summary, metrics, precision)
+
+        if imprecise:
+            status = "still imprecise: " + ", ".join(imprecise)
+        else:
+            status = "all metrics within %g%%" % (100 * precision)
+        print("Replicate " + str(i + 1) + ": " + status)
+        if i + 1 >= min_runs and not imprecise:
+            break
+
+    return {
+        "scenario": scenario,
+        "precision": precision,
+        "confidence": confidence,
+        "converged": not imprecise,
+        "imprecise": imprecise,
+        "runs": len(replicates),
+        "dumps": dumps,
+        "replicates": replicates,
+        "summary": summary,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replicate a scenario until its results are precise enough")
+    parser.add_argument("file", help="scenario file")
+    parser.add_argument("--set", nargs="+", default=[], metavar="KEY=VALUE", help="override keys of the scenario")
+    parser.add_argument("--precision", type=float, default=0.05, help="relative confidence interval, e.g. 0.05 for 5%%")
+    parser.add_argument("--confidence", type=float, default=0.95)
+    parser.add_argument("--min-runs", type=int, default=3)
+    parser.add_argument("--max-runs", type=int, default=20)
+    parser.add_argument("--jitter", type=float, default=1.0, help="largest delay of a flow's start, in seconds")
+    parser.add_argument("--seed", type=int, default=1, help="seed of the first replicate")
+    parser.add_argument("--metrics", nargs="+", default=DEFAULT_METRICS, help="metrics the precision is required on")
+    parser.add_argument("--per-flow", action="store_true", help="also require it on the goodput of every flow")
+    parser.add_argument("--cache-dir", help="reuse the replicates stored in this result cache")
+    parser.add_argument("--output", help="file the report is written to (<name>_replicates.json by default)")
+    args = parser.parse_args()
+
+    try:
+        scenario = load_scenario(args.file, **parse_overrides(args.set))
+        compile_scenario(scenario)
+    except (ScenarioError, OSError, ValueError) as error:
+        sys.exit(args.file + ": " + str(error))
+
+    # The namespaces of every replicate are deleted in parallel, and checked for leftovers
+    parallel_teardown()
+
+    if args.cache_dir:
+        cache = ResultCache(args.cache_dir)
+        env = environment()
+
+        def run(replicate_scenario):
+            (entry, hit) = run_cached(cache, replicate_scenario, env)
+            if not hit:
+                teardown()
+            return entry["dump"]
+    else:
+        def run(replicate_scenario):
+            dump = execute(compile_scenario(replicate_scenario))
+            teardown()
+            return dump
+
+    report = replicate(
+        scenario, run, args.precision, args.min_runs, args.max_runs, args.jitter, args.seed,
+        args.metrics, args.per_flow, args.confidence,
+    )
+
+    output = args.output or compile_scenario(scenario).name + "_replicates.json"
+    with open(output, "w") as output_file:
+        json.dump(report, output_file, indent=4)
+
+    for (name, stats) in report["summary"].items():
+        print("%-50s %12.3f +- %-10.3f (%d runs)" % (name, stats["mean"], stats["half_width"], stats["runs"]))
+    print("Report written to " + output)
+
+
+if __name__ == "__main__":
+    main()
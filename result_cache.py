@@ -0,0 +1,413 @@
+# SPDX-License-Identifier: GPL-2.0-only
+# Copyright (c) 2019-2022 NITK Surathkal
+
+########################
+# SHOULD BE RUN AS ROOT
+########################
+
+# This program runs scenarios (see `scenario.py`) through a result cache, so that an experiment
+# that was already run in the same conditions is not run again.
+#
+# The cache is content addressed: an experiment is stored under the hash of
+#   - the scenario, with its defaults filled in (topology, link attributes, AQM, flows,
+#     congestion control, durations),
+#   - the kernel release and the sysctls that change how TCP and the qdiscs behave,
+#   - the versions of NeST and of the tools it runs (netperf, ping, ss, tc, ip),
+#   - the code of the modules that run the experiments and summarize them (`CODE`), so that
+#     changing any of them runs the experiments again.
+# A hit returns the stored dump and its summary right away. `--force` runs the experiment
+# anyway and replaces the stored results.
+#
+# Every entry is a directory `<cache dir>/<hash>/` holding the dump (`dump/`), its summary
+# (`summary.json`) and what the hash was computed from (`entry.json`). Once the cache grows
+# past `--max-size` or `--max-entries`, the least recently used entries are evicted.
+#
+# Usage:
+#   python result_cache.py scenarios/tcp_down.json --set aqm=fq_codel flows=8 [--force]
+#                          [--cache-dir .result_cache] [--max-size 20G] [--max-entries 100]
+
+import argparse
+import hashlib
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import time
+
+from run_stats import mean, percentile
+from scenario import (
+    ScenarioError,
+    compile_scenario,
+    execute,
+    load_scenario,
+    parse_overrides,
+    read_batch,
+    teardown,
+    with_defaults,
+)
+from teardown import parallel_teardown
+
+DEFAULT_CACHE_DIR = ".result_cache"
+
+## Sysctls (under /proc/sys) that are part of the cache key
+SYSCTLS = [
+    "net/core/default_qdisc",
+    "net/core/rmem_default",
+    "net/core/rmem_max",
+    "net/core/wmem_default",
+    "net/core/wmem_max",
+    "net/ipv4/tcp_allowed_congestion_control",
+    "net/ipv4/tcp_congestion_control",
+    "net/ipv4/tcp_ecn",
+    "net/ipv4/tcp_mem",
+    "net/ipv4/tcp_no_metrics_save",
+    "net/ipv4/tcp_rmem",
+    "net/ipv4/tcp_sack",
+    "net/ipv4/tcp_timestamps",
+    "net/ipv4/tcp_window_scaling",
+    "net/ipv4/tcp_wmem",
+]
+
+## Tools whose version is part of the cache key, with the option that prints it
+TOOLS = [
+    ("netperf", "-V"),
+    ("ping", "-V"),
+    ("ss", "-V"),
+    ("tc", "-V"),
+    ("ip", "-V"),
+]
+
+## Modules (next to this one) that build and run the experiments or summarize them, whose code is
+## part of the cache key: results stored before any of them changed are not served afterwards
+CODE = [
+    "address_plan.py",
+    "adaptive.py",
+    "batch_build.py",
+    "host_monitor.py",
+    "host_stats.py",
+    "latency_prober.py",
+    "qdisc_sampler.py",
+    "result_cache.py",
+    "run_stats.py",
+    "scenario.py",
+    "sketches.py",
+    "tcp_info.py",
+    "tcp_up_down.py",
+]
+
+
+## This method returns the environment the results depend on, besides the scenario
+def environment():
+    sysctls = {}
+    for sysctl in SYSCTLS:
+        try:
+            with open(os.path.join("/proc/sys", sysctl)) as value:
+                sysctls[sysctl.replace("/", ".")] = " ".join(value.read().split())
+        except OSError:
+            sysctls[sysctl.replace("/", ".")] = None
+
+    tools = {}
+    for (tool, version_option) in TOOLS:
+        try:
+            proc = subprocess.run(
+                [tool, version_option], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True
+            )
+            output = proc.stdout.strip().splitlines()
+            tools[tool] = output[0] if output else None
+        except OSError:
+            tools[tool] = None
+
+    try:
+        from importlib.metadata import version
+
+        tools["nest"] = version("nitk-nest")
+    except Exception:
+        tools["nest"] = None
+
+    return {"kernel": platform.release(), "sysctls": sysctls, "tools": tools, "code": code_version()}
+
+
+## This method returns the hash of the code in `CODE`
+def code_version():
+    digest = hashlib.sha256()
+    directory = os.path.dirname(os.path.abspath(__file__))
+    for name in CODE:
+        digest.update(name.encode() + b"\0")
+        with open(os.path.join(directory, name), "rb") as code_file:
+            digest.update(code_file.read())
+    return digest.hexdigest()
+
+
+## This method returns the cache key of `scenario` run in `env`
+def cache_key(scenario, env):
+    canonical = json.dumps(
+        {"scenario": with_defaults(scenario), "environment": env}, sort_keys=True, separators=(",", ":")
+    )
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+## Tools whose samples are summarized, with the field and unit of their samples
+SUMMARIZED = [("netperf", "sending_rate", "Mbps"), ("ping", "rtt", "ms")]
+
+## Percentiles of all the samples of a tool that are summarized
+SUMMARY_PERCENTILES = [50, 90, 99]
+
+
+## This method returns the samples of `field` of every flow in the `tool` JSON dump, as a list of
+## (source namespace, destination address, start time, values)
+def flow_samples(dump, tool, field):
+    path = os.path.join(dump, tool + ".json")
+    if not os.path.isfile(path):
+        return []
+
+    with open(path) as stats_file:
+        stats = json.load(stats_file)
+
+    flows = []
+    for (ns_name, ns_stats) in stats.items():
+        for flow_stats in ns_stats:
+            for (destination, samples) in flow_stats.items():
+                # NeST puts the start time of the flow in a "meta" item ahead of the samples
+                starts = [float(sample["start_time"]) for sample in samples if "start_time" in sample]
+                values = [float(sample[field]) for sample in samples if field in sample]
+                # netperf results are keyed by "address:port", and the port changes from run to run
+                address = destination.rsplit(":", 1)[0] if tool == "netperf" else destination
+                flows.append((ns_name, address, starts[0] if starts else None, values))
+    return flows
+
+
+## This method returns the flow a tool ran for, as (source, destination, congestion control, start time):
+## the configured flow of the dump's scenario (see `scenario.py`) starting from `ns_name` at `start`,
+## or the namespace, address and start time in the dump if there is none
+# Jitter delays the flows by a different amount in every replicate, so the start time of a
+# configured flow is the one it was given, before its delay.
+def flow_key(configured, ns_name, address, start):
+    for flow in configured:
+        if flow["src"] == ns_name and start is not None and abs(flow["start"] + flow["delay"] - start) < 1e-6:
+            return (flow["src"], flow["dst"], flow["cc"], flow["start"])
+    return (ns_name, address, None, start)
+
+
+# Returns the name of a flow in the summary, e.g. "h1 -> h2 cubic @5s"
+def _flow_name(key):
+    (src, dst, cc, start) = key
+    name = src + " -> " + dst
+    if cc is not None:
+        name += " " + cc
+    if start is not None:
+        name += " @%gs" % start
+    return name
+
+
+## This method returns the summary of a dump: the mean of every flow's throughput (netperf) and RTT (ping),
+## and the percentiles of all their samples, as {tool: {"unit", "mean": {flow: mean}, "percentiles"}}
+# This is the summary stored with every cache entry, and the one `replicate.py` aggregates.
+# Flows are named after their source, destination, congestion control and start time, so that
+# the same flow has the same name from one run to the next. The streams of a flow (and flows
+# configured alike) cannot be told apart, so they are numbered by decreasing mean:
+# "h1 -> h2 cubic @0s #0" is the fastest of them. Pings are named after their endpoints.
+def summarize_dump(dump):
+    configured = []
+    scenario_path = os.path.join(dump, "scenario.json")
+    if os.path.isfile(scenario_path):
+        with open(scenario_path) as scenario_file:
+            configured = json.load(scenario_file).get("flows", [])
+
+    summary = {}
+    for (tool, field, unit) in SUMMARIZED:
+        flows = flow_samples(dump, tool, field)
+        if not flows:
+            continue
+
+        groups = {}
+        samples = []
+        for (ns_name, address, start, values) in flows:
+            if not values:
+                continue
+            if tool == "ping":
+                name = ns_name + " -> " + address
+            else:
+                name = _flow_name(flow_key(configured, ns_name, address, start))
+            groups.setdefault(name, []).append(mean(values))
+            samples.extend(values)
+
+        means = {}
+        for (name, flow_means) in sorted(groups.items()):
+            if len(flow_means) == 1:
+                means[name] = flow_means[0]
+                continue
+            for (i, flow_mean) in enumerate(sorted(flow_means, reverse=True)):
+                means[name + " #" + str(i)] = flow_mean
+
+        summary[tool] = {
+            "unit": unit,
+            "mean": means,
+            "percentiles": {"p%g" % q: percentile(samples, q) for q in SUMMARY_PERCENTILES} if samples else {},
+        }
+
+    return summary
+
+
+class ResultCache:
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_size=None, max_entries=None):
+        self.cache_dir = cache_dir
+        # Limits on the total size (in bytes) and number of entries, None for no limit
+        self.max_size = max_size
+        self.max_entries = max_entries
+        os.makedirs(cache_dir, exist_ok=True)
+
+    ## Returns the entry stored under `key` (marking it as used), or None
+    def lookup(self, key):
+        entry_path = os.path.join(self.cache_dir, key, "entry.json")
+        if not os.path.isfile(entry_path):
+            return None
+
+        with open(entry_path) as entry_file:
+            entry = json.load(entry_file)
+        entry["last_used"] = time.time()
+        self._write_entry(key, entry)
+
+        entry["dump"] = os.path.join(self.cache_dir, key, "dump")
+        with open(os.path.join(self.cache_dir, key, "summary.json")) as summary_file:
+            entry["summary"] = json.load(summary_file)
+        return entry
+
+    ## Stores a copy of `dump` under `key`, replacing any entry already there
+    def store(self, key, dump, scenario, env):
+        # Fill a temporary directory first, so an interrupted copy is never taken for an entry
+        staging = os.path.join(self.cache_dir, key + ".tmp")
+        shutil.rmtree(staging, ignore_errors=True)
+        shutil.copytree(dump, os.path.join(staging, "dump"))
+
+        summary = summarize_dump(dump)
+        with open(os.path.join(staging, "summary.json"), "w") as summary_file:
+            json.dump(summary, summary_file, indent=4)
+
+        now = time.time()
+        entry = {
+            "key": key,
+            "scenario": with_defaults(scenario),
+            "environment": env,
+            "source": dump,
+            "created": now,
+            "last_used": now,
+            "size": _directory_size(staging),
+        }
+        with open(os.path.join(staging, "entry.json"), "w") as entry_file:
+            json.dump(entry, entry_file, indent=4)
+
+        shutil.rmtree(os.path.join(self.cache_dir, key), ignore_errors=True)
+        os.rename(staging, os.path.join(self.cache_dir, key))
+
+        self.evict(keep=key)
+
+        entry["dump"] = os.path.join(self.cache_dir, key, "dump")
+        entry["summary"] = summary
+        return entry
+
+    ## Evicts the least recently used entries (except `keep`) until the cache fits its limits
+    def evict(self, keep=None):
+        entries = []
+        for key in os.listdir(self.cache_dir):
+            entry_path = os.path.join(self.cache_dir, key, "entry.json")
+            if os.path.isfile(entry_path):
+                with open(entry_path) as entry_file:
+                    entry = json.load(entry_file)
+                entries.append((entry["last_used"], key, entry["size"]))
+
+        entries.sort()
+        total_size = sum(size for (last_used, key, size) in entries)
+        evicted = []
+
+        for (last_used, key, size) in entries:
+            too_big = self.max_size is not None and total_size > self.max_size
+            too_many = self.max_entries is not None and len(entries) - len(evicted) > self.max_entries
+            if not too_big and not too_many:
+                break
+            if key == keep:
+                continue
+
+            shutil.rmtree(os.path.join(self.cache_dir, key), ignore_errors=True)
+            total_size -= size
+            evicted.append(key)
+
+        return evicted
+
+    def _write_entry(self, key, entry):
+        with open(os.path.join(self.cache_dir, key, "entry.json"), "w") as entry_file:
+            json.dump(entry, entry_file, indent=4)
+
+
+## This method returns the size in bytes of the files under `path`
+def _directory_size(path):
+    size = 0
+    for (root, dirs, files) in os.walk(path):
+        for name in files:
+            size += os.path.getsize(os.path.join(root, name))
+    return size
+
+
+## This method parses a size such as "500M" or "20G" into bytes
+def parse_size(size):
+    units = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30, "T": 1 << 40}
+    if size[-1].upper() in units:
+        return int(float(size[:-1]) * units[size[-1].upper()])
+    return int(size)
+
+
+## This method returns the cached results of `scenario`, running it first on a miss or if `force` is set.
+## Returns the cache entry and whether it was a hit.
+def run_cached(cache, scenario, env, force=False):
+    compiled = compile_scenario(scenario)
+    key = cache_key(scenario, env)
+
+    if not force:
+        entry = cache.lookup(key)
+        if entry is not None:
+            return (entry, True)
+
+    dump = execute(compiled)
+    return (cache.store(key, dump, scenario, env), False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run scenarios through a result cache")
+    parser.add_argument("files", nargs="+", help="scenario or batch files")
+    parser.add_argument("--set", nargs="+", default=[], metavar="KEY=VALUE", help="override keys of every scenario")
+    parser.add_argument("--force", action="store_true", help="run the experiments even if their results are cached")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR)
+    parser.add_argument("--max-size", type=parse_size, help="evict old entries past this size, e.g. 20G")
+    parser.add_argument("--max-entries", type=int, help="evict old entries past this number of entries")
+    args = parser.parse_args()
+
+    overrides = parse_overrides(args.set)
+    scenarios = []
+    for path in args.files:
+        for (scenario_path, scenario_overrides) in read_batch(path, overrides):
+            try:
+                scenarios.append(load_scenario(scenario_path, **scenario_overrides))
+                compile_scenario(scenarios[-1])
+            except (ScenarioError, OSError, ValueError) as error:
+                sys.exit(scenario_path + ": " + str(error))
+
+    cache = ResultCache(args.cache_dir, args.max_size, args.max_entries)
+    env = environment()
+
+    # The namespaces of every scenario run are deleted in parallel, and checked for leftovers
+    parallel_teardown()
+
+    for scenario in scenarios:
+        (entry, hit) = run_cached(cache, scenario, env, args.force)
+        if not hit:
+            # The next scenario runs on a fresh topology
+            teardown()
+
+        print(compile_scenario(scenario).name + ": " + ("cached" if hit else "ran") + ", results in " + entry["dump"])
+        print(json.dumps(entry["summary"], indent=4))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,395 @@
+# SPDX-License-Identifier: GPL-2.0-only
+# Copyright (c) 2019-2022 NITK Surathkal
+
+# This program keeps the results of all the experiments run so far in one SQLite database,
+# so that they can be queried and compared without walking the dumps again.
+#
+# `ingest` finds the dumps (`<name>(<timestamp>)_dump` directories, and the dumps stored in a
+# result cache) under the given directories and stores, for every experiment:
+#   - what was run: scenario name, AQM, number of flows, congestion control, direction and kernel,
+#   - its summary metrics (see `summary.py`): aggregate goodput, fairness, RTT percentiles,
+#     latency inflation, retransmission rate, backlog and drops of the bottleneck, ...
+#   - its time series downsampled to one value every `--step` seconds: the goodput of every
+#     flow and their total, the RTT of every ping flow, and the backlog of every sampled qdisc.
+# Only new dumps (or dumps modified since) are processed, so ingesting again after a sweep is quick.
+#
+# What was run is read from, in order:
+#   - the `scenario.json` that `scenario.py` writes in the dumps it runs,
+#   - the `entry.json` of the result cache entry the dump is in (see `result_cache.py`),
+#   - the logs of `sweep.py` and `parallel_sweep.py` given with `--log`.
+# Otherwise only the name is known (from the dump's directory), along with the direction and the
+# number of flows of the dumbbell experiments named "tcp_<flows><up|down>".
+#
+# `query` prints a metric for the runs matching the filters, or its mean, min and max over
+# the runs of every group with `--group-by`, e.g. the p99 RTT of fq_codel at 8 flows across kernels:
+#
+#   python results_db.py ingest . --log sweep.jsonl
+#   python results_db.py query rtt_p99 --aqm fq_codel --flows 8 --group-by kernel [--valid-only]
+#   python results_db.py metrics
+#
+# The database is `results.db` by default (`--db`).
+
+import argparse
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+
+import numpy as np
+
+from summary import group_means, latency_summary, load_dump, summarize_series
+
+DEFAULT_DB = "results.db"
+
+## Columns of a run that it can be filtered and grouped by
+KEYS = ["name", "aqm", "flows", "cc", "direction", "kernel"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    dump TEXT UNIQUE NOT NULL,
+    mtime REAL NOT NULL,
+    name TEXT,
+    aqm TEXT,
+    flows INTEGER,
+    cc TEXT,
+    direction TEXT,
+    kernel TEXT,
+    started REAL,
+    source TEXT,
+    ingested REAL
+);
+CREATE INDEX IF NOT EXISTS runs_keys ON runs (name, aqm, flows, cc, kernel);
+CREATE INDEX IF NOT EXISTS runs_aqm ON runs (aqm, flows);
+CREATE TABLE IF NOT EXISTS metrics (
+    run INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+    metric TEXT NOT NULL,
+    value REAL,
+    PRIMARY KEY (run, metric)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS metrics_metric ON metrics (metric, run);
+CREATE TABLE IF NOT EXISTS series (
+    run INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+    metric TEXT NOT NULL,
+    flow TEXT NOT NULL,
+    time REAL NOT NULL,
+    value REAL
+);
+CREATE INDEX IF NOT EXISTS series_run ON series (run, metric, flow);
+"""
+
+
+## This method opens (and creates if needed) the database in `path`
+def connect(path=DEFAULT_DB):
+    db = sqlite3.connect(path)
+    db.execute("PRAGMA foreign_keys = ON")
+    db.execute("PRAGMA journal_mode = WAL")
+    db.executescript(SCHEMA)
+    return db
+
+
+## This method returns the dumps under the directories in `roots`
+def find_dumps(roots):
+    dumps = []
+    for root in roots:
+        for (path, dirs, files) in os.walk(root):
+            name = os.path.basename(path)
+            in_cache = name == "dump" and os.path.isfile(os.path.join(os.path.dirname(path), "entry.json"))
+            if name.endswith("_dump") or in_cache:
+                dumps.append(os.path.realpath(path))
+                # A dump holds no other dump
+                dirs[:] = []
+    return sorted(dumps)
+
+
+## This method returns the entries of `sweep.py` and `parallel_sweep.py` logs, by dump
+def read_logs(paths):
+    runs = {}
+    for path in paths:
+        with open(path) as log:
+            for line in log:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                if entry.get("results"):
+                    runs[os.path.realpath(entry["results"])] = entry
+    return runs
+
+
+# Returns the run keys of a scenario (see `scenario.py`), with its defaults filled in
+def _scenario_keys(scenario):
+    if scenario["topology"] == "dumbbell":
+        return {
+            "name": scenario["name"], "aqm": scenario["aqm"], "flows": scenario["flows"],
+            "cc": scenario["cc"], "direction": scenario["direction"],
+        }
+
+    tcp_flows = [flow for flow in scenario["flows"] if flow["protocol"] == "tcp"]
+    return {
+        "name": scenario["name"],
+        "aqm": scenario["aqm"],
+        "flows": sum(flow.get("streams", 1) for flow in scenario["flows"]),
+        "cc": ",".join(sorted(set(flow.get("cc", "cubic") for flow in tcp_flows))) or None,
+        "direction": None,
+    }
+
+
+## This method returns what was run in `dump` (the `KEYS` of its run) and where it was read from
+def run_keys(dump, logs):
+    keys = dict.fromkeys(KEYS)
+
+    scenario_path = os.path.join(dump, "scenario.json")
+    entry_path = os.path.join(os.path.dirname(dump), "entry.json")
+    if os.path.isfile(scenario_path):
+        with open(scenario_path) as scenario_file:
+            record = json.load(scenario_file)
+        keys.update(_scenario_keys(record["scenario"]), kernel=record.get("kernel"))
+        return (keys, "scenario")
+
+    if os.path.basename(dump) == "dump" and os.path.isfile(entry_path):
+        with open(entry_path) as entry_file:
+            entry = json.load(entry_file)
+        keys.update(_scenario_keys(entry["scenario"]), kernel=entry["environment"].get("kernel"))
+        return (keys, "cache")
+
+    if dump in logs:
+        entry = logs[dump]
+        keys.update({
+            "name": entry.get("experiment"), "aqm": entry.get("aqm"), "flows": entry.get("flows"),
+            "cc": entry.get("cc"), "direction": entry.get("direction"), "kernel": entry.get("kernel"),
+        })
+        return (keys, "log")
+
+    name = os.path.basename(dump)
+    keys["name"] = name[: name.index("(")] if "(" in name else name
+    # Dumps of `tcp_up()` and `tcp_down()` from before they wrote a `scenario.json` are named after
+    # the flows they were run with, e.g. "tcp_12up"
+    match = re.fullmatch(r"tcp_(\d+)(up|down)", keys["name"])
+    if match is not None:
+        keys.update(flows=int(match.group(1)), direction=match.group(2))
+    return (keys, "dump")
+
+
+## This method returns the summary metrics of a run, flattened to {metric: value}
+def flatten_summary(summary):
+    metrics = {"samples": summary["samples"], "flows_measured": summary["flows"]}
+
+    goodput = summary.get("netperf") or summary.get("iperf3")
+    if goodput is not None:
+        metrics["aggregate_goodput"] = goodput["aggregate"]
+        metrics["fairness"] = goodput["fairness"]
+        metrics["totals_mean"] = goodput["totals"]["mean"]
+
+    rtt = summary.get("ping")
+    if rtt is not None and rtt["percentiles"] is not None:
+        metrics["rtt_mean"] = rtt["mean"]
+        for (percentile, value) in rtt["percentiles"].items():
+            metrics["rtt_" + percentile] = value
+        for (percentile, value) in rtt["inflation"]["percentiles"].items():
+            metrics["inflation_" + percentile] = value
+        for (percentile, value) in (rtt["inflation"]["ratio"] or {}).items():
+            metrics["inflation_ratio_" + percentile] = value
+
+    retransmissions = summary.get("retransmissions")
+    if retransmissions is not None:
+        metrics["retransmits"] = retransmissions["retransmits"]
+        metrics["retransmit_rate"] = retransmissions["rate"]
+
+    latency = summary.get("latency")
+    if latency is not None and latency["rtt"] is not None:
+        for kind in ("rtt", "up", "down"):
+            for percentile in ("p50", "p99"):
+                metrics["probe_" + kind + "_" + percentile] = latency[kind][percentile]
+        metrics["probe_loss"] = latency["loss"]
+
+    # The bottleneck's qdiscs, over both directions: the fullest queue and all the drops and marks
+    queues = list(summary.get("queues", {}).values())
+    if queues:
+        backlogs = [queue["backlog_bytes"]["p99"] for queue in queues if queue["backlog_bytes"]["p99"] is not None]
+        metrics["queue_backlog_p99"] = max(backlogs) if backlogs else None
+        metrics["queue_drops"] = sum(queue["drops"] or 0 for queue in queues)
+        metrics["queue_ecn_marks"] = sum(queue["ecn_marks"] or 0 for queue in queues)
+
+    return metrics
+
+
+## This method returns the time series of a run downsampled to one value every `step` seconds,
+## as (metric, flow, time since the start of the run, value) rows
+def downsample(series, step, start):
+    rows = []
+    for (tool, field, metric) in (("netperf", "sending_rate", "goodput"), ("iperf3", "sending_rate", "goodput"),
+                                  ("ping", "rtt", "rtt"), ("qdisc", "backlog", "backlog")):
+        if tool not in series or not len(series[tool]):
+            continue
+
+        tool_series = series[tool]
+        steps = ((tool_series.columns["timestamp"] - start) // step).astype(np.intp)
+        steps_count = int(steps.max()) + 1
+        count = len(tool_series.names)
+        means = group_means(tool_series.flow * steps_count + steps, tool_series.columns[field], count * steps_count)
+        means = means.reshape(count, steps_count)
+
+        for (i, name) in enumerate(tool_series.names):
+            for j in np.flatnonzero(~np.isnan(means[i])):
+                rows.append((metric, name, float(j * step), float(means[i, j])))
+
+        if metric == "goodput":
+            present = ~np.all(np.isnan(means), axis=0)
+            totals = np.nansum(means, axis=0)
+            for j in np.flatnonzero(present):
+                rows.append(("goodput", "total", float(j * step), float(totals[j])))
+
+    return rows
+
+
+## This method stores the results of `dump` in `db`, replacing those of an earlier version of it
+def ingest_dump(db, dump, logs, step=1.0):
+    series = load_dump(dump)
+    summary = summarize_series(series)
+    summary["latency"] = latency_summary(dump)
+    # The number of flows is the one configured: the number of flows measured is a metric of its own
+    (keys, source) = run_keys(dump, logs)
+
+    metrics = flatten_summary(summary)
+    host_path = os.path.join(dump, "host.json")
+    if os.path.isfile(host_path):
+        with open(host_path) as host_file:
+            metrics["host_limited"] = float(json.load(host_file)["host_limited"])
+
+    starts = [float(np.nanmin(s.columns["timestamp"])) for s in series.values() if len(s)]
+    start = min(starts) if starts else None
+
+    with db:
+        db.execute("DELETE FROM runs WHERE dump = ?", (dump,))
+        cursor = db.execute(
+            "INSERT INTO runs (dump, mtime, name, aqm, flows, cc, direction, kernel, started, source, ingested)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (dump, _mtime(dump), keys["name"], keys["aqm"], keys["flows"], keys["cc"], keys["direction"],
+             keys["kernel"], start, source, time.time()),
+        )
+        run = cursor.lastrowid
+        db.executemany(
+            "INSERT INTO metrics (run, metric, value) VALUES (?, ?, ?)",
+            [(run, metric, value) for (metric, value) in metrics.items()],
+        )
+        if start is not None:
+            db.executemany(
+                "INSERT INTO series (run, metric, flow, time, value) VALUES (?, ?, ?, ?, ?)",
+                [(run,) + row for row in downsample(series, step, start)],
+            )
+    return run
+
+
+# Returns when the files of a dump were last modified
+def _mtime(dump):
+    return max([os.path.getmtime(dump)] + [entry.stat().st_mtime for entry in os.scandir(dump) if entry.is_file()])
+
+
+## This method ingests the dumps under `roots` that are not in `db` yet (or changed since),
+## and returns the number of dumps ingested
+def ingest(db, roots, log_paths=(), step=1.0):
+    logs = read_logs(log_paths)
+    known = dict(db.execute("SELECT dump, mtime FROM runs"))
+
+    ingested = 0
+    for dump in find_dumps(roots):
+        if known.get(dump) == _mtime(dump):
+            continue
+        ingest_dump(db, dump, logs, step)
+        ingested += 1
+        print("Ingested " + dump)
+    return ingested
+
+
+## This method returns the values of `metric` of the runs matching `filters` (as {key: value}),
+## or, with `group_by`, (group..., runs, mean, min, max) rows for every group
+# With `valid_only`, the runs the host monitor found host-limited (see `host_monitor.py`) are left out.
+def query(db, metric, filters=None, group_by=None, valid_only=False):
+    conditions = ["metrics.metric = ?"]
+    parameters = [metric]
+    if valid_only:
+        conditions.append(
+            "NOT EXISTS (SELECT 1 FROM metrics AS host WHERE host.run = runs.id"
+            " AND host.metric = 'host_limited' AND host.value = 1)"
+        )
+    for (key, value) in (filters or {}).items():
+        if key not in KEYS:
+            raise ValueError("unknown key: " + key)
+        conditions.append("runs." + key + " = ?")
+        parameters.append(value)
+    where = " WHERE " + " AND ".join(conditions)
+
+    if group_by:
+        for key in group_by:
+            if key not in KEYS:
+                raise ValueError("unknown key: " + key)
+        columns = ", ".join("runs." + key for key in group_by)
+        sql = (
+            "SELECT " + columns + ", COUNT(*), AVG(metrics.value), MIN(metrics.value), MAX(metrics.value)"
+            " FROM runs JOIN metrics ON metrics.run = runs.id" + where
+            + " GROUP BY " + columns + " ORDER BY " + columns
+        )
+    else:
+        sql = (
+            "SELECT runs.name, runs.aqm, runs.flows, runs.cc, runs.kernel, runs.dump, metrics.value"
+            " FROM runs JOIN metrics ON metrics.run = runs.id" + where + " ORDER BY runs.started"
+        )
+    return db.execute(sql, parameters).fetchall()
+
+
+# Returns `value` as an int if it is one, so that `--flows 8` matches the stored flow counts
+def _filter_value(value):
+    try:
+        return int(value)
+    except ValueError:
+        return value
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Store and query the results of experiments")
+    parser.add_argument("--db", default=DEFAULT_DB, help="database file")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    ingest_parser = commands.add_parser("ingest", help="store the dumps not in the database yet")
+    ingest_parser.add_argument("roots", nargs="*", default=["."], help="directories the dumps are searched in")
+    ingest_parser.add_argument("--log", nargs="+", default=[], help="logs of sweep.py and parallel_sweep.py")
+    ingest_parser.add_argument("--step", type=float, default=1.0, help="seconds the time series are downsampled to")
+
+    query_parser = commands.add_parser("query", help="print a metric of the matching runs")
+    query_parser.add_argument("metric", help="e.g. rtt_p99, aggregate_goodput, fairness")
+    for key in KEYS:
+        query_parser.add_argument("--" + key, type=_filter_value)
+    query_parser.add_argument("--group-by", nargs="+", choices=KEYS, help="aggregate the runs of every group")
+    query_parser.add_argument("--valid-only", action="store_true", help="leave out the host-limited runs")
+
+    commands.add_parser("metrics", help="list the metrics stored")
+
+    args = parser.parse_args()
+    db = connect(args.db)
+
+    if args.command == "ingest":
+        start = time.monotonic()
+        count = ingest(db, args.roots, args.log, args.step)
+        print("%d dumps ingested in %.1f s" % (count, time.monotonic() - start))
+    elif args.command == "metrics":
+        for (metric, runs) in db.execute("SELECT metric, COUNT(*) FROM metrics GROUP BY metric ORDER BY metric"):
+            print("%-30s %d runs" % (metric, runs))
+    else:
+        filters = {key: getattr(args, key) for key in KEYS if getattr(args, key) is not None}
+        try:
+            rows = query(db, args.metric, filters, args.group_by, args.valid_only)
+        except ValueError as error:
+            sys.exit(str(error))
+
+        if args.group_by:
+            print(" | ".join(args.group_by + ["runs", "mean", "min", "max"]))
+        else:
+            print(" | ".join(["name", "aqm", "flows", "cc", "kernel", "dump", args.metric]))
+        for row in rows:
+            print(" | ".join("%.3f" % value if isinstance(value, float) else str(value) for value in row))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+# SPDX-License-Identifier: GPL-2.0-only
+# Copyright (c) 2019-2022 NITK Surathkal
+
+import math
+
+## This program contains the statistics used to decide when a run (or a set of runs) has
+## measured enough: sample means, Student's t confidence intervals and percentiles.
+
+
+## This method returns the mean of `values`
+def mean(values):
+    return sum(values) / len(values)
+
+
+## This method returns the sample standard deviation of `values`
+def stdev(values):
+    if len(values) < 2:
+        return 0.0
+    m = mean(values)
+    return math.sqrt(sum((value - m) ** 2 for value in values) / (len(values) - 1))
+
+
+## This method returns the `q`-th percentile (0 to 100) of `values`, interpolating linearly
+def percentile(values, q):
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100
+    lower = int(math.floor(position))
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+# Continued fraction of the regularized incomplete beta function (modified Lentz's method)
+def _beta_continued_fraction(a, b, x):
+    tiny = 1e-300
+    c = 1.0
+    d = 1.0 - (a + b) * x / (a + 1)
+    d = 1.0 / (d if abs(d) > tiny else tiny)
+    result = d
+
+    for m in range(1, 200):
+        # Even step
+        numerator = m * (b - m) * x / ((a + 2 * m - 1) * (a + 2 * m))
+        d = 1.0 + numerator * d
+        d = 1.0 / (d if abs(d) > tiny else tiny)
+        c = 1.0 + numerator / c
+        c = c if abs(c) > tiny else tiny
+        result *= d * c
+
+        # Odd step
+        numerator = -(a + m) * (a + b + m) * x / ((a + 2 * m) * (a + 2 * m + 1))
+        d = 1.0 + numerator * d
+        d = 1.0 / (d if abs(d) > tiny else tiny)
+        c = 1.0 + numerator / c
+        c = c if abs(c) > tiny else tiny
+        delta = d * c
+        result *= delta
+
+        if abs(delta - 1.0) < 1e-12:
+            break
+
+    return result
+
+
+# Regularized incomplete beta function I_x(a, b)
+def _incomplete_beta(a, b, x):
+    if x <= 0:
+        return 0.0
+    if x >= 1:
+        return 1.0
+
+    front = math.exp(
+        math.lgamma(a + b) - math.lgamma(a) - math.lgamma(b) + a * math.log(x) + b * math.log(1 - x)
+    )
+    # The continued fraction converges quickly only on this side of the mean
+    if x < (a + 1) / (a + b + 2):
+        return front * _beta_continued_fraction(a, b, x) / a
+    return 1.0 - front * _beta_continued_fraction(b, a, 1 - x) / b
+
+
+## This method returns P(T <= t) for Student's t distribution with `df` degrees of freedom
+def t_cdf(t, df):
+    tail = 0.5 * _incomplete_beta(df / 2, 0.5, df / (df + t * t))
+    return 1.0 - tail if t >= 0 else tail
+
+
+## This method returns the `p` quantile of Student's t distribution with `df` degrees of freedom
+def t_quantile(p, df):
+    if p == 0.5:
+        return 0.0
+    if p < 0.5:
+        return -t_quantile(1 - p, df)
+
+    # Bisection: t_cdf is increasing, and the quantiles we need are far below 1e3
+    low = 0.0
+    high = 1e3
+    for _ in range(100):
+        middle = (low + high) / 2
+        if t_cdf(middle, df) < p:
+            low = middle
+        else:
+            high = middle
+    return (low + high) / 2
+
+
+## This method returns the half width of the `confidence` (e.g. 0.95) confidence interval on the mean of `values`
+def confidence_half_width(values, confidence=0.95):
+    if len(values) < 2:
+        return float("inf")
+    t = t_quantile(1 - (1 - confidence) / 2, len(values) - 1)
+    return t * stdev(values) / math.sqrt(len(values))
+
+
+## This method returns the half width of the confidence interval on the mean of `values`,
+## relative to that mean (e.g. 0.05 for +-5%)
+def relative_precision(values, confidence=0.95):
+    m = mean(values)
+    if m == 0:
+        return float("inf")
+    return confidence_half_width(values, confidence) / abs(m)
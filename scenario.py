@@ -0,0 +1,602 @@
+# SPDX-License-Identifier: GPL-2.0-only
+# Copyright (c) 2019-2022 NITK Surathkal
+
+########################
+# SHOULD BE RUN AS ROOT
+########################
+
+import argparse
+import copy
+import functools
+import hashlib
+import ipaddress
+import json
+import os
+import platform
+import random
+import sys
+
+## This program contains the engine that runs the experiments described by scenario files.
+#
+# A scenario is a JSON file describing the topology, the link attributes, the AQM, the flows
+# (with their congestion control) and their timing. Two topologies are supported:
+#
+#   "chain":    h1 -- r1 -- r2 -- h2, as in `tcp_bidirectional.py`, `udp_flood.py`, ...
+#       {
+#           "name": "tcp-bidirectional",
+#           "topology": "chain",
+#           "access": {"bandwidth": "1000mbit", "delay": "1ms"},
+#           "bottleneck": {"bandwidth": "10mbit", "delay": "10ms"},
+#           "aqm": "pfifo",            <-- on the link from `r1` to `r2`
+#           "reverse_aqm": null,       <-- on the link from `r2` to `r1`
+#           "flows": [
+#               {"protocol": "tcp", "src": "h1", "dst": "h2", "start": 0, "stop": 200, "streams": 1, "cc": "cubic"},
+#               {"protocol": "udp", "src": "h2", "dst": "h1", "start": 0, "stop": 200, "target_bandwidth": "10mbit"}
+#           ]
+#       }
+#
+#   "dumbbell": the dumbbell of `tcp_up_down.py`, as in `tcp_1up.py` ... `tcp_12down.py`
+#       {
+#           "topology": "dumbbell",
+#           "direction": "up",
+#           "flows": 12,
+#           "aqm": "fq_codel",
+#           "cc": "cubic",             <-- optional, along with "duration", "batched", "flows_per_host"
+#       }
+#
+# Either topology can run in adaptive-duration mode, i.e., stop as soon as the flows are in a
+# steady state (see `adaptive.py`), with the stop times of the flows as the longest run:
+#       "adaptive": {"min_duration": 20, "window": 10, "precision": 0.05}
+#
+# The start of every flow can be delayed by a random amount, drawn from a seeded generator so
+# that the same seed always gives the same start times (see `replicate.py`):
+#       "jitter": {"seed": 7, "max": 1.0}      <-- up to 1 second later
+#
+# A scenario is validated and compiled into the list of NeST calls ("steps") it stands for.
+# Compiled scenarios are cached by the hash of their content, so running the same scenario
+# again (e.g. in a batch) skips both.
+#
+# Usage:
+#   python scenario.py scenarios/tcp_bidirectional.json scenarios/tcp_up.json --set aqm=pie flows=4
+#   python scenario.py scenarios/tcp_up.json --timing [--profile cprofile|pyinstrument]
+#
+# Every file is either a scenario or a batch, i.e. a list of {"scenario": <path>, <overrides>...}.
+# All the scenarios run one after the other in this process, and the topology of each one is
+# torn down before the next one is built.
+
+## Directory of the scenarios shipped with the experiments
+SCENARIO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "scenarios")
+
+## Values used when a scenario leaves them out
+DEFAULTS = {
+    "chain": {
+        "access": {"bandwidth": "1000mbit", "delay": "1ms"},
+        "bottleneck": {"bandwidth": "10mbit", "delay": "10ms"},
+        "networks": ["192.168.1.0/24", "192.168.2.0/24", "192.168.3.0/24"],
+        "aqm": "pfifo",
+        "reverse_aqm": None,
+        "adaptive": None,
+        "jitter": None,
+    },
+    "dumbbell": {
+        "direction": "up",
+        "cc": "cubic",
+        "duration": 200,
+        "batched": False,
+        "flows_per_host": 1,
+        "adaptive": None,
+        "jitter": None,
+    },
+}
+
+## Links of the dumbbell of `tcp_up_down.py`: from the nodes to the routers, and between the routers
+DUMBBELL_ACCESS = {"bandwidth": "1000mbit", "delay": "1ms"}
+DUMBBELL_BOTTLENECK = {"bandwidth": "10mbit", "delay": "10ms"}
+
+## Settings of the adaptive-duration mode (see `adaptive.py`)
+ADAPTIVE_KEYS = ("min_duration", "window", "precision", "confidence", "interval")
+
+## Keys a flow of a "chain" scenario may have, and their default values
+FLOW_DEFAULTS = {"start": 0, "stop": 200, "streams": 1, "cc": "cubic", "target_bandwidth": None}
+
+## Compiled scenarios, by `scenario_key()`
+_compiled = {}
+
+
+## Raised when a scenario is not valid. Lists every problem found, not only the first one.
+class ScenarioError(Exception):
+    pass
+
+
+## A scenario compiled into the NeST calls that run it
+class CompiledScenario:
+
+    def __init__(self, name, topology, key, scenario=None):
+        self.name = name
+        self.topology = topology
+        # `scenario_key()` of the scenario it was compiled from, and that scenario with its defaults
+        self.key = key
+        self.scenario = scenario
+        # (operation, arguments...) tuples, run in order by `execute()`
+        self.steps = []
+        # The flows it runs, as {"src", "dst", "protocol", "cc", "start", "delay"}: the names of their
+        # nodes, their start time as configured and how much later they start (see "jitter")
+        self.flows = []
+
+    def __repr__(self):
+        return "CompiledScenario(" + repr(self.name) + ", " + str(len(self.steps)) + " steps)"
+
+
+## This method reads the scenario in `path`, with the keys in `overrides` replaced
+def load_scenario(path, **overrides):
+    with open(path) as scenario_file:
+        scenario = json.load(scenario_file)
+
+    if not isinstance(scenario, dict):
+        raise ScenarioError(path + ": a scenario should be a JSON object")
+
+    scenario.update(overrides)
+    return scenario
+
+
+## This method returns the scenario with the defaults of its topology filled in
+def with_defaults(scenario):
+    scenario = copy.deepcopy(scenario)
+    for key, value in DEFAULTS.get(scenario.get("topology"), {}).items():
+        scenario.setdefault(key, copy.deepcopy(value))
+
+    if scenario.get("topology") == "chain" and isinstance(scenario.get("flows"), list):
+        for flow in scenario["flows"]:
+            if isinstance(flow, dict):
+                for key, value in FLOW_DEFAULTS.items():
+                    flow.setdefault(key, value)
+
+    if scenario.get("topology") == "dumbbell" and "name" not in scenario:
+        scenario["name"] = "tcp_" + str(scenario.get("flows")) + str(scenario.get("direction"))
+
+    return scenario
+
+
+## This method returns the hash identifying a scenario: two scenarios that only differ in the
+## order of their keys or in spelling out default values have the same hash
+def scenario_key(scenario):
+    canonical = json.dumps(with_defaults(scenario), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+## This method checks a scenario (with its defaults filled in) and raises a `ScenarioError`
+## listing all that is wrong with it
+def validate(scenario):
+    errors = []
+
+    def check_type(where, value, types, what):
+        if not isinstance(types, tuple):
+            types = (types,)
+        # JSON booleans are not numbers
+        if not isinstance(value, types) or isinstance(value, bool) and bool not in types:
+            errors.append(where + " should be " + what + ", not " + json.dumps(value))
+            return False
+        return True
+
+    topology = scenario.get("topology")
+    if topology not in DEFAULTS:
+        raise ScenarioError("'topology' should be one of " + ", ".join(sorted(DEFAULTS)) + ", not " + json.dumps(topology))
+
+    allowed = set(DEFAULTS[topology]) | {"name", "topology", "flows", "aqm"}
+    for key in sorted(set(scenario) - allowed):
+        errors.append("unknown key '" + key + "' for a " + topology + " scenario")
+
+    check_type("'name'", scenario.get("name"), str, "a string")
+
+    if topology == "chain":
+        for link in ("access", "bottleneck"):
+            if check_type("'" + link + "'", scenario[link], dict, "an object"):
+                for key in ("bandwidth", "delay"):
+                    check_type("'" + link + "." + key + "'", scenario[link].get(key), str, "a string")
+
+        for key in ("aqm", "reverse_aqm"):
+            if scenario[key] is not None:
+                check_type("'" + key + "'", scenario[key], str, "a string or null")
+
+        if check_type("'networks'", scenario["networks"], list, "a list"):
+            if len(scenario["networks"]) != 3:
+                errors.append("'networks' should list the three networks of the chain")
+            for network in scenario["networks"]:
+                try:
+                    ipaddress.ip_network(network)
+                except (TypeError, ValueError):
+                    errors.append("'networks' has an invalid network " + json.dumps(network))
+
+        flows = scenario.get("flows")
+        if not check_type("'flows'", flows, list, "a list") or not flows:
+            errors.append("a chain scenario needs at least one flow")
+            flows = []
+
+        for i, flow in enumerate(flows):
+            where = "flow " + str(i)
+            if not check_type(where, flow, dict, "an object"):
+                continue
+
+            for key in sorted(set(flow) - set(FLOW_DEFAULTS) - {"protocol", "src", "dst"}):
+                errors.append(where + " has an unknown key '" + key + "'")
+
+            if flow.get("protocol") not in ("tcp", "udp"):
+                errors.append(where + ": 'protocol' should be \"tcp\" or \"udp\"")
+            if flow.get("src") not in ("h1", "h2") or flow.get("dst") not in ("h1", "h2"):
+                errors.append(where + ": 'src' and 'dst' should be \"h1\" or \"h2\"")
+            elif flow["src"] == flow["dst"]:
+                errors.append(where + ": 'src' and 'dst' are the same host")
+
+            # NeST takes the start and stop times of flows in whole seconds
+            if check_type(where + ": 'start'", flow["start"], int, "a whole number of seconds") and check_type(
+                where + ": 'stop'", flow["stop"], int, "a whole number of seconds"
+            ):
+                if not 0 <= flow["start"] < flow["stop"]:
+                    errors.append(where + ": should have 0 <= 'start' < 'stop'")
+
+            if check_type(where + ": 'streams'", flow["streams"], int, "an integer") and flow["streams"] < 1:
+                errors.append(where + ": 'streams' should be at least 1")
+
+            if flow.get("protocol") == "tcp":
+                check_type(where + ": 'cc'", flow["cc"], str, "a string")
+            elif flow.get("protocol") == "udp":
+                check_type(where + ": 'target_bandwidth'", flow["target_bandwidth"], str, "a string")
+
+    else:
+        if scenario.get("direction") not in ("up", "down"):
+            errors.append("'direction' should be \"up\" or \"down\"")
+        if check_type("'flows'", scenario.get("flows"), int, "an integer") and scenario["flows"] < 1:
+            errors.append("'flows' should be at least 1")
+        check_type("'aqm'", scenario.get("aqm"), str, "a string (e.g. given with --set aqm=...)")
+        check_type("'cc'", scenario["cc"], str, "a string")
+        if check_type("'duration'", scenario["duration"], int, "a whole number of seconds") and scenario["duration"] <= 0:
+            errors.append("'duration' should be positive")
+        check_type("'batched'", scenario["batched"], bool, "true or false")
+        if check_type("'flows_per_host'", scenario["flows_per_host"], int, "an integer") and scenario["flows_per_host"] < 1:
+            errors.append("'flows_per_host' should be at least 1")
+
+    adaptive = scenario["adaptive"]
+    if adaptive is not None and check_type("'adaptive'", adaptive, dict, "an object or null"):
+        for key in sorted(set(adaptive) - set(ADAPTIVE_KEYS)):
+            errors.append("'adaptive' has an unknown key '" + key + "'")
+        for key in sorted(set(adaptive) & set(ADAPTIVE_KEYS)):
+            if check_type("'adaptive." + key + "'", adaptive[key], (int, float), "a number") and adaptive[key] <= 0:
+                errors.append("'adaptive." + key + "' should be positive")
+
+    jitter = scenario["jitter"]
+    if jitter is not None and check_type("'jitter'", jitter, dict, "an object or null"):
+        if set(jitter) != {"seed", "max"}:
+            errors.append("'jitter' should have a 'seed' and a 'max'")
+        else:
+            check_type("'jitter.seed'", jitter["seed"], int, "an integer")
+            if check_type("'jitter.max'", jitter["max"], (int, float), "a number") and jitter["max"] < 0:
+                errors.append("'jitter.max' should not be negative")
+
+    if errors:
+        raise ScenarioError(str(scenario.get("name")) + ": " + "; ".join(errors))
+
+
+## This method validates and compiles `scenario`, or returns it from the cache
+def compile_scenario(scenario):
+    key = scenario_key(scenario)
+    if key in _compiled:
+        return _compiled[key]
+
+    scenario = with_defaults(scenario)
+    validate(scenario)
+
+    compiled = CompiledScenario(scenario["name"], scenario["topology"], key, scenario)
+    if scenario["topology"] == "chain":
+        _compile_chain(scenario, compiled.steps, compiled.flows)
+    else:
+        _compile_dumbbell(scenario, compiled.steps, compiled.flows)
+
+    _compiled[key] = compiled
+    return compiled
+
+
+# Interfaces are referred to as (link, end), e.g. ("r1-r2", 0) is the `r1` end of the bottleneck.
+# The steps are the same NeST calls the chain scripts used to make one by one, and the addresses
+# are the ones `AddressHelper` assigned them: the n-th interface of a network gets its n-th host.
+def _compile_chain(scenario, steps, flows):
+    steps.append(("node", "h1"))
+    steps.append(("node", "h2"))
+    steps.append(("router", "r1"))
+    steps.append(("router", "r2"))
+
+    links = [("h1-r1", "h1", "r1"), ("r1-r2", "r1", "r2"), ("r2-h2", "r2", "h2")]
+    for (link, node1, node2), network in zip(links, scenario["networks"]):
+        hosts = ipaddress.ip_network(network).hosts()
+        prefixlen = "/" + str(ipaddress.ip_network(network).prefixlen)
+        steps.append(("connect", link, node1, node2))
+        steps.append(("address", (link, 0), str(next(hosts)) + prefixlen))
+        steps.append(("address", (link, 1), str(next(hosts)) + prefixlen))
+
+    access = scenario["access"]
+    bottleneck = scenario["bottleneck"]
+
+    # `h1` --> `r1` --> `r2` --> `h2`
+    steps.append(("attributes", ("h1-r1", 0), access["bandwidth"], access["delay"], None))
+    steps.append(("attributes", ("r1-r2", 0), bottleneck["bandwidth"], bottleneck["delay"], scenario["aqm"]))
+    steps.append(("attributes", ("r2-h2", 0), access["bandwidth"], access["delay"], None))
+
+    # `h2` --> `r2` --> `r1` --> `h1`
+    steps.append(("attributes", ("r2-h2", 1), access["bandwidth"], access["delay"], None))
+    steps.append(("attributes", ("r1-r2", 1), bottleneck["bandwidth"], bottleneck["delay"], scenario["reverse_aqm"]))
+    steps.append(("attributes", ("h1-r1", 1), access["bandwidth"], access["delay"], None))
+
+    steps.append(("route", "h1", ("h1-r1", 0)))
+    steps.append(("route", "h2", ("r2-h2", 1)))
+    steps.append(("route", "r1", ("r1-r2", 0)))
+    steps.append(("route", "r2", ("r1-r2", 1)))
+
+    steps.append(("experiment", scenario["name"]))
+
+    delays = start_delays(scenario["jitter"], len(scenario["flows"]))
+    host_interface = {"h1": ("h1-r1", 0), "h2": ("r2-h2", 1)}
+    for (flow, delay) in zip(scenario["flows"], delays):
+        # Flows keep their duration, which the tools only take in whole seconds
+        endpoints = (
+            flow["src"], flow["dst"], host_interface[flow["dst"]], flow["start"] + delay, flow["stop"] + delay,
+            flow["streams"],
+        )
+        if flow["protocol"] == "tcp":
+            steps.append(("tcp_flow",) + endpoints + (flow["cc"],))
+        else:
+            steps.append(("udp_flow",) + endpoints + (flow["target_bandwidth"],))
+        flows.append({
+            "src": flow["src"], "dst": flow["dst"], "protocol": flow["protocol"],
+            "cc": flow["cc"] if flow["protocol"] == "tcp" else None, "start": flow["start"], "delay": delay,
+        })
+
+    steps.append(("run", scenario["adaptive"]))
+
+
+def _compile_dumbbell(scenario, steps, flows):
+    from tcp_up_down import host_streams
+
+    # One start time for every pair of nodes
+    pairs = len(host_streams(scenario["flows"], scenario["flows_per_host"]))
+    start_times = start_delays(scenario["jitter"], pairs)
+
+    # Flows go from the left nodes to the right ones ("up") or the other way round
+    (src, dst) = ("left-node-", "right-node-") if scenario["direction"] == "up" else ("right-node-", "left-node-")
+    for (i, delay) in enumerate(start_times):
+        flows.append({
+            "src": src + str(i), "dst": dst + str(i), "protocol": "tcp", "cc": scenario["cc"], "start": 0,
+            "delay": delay,
+        })
+
+    steps.append(("dumbbell", scenario["flows"], scenario["aqm"], scenario["batched"], scenario["flows_per_host"]))
+    steps.append((
+        "dumbbell_experiment", scenario["direction"], scenario["flows"], scenario["cc"], scenario["name"],
+        scenario["duration"], start_times,
+    ))
+    steps.append(("run", scenario["adaptive"]))
+
+
+## This method returns the bottleneck rate of `scenario` and the number of directions its flows use it in
+def bottleneck_capacity(scenario):
+    if scenario["topology"] == "dumbbell":
+        return (DUMBBELL_BOTTLENECK["bandwidth"], 1)
+    return (scenario["bottleneck"]["bandwidth"], len(set(flow["src"] for flow in scenario["flows"])))
+
+
+## This method returns the start delays of `count` flows under `jitter` (all 0 without jitter)
+# NeST runs a flow for its stop time minus its start time, which netperf takes in whole seconds.
+# Delays are rounded to 1/1024 s (about a millisecond), a binary fraction, so that adding one to
+# the whole-second start and stop times of a flow and subtracting them again is exact.
+def start_delays(jitter, count):
+    if jitter is None:
+        return [0] * count
+
+    generator = random.Random(jitter["seed"])
+    return [round(generator.uniform(0, jitter["max"]) * 1024) / 1024 for _ in range(count)]
+
+
+## This method makes the NeST calls of a compiled scenario and returns the folder its results were packed in
+# `dumbbells`, if given, is called as dumbbells(flows, AQM, batched, flows_per_host) for the dumbbell of
+# the scenario in place of `build_dumbbell`, e.g. to hand out an already built one (see `emulation_daemon.py`).
+# `on_step`, if given, is called with the operation of every step before it is made.
+def execute(compiled, dumbbells=None, on_step=None):
+    from nest.experiment import Experiment, Flow
+    from nest.experiment.pack import Pack
+    from nest.topology import Node, Router, connect
+    from adaptive import SteadyState, run_adaptive
+    from host_monitor import run_monitored
+    from tcp_up_down import build_dumbbell, tcp_down_experiment, tcp_up_experiment
+
+    nodes = {}
+    interfaces = {}
+    dumbbell = None
+    experiment = None
+
+    if dumbbells is None:
+        def dumbbells(flows, AQM, batched, flows_per_host):
+            return build_dumbbell(flows, AQM, batched, flows_per_host=flows_per_host)
+
+    for step in compiled.steps:
+        operation = step[0]
+        if on_step is not None:
+            on_step(operation)
+
+        if operation == "node":
+            nodes[step[1]] = Node(step[1])
+        elif operation == "router":
+            nodes[step[1]] = Router(step[1])
+        elif operation == "connect":
+            (interfaces[(step[1], 0)], interfaces[(step[1], 1)]) = connect(nodes[step[2]], nodes[step[3]])
+        elif operation == "address":
+            interfaces[step[1]].set_address(step[2])
+        elif operation == "attributes":
+            if step[4] is None:
+                interfaces[step[1]].set_attributes(step[2], step[3])
+            else:
+                interfaces[step[1]].set_attributes(step[2], step[3], step[4])
+        elif operation == "route":
+            nodes[step[1]].add_route("DEFAULT", interfaces[step[2]])
+        elif operation == "experiment":
+            experiment = Experiment(step[1])
+        elif operation in ("tcp_flow", "udp_flow"):
+            (src, dst, dst_interface, start, stop, streams, option) = step[1:]
+            flow = Flow(nodes[src], nodes[dst], interfaces[dst_interface].get_address(), start, stop, streams)
+            if operation == "tcp_flow":
+                experiment.add_tcp_flow(flow, option)
+            else:
+                experiment.add_udp_flow(flow, target_bandwidth=option)
+        elif operation == "dumbbell":
+            dumbbell = dumbbells(step[1], step[2], step[3], step[4])
+        elif operation == "dumbbell_experiment":
+            (direction, flows, congestion_algorithm, name, duration, start_times) = step[1:]
+            if direction == "up":
+                experiment = tcp_up_experiment(dumbbell, flows, congestion_algorithm, name, duration, start_times)
+            else:
+                experiment = tcp_down_experiment(dumbbell, flows, congestion_algorithm, name, duration, start_times)
+        elif operation == "run":
+            if step[1] is None:
+                run_monitored(experiment.run, bottleneck_capacity(compiled.scenario))
+            else:
+                run_monitored(
+                    functools.partial(run_adaptive, experiment, SteadyState(**step[1])),
+                    bottleneck_capacity(compiled.scenario),
+                )
+
+    write_record(Pack.FOLDER, compiled)
+    return Pack.FOLDER
+
+
+## This method writes what was run (`compiled`) to the `scenario.json` of the dump in `folder`, for the
+## tools that read the dump later (e.g. `results_db.py`), along with the id its namespaces are named
+## after (see `teardown.py`)
+def write_record(folder, compiled):
+    from nest.topology import TOPOLOGY_ID
+
+    with open(os.path.join(folder, "scenario.json"), "w") as scenario_file:
+        json.dump(
+            {
+                "scenario": compiled.scenario, "key": compiled.key, "kernel": platform.release(),
+                "topology_id": TOPOLOGY_ID, "flows": compiled.flows,
+            },
+            scenario_file, indent=4,
+        )
+
+
+## This method deletes the namespaces of the last scenario, so that the next one starts afresh.
+## NeST otherwise only deletes them when the interpreter exits.
+def teardown():
+    from nest.clean_up import delete_namespaces
+    from nest.topology_map import TopologyMap
+
+    delete_namespaces()
+    TopologyMap.delete_all_mapping()
+
+
+## This method deletes the namespaces in `ids` only, leaving the rest of the topology in place,
+## e.g. one of several topologies built by the same process
+def release_namespaces(ids):
+    from nest.topology_map import TopologyMap
+    from batch_build import BatchError
+    from teardown import remove_namespaces
+
+    ids = set(ids)
+    (inodes, errors) = remove_namespaces(ids)
+    if errors:
+        raise BatchError("; ".join(errors))
+
+    # `TopologyMap` points at every namespace by its position in the list, which changes here
+    pointers = TopologyMap.namespaces_pointer
+    namespaces = [namespace for namespace in TopologyMap.get_namespaces() if namespace["id"] not in ids]
+    TopologyMap.topology_map["namespaces"] = namespaces
+    TopologyMap.namespaces_pointer = {}
+    for (position, namespace) in enumerate(namespaces):
+        TopologyMap.namespaces_pointer[namespace["id"]] = {
+            "pos": position,
+            "interfaces_pointer": pointers[namespace["id"]]["interfaces_pointer"],
+        }
+
+    for kind in ("hosts", "routers"):
+        TopologyMap.topology_map[kind] = [node for node in TopologyMap.topology_map[kind] if node.id not in ids]
+
+
+## This method runs the scenario in `path`, with the keys in `overrides` replaced
+def run_scenario_file(path, **overrides):
+    return execute(compile_scenario(load_scenario(path, **overrides)))
+
+
+## This method returns the (path, overrides) of the scenarios in a scenario or batch file
+def read_batch(path, overrides):
+    with open(path) as batch_file:
+        content = json.load(batch_file)
+
+    if isinstance(content, dict):
+        return [(path, dict(overrides))]
+
+    entries = []
+    for entry in content:
+        entry = dict(entry)
+        # Scenario paths in a batch are relative to the batch file
+        scenario_path = os.path.join(os.path.dirname(path), entry.pop("scenario"))
+        entry.update(overrides)
+        entries.append((scenario_path, entry))
+    return entries
+
+
+## This method parses "key=value" overrides, with values in JSON (or plain strings)
+def parse_overrides(assignments):
+    overrides = {}
+    for assignment in assignments:
+        (key, value) = assignment.split("=", 1)
+        try:
+            overrides[key] = json.loads(value)
+        except ValueError:
+            overrides[key] = value
+    return overrides
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run scenario files in a single process")
+    parser.add_argument("files", nargs="+", help="scenario or batch files")
+    parser.add_argument("--set", nargs="+", default=[], metavar="KEY=VALUE", help="override keys of every scenario")
+    parser.add_argument("--check", action="store_true", help="only validate and compile the scenarios")
+    parser.add_argument("--timing", action="store_true", help="write the phase timings of every experiment to its dump")
+    parser.add_argument("--profile", choices=["cprofile", "pyinstrument"], help="also profile the Python side")
+    args = parser.parse_args()
+
+    overrides = parse_overrides(args.set)
+
+    # Every scenario is compiled (and so validated) before the first one runs
+    batch = []
+    for path in args.files:
+        for (scenario_path, scenario_overrides) in read_batch(path, overrides):
+            try:
+                batch.append(compile_scenario(load_scenario(scenario_path, **scenario_overrides)))
+            except (ScenarioError, OSError, ValueError) as error:
+                sys.exit(scenario_path + ": " + str(error))
+
+    if args.check:
+        for compiled in batch:
+            print(compiled.name + ": " + str(len(compiled.steps)) + " steps")
+        return
+
+    # The namespaces of every scenario are deleted in parallel, and checked for leftovers
+    from teardown import parallel_teardown
+
+    parallel_teardown()
+
+    if args.timing or args.profile:
+        from phase_timer import instrument
+
+        try:
+            instrument(args.profile)
+        except ImportError as error:
+            sys.exit(str(error))
+
+    for i, compiled in enumerate(batch):
+        if i > 0:
+            teardown()
+        print("Running " + compiled.name + " (" + str(i + 1) + "/" + str(len(batch)) + ")")
+        print("Results in " + execute(compiled))
+
+
+if __name__ == "__main__":
+    main()
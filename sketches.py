@@ -0,0 +1,517 @@
+# SPDX-License-Identifier: GPL-2.0-only
+# Copyright (c) 2019-2022 NITK Surathkal
+
+import argparse
+import glob
+import json
+import math
+import os
+import sys
+import tempfile
+from array import array
+
+## This program contains summaries of streams of samples in a fixed amount of memory, which
+## can be merged across flows and runs and still answer percentiles.
+#
+# `HdrHistogram` is a high dynamic range histogram of integer values (e.g. latencies in us):
+# its buckets double in width every `2 * 10^digits` values, so every recorded value is kept
+# with `digits` significant decimal digits, between 1 and `highest`, in a few thousand counters.
+# Its layout is the one of HdrHistogram (http://hdrhistogram.org/).
+#
+# `TDigest` is a t-digest of real values (e.g. rates): a few hundred weighted centroids that
+# are small near the extremes, so the tail percentiles stay accurate.
+#
+# `stream_sketches()` makes every collector feed the samples of every flow into such sketches as
+# it takes them (`METRICS` lists which), which are written to `sketches.json` in the dump:
+#
+#   {tool: {flow: {metric: sketch}}}
+#
+# with flows named as in `summary.py` ("<namespace> -> <destination>"). Percentiles across flows
+# and runs then come from merging sketches, rather than loading all the samples again:
+#
+#   python sketches.py <dump> [<dump> ...] [--tool ping] [--metric rtt] [--flows left-node-0]
+#                      [--percentiles 50 99]
+
+
+## A histogram of the integers from 1 to `highest` with `digits` significant digits
+class HdrHistogram:
+
+    def __init__(self, highest, digits=2):
+        if not 1 <= digits <= 5:
+            raise ValueError("digits should be between 1 and 5")
+
+        self.highest = int(highest)
+        self.digits = digits
+
+        # Every bucket is split in `sub_bucket_count` sub-buckets, of which the first half
+        # overlaps the previous bucket (except in the first one)
+        self.sub_bucket_half_count_magnitude = max(math.ceil(math.log2(2 * 10 ** digits)), 1) - 1
+        self.sub_bucket_count = 1 << (self.sub_bucket_half_count_magnitude + 1)
+        self.sub_bucket_half_count = self.sub_bucket_count >> 1
+        self.sub_bucket_mask = self.sub_bucket_count - 1
+
+        bucket_count = 1
+        smallest_untrackable = self.sub_bucket_count
+        while smallest_untrackable <= self.highest:
+            smallest_untrackable <<= 1
+            bucket_count += 1
+
+        self.counts = array("Q", bytes(8 * (bucket_count + 1) * self.sub_bucket_half_count))
+        self.total = 0
+        # Values recorded above `highest` (counted as `highest`)
+        self.overflows = 0
+        self.minimum = None
+        self.maximum = None
+
+    # Returns the index of the counter of `value`
+    def _index(self, value):
+        bucket = (value | self.sub_bucket_mask).bit_length() - (self.sub_bucket_half_count_magnitude + 1)
+        sub_bucket = value >> bucket
+        return ((bucket + 1) << self.sub_bucket_half_count_magnitude) + sub_bucket - self.sub_bucket_half_count
+
+    # Returns the (lowest value, width) of the values counted at `index`
+    def _range(self, index):
+        bucket = (index >> self.sub_bucket_half_count_magnitude) - 1
+        sub_bucket = (index & (self.sub_bucket_half_count - 1)) + self.sub_bucket_half_count
+        if bucket < 0:
+            sub_bucket -= self.sub_bucket_half_count
+            bucket = 0
+        return (sub_bucket << bucket, 1 << bucket)
+
+    ## Records `value` (rounded to an integer) `count` times
+    def record(self, value, count=1):
+        value = int(value)
+        if value > self.highest:
+            value = self.highest
+            self.overflows += count
+        elif value < 0:
+            value = 0
+        self.counts[self._index(value)] += count
+        self.total += count
+        if self.minimum is None or value < self.minimum:
+            self.minimum = value
+        if self.maximum is None or value > self.maximum:
+            self.maximum = value
+
+    ## Adds the counts of `other`, a histogram of the same range and precision
+    def merge(self, other):
+        if (other.highest, other.digits) != (self.highest, self.digits):
+            raise ValueError("Only histograms of the same range and precision can be merged")
+        for (index, count) in enumerate(other.counts):
+            if count:
+                self.counts[index] += count
+        self.total += other.total
+        self.overflows += other.overflows
+        for value in (other.minimum, other.maximum):
+            if value is not None:
+                self.minimum = value if self.minimum is None else min(self.minimum, value)
+                self.maximum = value if self.maximum is None else max(self.maximum, value)
+
+    ## Returns the value below which `q` percent of the recorded values fall, None if there are none.
+    # Values are reported as the middle of the range they were counted in.
+    def percentile(self, q):
+        if not self.total:
+            return None
+        if q >= 100:
+            return self.maximum
+        rank = max(1, math.ceil(q / 100 * self.total))
+        seen = 0
+        for (index, count) in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                (lowest, width) = self._range(index)
+                return min(max(lowest + width // 2, self.minimum), self.maximum)
+        return self.maximum
+
+    ## Returns the mean of the recorded values
+    def mean(self):
+        if not self.total:
+            return None
+        total = 0
+        for (index, count) in enumerate(self.counts):
+            if count:
+                (lowest, width) = self._range(index)
+                total += count * (lowest + width // 2)
+        return total / self.total
+
+    ## Returns the histogram as a dict that can be written to JSON (only the non-zero counters)
+    def to_dict(self):
+        return {
+            "type": "hdr", "highest": self.highest, "digits": self.digits, "total": self.total,
+            "overflows": self.overflows, "min": self.minimum, "max": self.maximum,
+            "counts": [[index, count] for (index, count) in enumerate(self.counts) if count],
+        }
+
+    ## Returns the histogram written by `to_dict()`
+    @classmethod
+    def from_dict(cls, data):
+        histogram = cls(data["highest"], data["digits"])
+        for (index, count) in data["counts"]:
+            histogram.counts[index] = count
+        histogram.total = data["total"]
+        histogram.overflows = data["overflows"]
+        histogram.minimum = data["min"]
+        histogram.maximum = data["max"]
+        return histogram
+
+
+## A t-digest of real values (e.g. rates): at most about `compression` centroids, which are
+## smaller near the extremes, so that the tails keep their precision
+# This is the merging t-digest of Dunning and Ertl (https://arxiv.org/abs/1902.04023): values are
+# buffered, and the buffer is merged into the centroids when it fills up. The centroids are sized
+# with their k1 scale function, here k(q) = compression / pi * asin(2q - 1): every centroid spans at
+# most 1 of k, whose range is `compression`. So there are at most about `compression` of them,
+# however many values are recorded (or digests merged).
+class TDigest:
+
+    def __init__(self, compression=100):
+        self.compression = compression
+        self.centroids = []
+        self.buffer = []
+        self.total = 0.0
+        self.minimum = None
+        self.maximum = None
+
+    ## Records `value` with weight `count`
+    def record(self, value, count=1):
+        value = float(value)
+        if value != value:
+            return
+        self.buffer.append((value, count))
+        self.total += count
+        if self.minimum is None or value < self.minimum:
+            self.minimum = value
+        if self.maximum is None or value > self.maximum:
+            self.maximum = value
+        if len(self.buffer) >= 5 * self.compression:
+            self._compress()
+
+    # Returns the weight below which the centroid starting after `merged` of the weight may end,
+    # i.e. where k grows by 1
+    def _limit(self, merged):
+        q = min(max(2 * merged / self.total - 1, -1.0), 1.0)
+        k = self.compression / math.pi * math.asin(q) + 1
+        if k >= self.compression / 2:
+            return self.total
+        return self.total * (math.sin(k * math.pi / self.compression) + 1) / 2
+
+    # Merges the buffer into the centroids
+    def _compress(self):
+        if not self.buffer:
+            return
+        items = sorted(self.centroids + self.buffer)
+        self.buffer = []
+
+        centroids = []
+        (mean, weight) = items[0]
+        merged = 0.0
+        limit = self._limit(merged)
+        for (item_mean, item_weight) in items[1:]:
+            proposed = weight + item_weight
+            if merged + proposed <= limit:
+                mean += (item_mean - mean) * item_weight / proposed
+                weight = proposed
+            else:
+                centroids.append((mean, weight))
+                merged += weight
+                limit = self._limit(merged)
+                (mean, weight) = (item_mean, item_weight)
+        centroids.append((mean, weight))
+        self.centroids = centroids
+
+    ## Adds the values of `other`
+    def merge(self, other):
+        other._compress()
+        self.buffer.extend(other.centroids)
+        self.total += other.total
+        for value in (other.minimum, other.maximum):
+            if value is not None:
+                self.minimum = value if self.minimum is None else min(self.minimum, value)
+                self.maximum = value if self.maximum is None else max(self.maximum, value)
+        self._compress()
+
+    ## Returns the value below which `q` percent of the recorded values fall, None if there are none
+    def percentile(self, q):
+        self._compress()
+        if not self.total:
+            return None
+        if q <= 0:
+            return self.minimum
+        if q >= 100:
+            return self.maximum
+
+        # Every centroid stands for its weight around its mean: interpolate between the
+        # middles of the centroids on either side of the rank, or with the min and max at the ends
+        rank = q / 100 * self.total
+        (previous_rank, previous_mean) = (0.0, self.minimum)
+        seen = 0.0
+        for (mean, weight) in self.centroids:
+            middle = seen + weight / 2
+            if rank < middle:
+                return previous_mean + (mean - previous_mean) * (rank - previous_rank) / (middle - previous_rank)
+            (previous_rank, previous_mean) = (middle, mean)
+            seen += weight
+        return previous_mean + (self.maximum - previous_mean) * (rank - previous_rank) / (self.total - previous_rank)
+
+    ## Returns the mean of the recorded values
+    def mean(self):
+        self._compress()
+        if not self.total:
+            return None
+        return sum(mean * weight for (mean, weight) in self.centroids) / self.total
+
+    ## Returns the digest as a dict that can be written to JSON
+    def to_dict(self):
+        self._compress()
+        return {
+            "type": "tdigest", "compression": self.compression, "total": self.total,
+            "min": self.minimum, "max": self.maximum, "centroids": [list(centroid) for centroid in self.centroids],
+        }
+
+    ## Returns the digest written by `to_dict()`
+    @classmethod
+    def from_dict(cls, data):
+        digest = cls(data["compression"])
+        digest.centroids = [tuple(centroid) for centroid in data["centroids"]]
+        digest.total = data["total"]
+        digest.minimum = data["min"]
+        digest.maximum = data["max"]
+        return digest
+
+
+## This method returns the sketch written by the `to_dict()` of a `HdrHistogram` or a `TDigest`
+def sketch_from_dict(data):
+    if data["type"] == "hdr":
+        return HdrHistogram.from_dict(data)
+    return TDigest.from_dict(data)
+
+
+## Largest delay (us) the histograms record exactly; larger ones are counted as this
+HIGHEST_DELAY = 10_000_000
+
+## Compression of the digests, i.e. about how many centroids they keep (about 0.5% off at p99)
+COMPRESSION = 200
+
+## Metrics sketched for every tool: {field: (sketch type, scale)}, where the samples' values are
+## multiplied by `scale` before being recorded (e.g. delays are recorded in us rather than ms)
+METRICS = {
+    "ping": {"rtt": ("hdr", 1000)},
+    "netperf": {"sending_rate": ("tdigest", 1)},
+    "iperf3": {"sending_rate": ("tdigest", 1)},
+    "ss": {"rtt": ("hdr", 1000), "cwnd": ("tdigest", 1), "delivery_rate": ("tdigest", 1)},
+    "qdisc": {"backlog": ("tdigest", 1), "delay": ("hdr", 1000)},
+    "latency": {"rtt": ("hdr", 1000), "up": ("hdr", 1000), "down": ("hdr", 1000)},
+}
+
+# Directory the collectors' processes leave their sketches in until the dump is written,
+# None while sketches are not streamed
+_spool = None
+
+
+## This method returns an empty sketch of `kind` ("hdr" or "tdigest")
+def new_sketch(kind):
+    if kind == "hdr":
+        return HdrHistogram(HIGHEST_DELAY)
+    return TDigest(COMPRESSION)
+
+
+## This method returns the empty {metric: sketch} of one flow of `tool`
+def new_sketches(tool):
+    return {metric: new_sketch(kind) for (metric, (kind, scale)) in METRICS[tool].items()}
+
+
+## This method records one sample ({field: value}, in the units of the dumps) of a flow of `tool`
+## in its `sketches` (from `new_sketches()`)
+# The values that are missing or not numbers are skipped.
+def record_sample(tool, sketches, sample):
+    for (metric, (kind, scale)) in METRICS[tool].items():
+        try:
+            value = float(sample[metric]) * scale
+        except (KeyError, TypeError, ValueError):
+            continue
+        if not math.isnan(value):
+            sketches[metric].record(value)
+
+
+## This method returns the {metric: sketch} of the samples of one flow of `tool`
+# The meta item is skipped.
+def sketch_samples(tool, samples):
+    sketches = new_sketches(tool)
+    for sample in samples:
+        if not sample.get("meta"):
+            record_sample(tool, sketches, sample)
+    return sketches
+
+
+## This method adds `flows` ({flow: {metric: sketch}}) of `tool` to `sketches.json` in `dump`,
+## merging them with the sketches of the same flow and metric already there
+def add_sketches(dump, tool, flows):
+    path = os.path.join(dump, "sketches.json")
+    stored = {}
+    if os.path.isfile(path):
+        with open(path) as sketches_file:
+            stored = json.load(sketches_file)
+
+    tool_sketches = stored.setdefault(tool, {})
+    for (flow, metrics) in flows.items():
+        flow_sketches = tool_sketches.setdefault(flow, {})
+        for (metric, sketch) in metrics.items():
+            if metric in flow_sketches:
+                merged = sketch_from_dict(flow_sketches[metric])
+                merged.merge(sketch)
+                sketch = merged
+            flow_sketches[metric] = sketch.to_dict()
+
+    with open(path, "w") as sketches_file:
+        json.dump(stored, sketches_file)
+
+
+## This method returns whether `stream_sketches()` was called
+def sketches_enabled():
+    return _spool is not None
+
+
+## This method returns the name of the flow from the namespace `ns_id` to `destination` (and `port`),
+## as in `summary.py`
+def flow_name(ns_id, destination, port=None):
+    from nest.topology_map import TopologyMap
+
+    name = TopologyMap.get_namespace(ns_id)["name"] + " -> " + destination
+    if port is not None:
+        name += ":" + str(port)
+    return name
+
+
+## This method leaves `flows` ({flow: {metric: sketch}}) of `tool` in the spool, for `Experiment.run()`
+## to add to the dump
+# Collectors call it from the processes NeST forks for them, once they are done sampling.
+def spool_sketches(tool, flows):
+    (fd, path) = tempfile.mkstemp(prefix=tool + "-", suffix=".json", dir=_spool)
+    with os.fdopen(fd, "w") as spool_file:
+        json.dump({flow: {metric: sketch.to_dict() for (metric, sketch) in metrics.items()}
+                   for (flow, metrics) in flows.items()}, spool_file)
+
+
+# Spools the sketches of the flows of one `add_result()` of `tool`
+# `result` is {destination: samples}, or {destination: {port: samples}} for ss and iperf3.
+def _spool_result(tool, ns_id, result):
+    flows = {}
+    for (destination, samples) in result.items():
+        if isinstance(samples, dict):
+            for (port, port_samples) in samples.items():
+                flows[flow_name(ns_id, destination, port)] = sketch_samples(tool, port_samples)
+        else:
+            flows[flow_name(ns_id, destination)] = sketch_samples(tool, samples)
+    spool_sketches(tool, flows)
+
+
+# Adds the spooled sketches to `sketches.json` in `dump`, and empties the spool
+def _write_spool(dump):
+    for path in sorted(glob.glob(os.path.join(_spool, "*.json"))):
+        tool = os.path.basename(path).split("-", 1)[0]
+        with open(path) as spool_file:
+            flows = json.load(spool_file)
+        os.remove(path)
+        add_sketches(dump, tool, {
+            flow: {metric: sketch_from_dict(sketch) for (metric, sketch) in metrics.items()}
+            for (flow, metrics) in flows.items()
+        })
+
+
+## This method makes every collector stream the samples of every flow into the sketches of `METRICS`,
+## which `Experiment.run()` then writes to `sketches.json` in the dump
+# The collectors of this repository record every sample in the sketches as they take it, and
+# never hold the samples for them: the `tcp_info` collector spools its sketches once it is done
+# sampling, the qdisc sampler and the latency prober add theirs when they write their outputs.
+# The tools NeST runs and parses itself (ping, netperf, iperf3 and `ss`) only hand their samples
+# over once parsed, a flow at a time, to `<Tool>Results.add_result()` in the processes NeST forks
+# for them: every flow is sketched there and spooled. The spool is merged into the dump once NeST
+# has written its own outputs.
+def stream_sketches():
+    global _spool
+    from nest.experiment import run_exp
+    from nest.experiment.results import Iperf3Results, NetperfResults, PingResults, SsResults
+    from nest.experiment.pack import Pack
+
+    if _spool is not None:
+        return
+    _spool = tempfile.mkdtemp(prefix="sketches-")
+
+    def spooled(tool, add_result):
+        def add_and_spool(ns_id, result):
+            add_result(ns_id, result)
+            _spool_result(tool, ns_id, result)
+        # For the collectors that sketched their samples already
+        add_and_spool.sketches_original = add_result
+        return staticmethod(add_and_spool)
+
+    PingResults.add_result = spooled("ping", PingResults.add_result)
+    NetperfResults.add_result = spooled("netperf", NetperfResults.add_result)
+    Iperf3Results.add_result = spooled("iperf3", Iperf3Results.add_result)
+    SsResults.add_result = spooled("ss", SsResults.add_result)
+
+    dump_json_ouputs = run_exp.dump_json_ouputs
+
+    def dump_with_sketches():
+        dump_json_ouputs()
+        _write_spool(Pack.FOLDER)
+
+    run_exp.dump_json_ouputs = dump_with_sketches
+
+
+## This method returns the sketch of `metric` of `tool` merged over the flows of all the `dumps`
+## (only the flows whose name contains `flows`, if given), and the number of flows merged
+def merge_sketches(dumps, tool, metric, flows=None):
+    merged = None
+    count = 0
+    for dump in dumps:
+        path = os.path.join(dump, "sketches.json")
+        if not os.path.isfile(path):
+            continue
+        with open(path) as sketches_file:
+            stored = json.load(sketches_file)
+        for (flow, metrics) in stored.get(tool, {}).items():
+            if metric not in metrics or (flows is not None and flows not in flow):
+                continue
+            sketch = sketch_from_dict(metrics[metric])
+            if merged is None:
+                merged = sketch
+            else:
+                merged.merge(sketch)
+            count += 1
+    return (merged, count)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge the sketches of experiments and print their percentiles")
+    parser.add_argument("dumps", nargs="+", help="dump directories with a sketches.json")
+    parser.add_argument("--tool", choices=sorted(METRICS), help="only this tool's metrics")
+    parser.add_argument("--metric", help="only this metric")
+    parser.add_argument("--flows", help="only the flows whose name contains this")
+    parser.add_argument("--percentiles", type=float, nargs="+", default=[50, 90, 99, 99.9])
+    args = parser.parse_args()
+
+    for dump in args.dumps:
+        if not os.path.isdir(dump):
+            sys.exit(dump + ": not a dump directory")
+
+    for (tool, metrics) in METRICS.items():
+        if args.tool is not None and tool != args.tool:
+            continue
+        for (metric, (kind, scale)) in metrics.items():
+            if args.metric is not None and metric != args.metric:
+                continue
+            (sketch, count) = merge_sketches(args.dumps, tool, metric, args.flows)
+            if sketch is None or not sketch.total:
+                continue
+            # Values are printed in the samples' units
+            percentiles = ", ".join(
+                "p%g %.6g" % (q, sketch.percentile(q) / scale) for q in args.percentiles
+            )
+            print("%s %s: %d flows, %d samples, mean %.6g, %s" % (
+                tool, metric, count, sketch.total, sketch.mean() / scale, percentiles
+            ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,474 @@
+# SPDX-License-Identifier: GPL-2.0-only
+# Copyright (c) 2019-2022 NITK Surathkal
+
+# This program summarizes the dump of an experiment (the `<name>(<timestamp>)_dump` directory
+# written by `Experiment.run()`) the way flent summarizes its runs:
+#
+#   goodput:          mean goodput of every flow and their sum (netperf), the "totals" series
+#                     (sum of the flows at every `--step` seconds), the box (min, quartiles, max)
+#                     of every flow, and Jain's fairness index of the flows' mean goodputs
+#   rtt:              percentiles and CDF of the RTT of all the ping samples, the percentiles of
+#                     every ping flow, and the latency inflation: how much every sample exceeds
+#                     the base (smallest) RTT of its flow, in ms and as a ratio
+#   retransmissions:  retransmitted segments of every TCP socket (ss), over the segments it sent
+#   queues:           backlog, drops, ECN marks and sojourn time of the bottleneck's qdiscs,
+#                     when they were sampled (see `qdisc_sampler.py`)
+#   latency:          percentiles of the RTT and one-way delays of the UDP probes, and their
+#                     loss, when the latency was probed (see `latency_prober.py`)
+#   host:             whether the host, rather than the bottleneck, limited the run (see `host_monitor.py`)
+#
+# Every tool's samples are loaded into flat NumPy arrays, one element per sample with the index
+# of its flow alongside, and every metric is computed on all the flows at once.
+#
+# NeST does not sample the retransmissions by default: call `sample_retransmissions()` before
+# `Experiment.run()` for `ss` to record them. The netlink collector of `tcp_info.py` always does.
+#
+# Usage:
+#   python summary.py <dump> [<dump> ...] [--step 1.0] [--output summary.json]
+#
+# NumPy is needed (`pip install numpy`).
+
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+
+## RTT percentiles reported, for all samples and for every flow
+RTT_PERCENTILES = [50, 90, 95, 99, 99.9]
+
+## Quantiles of a box: min, first quartile, median, third quartile, max
+BOX = [0, 25, 50, 75, 100]
+
+## Fields of every tool's samples that are loaded
+FIELDS = {
+    "netperf": ["timestamp", "sending_rate"],
+    "iperf3": ["timestamp", "sending_rate"],
+    "ping": ["timestamp", "rtt"],
+    "ss": ["timestamp", "retrans", "segs_out"],
+    "qdisc": ["timestamp", "qlen", "backlog", "drops", "ecn_mark", "delay"],
+}
+
+## Percentiles of the backlog and sojourn time of the qdiscs
+QUEUE_PERCENTILES = [50, 95, 99]
+
+
+## This method makes NeST's `ss` sampling record the retransmissions of every socket
+def sample_retransmissions():
+    from nest.experiment.parser.ss import SsRunner
+
+    for param in ("retrans", "segs_out"):
+        if param not in SsRunner.param_list:
+            SsRunner.param_list.append(param)
+
+
+## Samples of one tool: the index of the flow of every sample in `flow`,
+## and the values of every field in `columns`
+class Series:
+
+    def __init__(self, names, flow, columns):
+        self.names = names
+        self.flow = flow
+        self.columns = columns
+
+    def __len__(self):
+        return len(self.flow)
+
+
+# Returns the float in a sample's field, NaN if it is missing.
+# ss reports retransmissions as "<unrecovered>/<total>": the total is kept.
+def _number(value):
+    if value is None or value == "":
+        return np.nan
+    if isinstance(value, str) and "/" in value:
+        value = value.rsplit("/", 1)[1]
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+## This method loads the samples of `tool` in `dump` as a `Series`, or None if it was not run
+def load_series(dump, tool):
+    path = os.path.join(dump, tool + ".json")
+    if not os.path.isfile(path):
+        return None
+
+    fields = FIELDS[tool]
+
+    # Every sample is turned into a tuple of floats as soon as it is parsed, so the parsed
+    # JSON holds no dict per sample. NeST's "meta" items become None.
+    def sample(item):
+        if item.get("meta"):
+            return None
+        if "timestamp" not in item:
+            return item
+        return tuple(_number(item.get(field)) for field in fields)
+
+    with open(path) as stats_file:
+        stats = json.load(stats_file, object_hook=sample)
+
+    names = []
+    arrays = []
+    for (name, samples) in _flows(tool, stats):
+        samples = [values for values in samples if values is not None]
+        if samples:
+            names.append(name)
+            arrays.append(np.array(samples, dtype=np.float64))
+    del stats
+
+    if not arrays:
+        return Series(names, np.empty(0, dtype=np.intp), {field: np.empty(0) for field in fields})
+
+    flow = np.repeat(np.arange(len(arrays)), [len(array) for array in arrays])
+    values = np.concatenate(arrays)
+    return Series(names, flow, {field: values[:, i] for (i, field) in enumerate(fields)})
+
+
+# Yields the (name, samples) of every flow of a tool's parsed dump
+def _flows(tool, stats):
+    for (ns_name, ns_stats) in stats.items():
+        for flow_stats in ns_stats:
+            for (destination, samples) in flow_stats.items():
+                if tool == "ss":
+                    # ss samples are further split by the port of every socket
+                    for (port, port_samples) in samples.items():
+                        yield (ns_name + " -> " + destination + ":" + port, port_samples)
+                else:
+                    yield (ns_name + " -> " + destination, samples)
+
+
+## This method returns the `qs` percentiles (0 to 100) of the values of every group,
+## as an array of shape (groups, len(qs)); NaN values are ignored, empty groups give NaN.
+# Same linear interpolation as `run_stats.percentile()`, on all the groups at once.
+def group_percentiles(group, values, groups, qs):
+    valid = ~np.isnan(values)
+    (group, values) = (group[valid], values[valid])
+    qs = np.asarray(qs, dtype=np.float64)
+
+    result = np.full((groups, len(qs)), np.nan)
+    sizes = np.bincount(group, minlength=groups)
+    if not len(values):
+        return result
+
+    ordered = values[np.lexsort((values, group))]
+    starts = np.cumsum(sizes) - sizes
+
+    present = sizes > 0
+    (sizes, starts) = (sizes[present, None], starts[present, None])
+    positions = (sizes - 1) * qs / 100
+    lower = np.floor(positions).astype(np.intp)
+    upper = np.minimum(lower + 1, sizes - 1)
+    low = ordered[starts + lower]
+    high = ordered[starts + upper]
+    result[present] = low + (high - low) * (positions - lower)
+    return result
+
+
+## This method returns the mean of the values of every group (NaN for empty groups)
+def group_means(group, values, groups):
+    valid = ~np.isnan(values)
+    sums = np.bincount(group[valid], weights=values[valid], minlength=groups)
+    counts = np.bincount(group[valid], minlength=groups)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return sums / counts
+
+
+## This method returns Jain's fairness index of `values`: 1 when they are all equal, 1/n when one takes all
+def jain_index(values):
+    values = np.asarray(values, dtype=np.float64)
+    values = values[~np.isnan(values)]
+    squares = np.sum(values * values)
+    if not len(values) or squares == 0:
+        return None
+    return float(np.sum(values) ** 2 / (len(values) * squares))
+
+
+# Returns a float that can be written to JSON (None for NaN)
+def _value(value):
+    value = float(value)
+    return None if np.isnan(value) else value
+
+
+# Returns {"p<q>": value} for percentiles `qs` and their `values`
+def _percentiles(qs, values):
+    return {"p%g" % q: _value(value) for (q, value) in zip(qs, values)}
+
+
+## This method returns the goodput metrics of a netperf (or iperf3) `Series`
+# The "totals" series sums the goodput of all the flows over every `step` seconds; a flow
+# contributes the mean of its samples in that step, so flows sampled at different instants add up.
+def goodput_summary(series, step=1.0):
+    count = len(series.names)
+    goodput = series.columns["sending_rate"]
+    means = group_means(series.flow, goodput, count)
+    boxes = group_percentiles(series.flow, goodput, count, BOX)
+
+    valid = ~np.isnan(goodput) & ~np.isnan(series.columns["timestamp"])
+    timestamps = series.columns["timestamp"][valid]
+    totals = np.empty(0)
+    if len(timestamps):
+        steps = ((timestamps - timestamps.min()) // step).astype(np.intp)
+        steps_count = int(steps.max()) + 1
+        # Mean of every (flow, step), then sum of the flows of every step
+        cell = series.flow[valid] * steps_count + steps
+        cell_means = group_means(cell, goodput[valid], count * steps_count).reshape(count, steps_count)
+        totals = np.nansum(cell_means, axis=0)
+        # Steps during which no flow was sampled
+        totals = totals[~np.all(np.isnan(cell_means), axis=0)]
+
+    flows = {}
+    for (i, name) in enumerate(series.names):
+        flows[name] = {"mean": _value(means[i]), "box": [_value(value) for value in boxes[i]]}
+
+    return {
+        "unit": "Mbps",
+        "aggregate": _value(np.nansum(means)) if count else None,
+        "fairness": jain_index(means),
+        "totals": {
+            "step": step,
+            "mean": _value(totals.mean()) if len(totals) else None,
+            "box": [_value(value) for value in np.percentile(totals, BOX)] if len(totals) else None,
+        },
+        "flows": flows,
+    }
+
+
+## This method returns the RTT metrics of a ping `Series`
+def rtt_summary(series, cdf_points=100):
+    count = len(series.names)
+    rtt = series.columns["rtt"]
+    valid = ~np.isnan(rtt)
+    (flow, rtt) = (series.flow[valid], rtt[valid])
+    if not len(rtt):
+        return {"unit": "ms", "percentiles": None, "cdf": [], "inflation": None, "flows": {}}
+
+    flow_percentiles = group_percentiles(flow, rtt, count, [0] + RTT_PERCENTILES)
+    base = flow_percentiles[:, 0]
+
+    # Inflation of every sample over the base RTT of its flow
+    inflation = rtt - base[flow]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        ratio = rtt / base[flow]
+    ratio = ratio[np.isfinite(ratio)]
+
+    # ping CDF: the RTT below which every fraction of the samples falls
+    fractions = np.linspace(0, 1, cdf_points + 1)
+    cdf = np.quantile(rtt, fractions)
+
+    flows = {}
+    for (i, name) in enumerate(series.names):
+        flows[name] = dict(base=_value(base[i]), **_percentiles(RTT_PERCENTILES, flow_percentiles[i, 1:]))
+
+    return {
+        "unit": "ms",
+        "mean": _value(rtt.mean()),
+        "percentiles": _percentiles(RTT_PERCENTILES, np.percentile(rtt, RTT_PERCENTILES)),
+        "cdf": [[_value(value), _value(fraction)] for (value, fraction) in zip(cdf, fractions)],
+        "inflation": {
+            "mean": _value(inflation.mean()),
+            "percentiles": _percentiles(RTT_PERCENTILES, np.percentile(inflation, RTT_PERCENTILES)),
+            "ratio": _percentiles(RTT_PERCENTILES, np.percentile(ratio, RTT_PERCENTILES)) if len(ratio) else None,
+        },
+        "flows": flows,
+    }
+
+
+## This method returns the retransmission metrics of an ss `Series`, or None if they were not sampled
+# `retrans` and `segs_out` are counters: a socket's share is their increase over its samples.
+def retransmission_summary(series):
+    count = len(series.names)
+    retrans = series.columns["retrans"]
+    segments = series.columns["segs_out"]
+    if not count or np.all(np.isnan(retrans)):
+        return None
+
+    # Largest minus smallest value of every socket's counters
+    retrans_range = group_percentiles(series.flow, retrans, count, [0, 100])
+    segments_range = group_percentiles(series.flow, segments, count, [0, 100])
+    retransmits = np.nan_to_num(retrans_range[:, 1] - retrans_range[:, 0])
+    sent = segments_range[:, 1] - segments_range[:, 0]
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        rates = np.where(sent > 0, retransmits / sent, np.nan)
+
+    total_sent = np.nansum(sent)
+    flows = {}
+    for (i, name) in enumerate(series.names):
+        flows[name] = {"retransmits": int(retransmits[i]), "segments": _value(sent[i]), "rate": _value(rates[i])}
+
+    return {
+        "retransmits": int(retransmits.sum()),
+        "segments": _value(total_sent),
+        "rate": _value(retransmits.sum() / total_sent) if total_sent > 0 else None,
+        "flows": flows,
+    }
+
+
+## This method returns the metrics of every qdisc in a qdisc `Series`
+# `drops` and `ecn_mark` are counters: a qdisc's are their increase over its samples.
+def queue_summary(series):
+    count = len(series.names)
+    columns = series.columns
+    backlog = group_percentiles(series.flow, columns["backlog"], count, QUEUE_PERCENTILES + [100])
+    qlen = group_percentiles(series.flow, columns["qlen"], count, QUEUE_PERCENTILES + [100])
+    delay = group_percentiles(series.flow, columns["delay"], count, QUEUE_PERCENTILES + [100])
+    drops = group_percentiles(series.flow, columns["drops"], count, [0, 100])
+    marks = group_percentiles(series.flow, columns["ecn_mark"], count, [0, 100])
+
+    queues = {}
+    for (i, name) in enumerate(series.names):
+        queues[name] = {
+            "backlog_bytes": dict(_percentiles(QUEUE_PERCENTILES, backlog[i, :-1]), max=_value(backlog[i, -1])),
+            "backlog_packets": dict(_percentiles(QUEUE_PERCENTILES, qlen[i, :-1]), max=_value(qlen[i, -1])),
+            "drops": _value(drops[i, 1] - drops[i, 0]),
+            "ecn_marks": _value(marks[i, 1] - marks[i, 0]),
+            # Only for the AQMs that report it
+            "delay_ms": (
+                dict(_percentiles(QUEUE_PERCENTILES, delay[i, :-1]), max=_value(delay[i, -1]))
+                if not np.isnan(delay[i, -1]) else None
+            ),
+        }
+    return queues
+
+
+## This method returns the summary of the `Series` of every tool in `series` (as {tool: Series})
+def summarize_series(series, step=1.0, cdf_points=100):
+    summary = {"flows": 0, "samples": sum(len(tool_series) for tool_series in series.values())}
+
+    for tool in ("netperf", "iperf3"):
+        if tool in series and series[tool].names:
+            summary[tool] = goodput_summary(series[tool], step)
+            summary["flows"] += len(series[tool].names)
+    if "ping" in series:
+        summary["ping"] = rtt_summary(series["ping"], cdf_points)
+    if "ss" in series:
+        summary["retransmissions"] = retransmission_summary(series["ss"])
+    if "qdisc" in series:
+        summary["queues"] = queue_summary(series["qdisc"])
+
+    return summary
+
+
+## This method loads the samples of every tool in `dump`, as {tool: Series}
+def load_dump(dump):
+    series = {}
+    for tool in FIELDS:
+        tool_series = load_series(dump, tool)
+        if tool_series is not None:
+            series[tool] = tool_series
+    return series
+
+
+## This method returns the latency metrics of the UDP probes in `dump`, or None if it was not probed.
+# They come from the HDR histograms of the whole run (see `latency_prober.py`), not from the raw
+# trace, which only holds the last probes.
+def latency_summary(dump):
+    from sketches import HdrHistogram
+
+    path = os.path.join(dump, "latency.json")
+    if not os.path.isfile(path):
+        return None
+    with open(path) as latency_file:
+        stats = json.load(latency_file)
+
+    kinds = ("rtt", "up", "down")
+    merged = {}
+    flows = {}
+    (sent, lost) = (0, 0)
+    for (name, samples) in _flows("latency", stats):
+        meta = samples[0]
+        sent += meta["sent"]
+        lost += meta["lost"]
+        flows[name] = {"loss": meta["lost"] / meta["sent"] if meta["sent"] else None}
+        for kind in kinds:
+            histogram = HdrHistogram.from_dict(meta["histograms"][kind])
+            flows[name][kind] = _histogram_percentiles(histogram)
+            if kind in merged:
+                merged[kind].merge(histogram)
+            else:
+                merged[kind] = histogram
+
+    summary = {"unit": "ms", "sent": sent, "lost": lost, "loss": lost / sent if sent else None, "flows": flows}
+    for kind in kinds:
+        summary[kind] = _histogram_percentiles(merged[kind]) if kind in merged else None
+    return summary
+
+
+# Returns the mean and the `RTT_PERCENTILES` of a histogram of delays in us, in ms
+def _histogram_percentiles(histogram):
+    if not histogram.total:
+        return None
+    percentiles = {"p%g" % q: histogram.percentile(q) / 1000 for q in RTT_PERCENTILES}
+    return dict(percentiles, mean=histogram.mean() / 1000, max=histogram.maximum / 1000)
+
+
+## This method returns the summary of the dump in `dump`
+def summarize(dump, step=1.0, cdf_points=100):
+    summary = {"dump": dump}
+    summary.update(summarize_series(load_dump(dump), step, cdf_points))
+
+    latency = latency_summary(dump)
+    if latency is not None:
+        summary["latency"] = latency
+
+    # The verdict of the host monitor (see `host_monitor.py`), if it ran
+    host_path = os.path.join(dump, "host.json")
+    if os.path.isfile(host_path):
+        with open(host_path) as host_file:
+            host = json.load(host_file)
+        summary["host"] = {
+            "host_limited": host["host_limited"], "overloaded": host["overloaded"],
+            "throughput_ratio": host["throughput_ratio"],
+        }
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize the dumps of experiments")
+    parser.add_argument("dumps", nargs="+", help="dump directories written by Experiment.run()")
+    parser.add_argument("--step", type=float, default=1.0, help="seconds summed over in the goodput totals")
+    parser.add_argument("--cdf-points", type=int, default=100, help="points of the RTT CDF")
+    parser.add_argument("--output", help="file the summaries are written to (JSON)")
+    args = parser.parse_args()
+
+    summaries = []
+    for dump in args.dumps:
+        if not os.path.isdir(dump):
+            sys.exit(dump + ": not a dump directory")
+        summary = summarize(dump, args.step, args.cdf_points)
+        summaries.append(summary)
+
+        print(dump + ": " + str(summary["flows"]) + " flows, " + str(summary["samples"]) + " samples")
+        goodput = summary.get("netperf")
+        if goodput is not None and goodput["aggregate"] is not None:
+            print("  goodput:  %.3f Mbps in total, fairness %.3f" % (goodput["aggregate"], goodput["fairness"] or 0))
+        rtt = summary.get("ping")
+        if rtt is not None and rtt["percentiles"] is not None:
+            print("  rtt:      p50 %.3f ms, p99 %.3f ms, p99 inflation %.3f ms" % (
+                rtt["percentiles"]["p50"], rtt["percentiles"]["p99"], rtt["inflation"]["percentiles"]["p99"]
+            ))
+        retransmissions = summary.get("retransmissions")
+        if retransmissions is not None:
+            print("  retrans:  %d segments (rate %s)" % (retransmissions["retransmits"], retransmissions["rate"]))
+        latency = summary.get("latency")
+        if latency is not None and latency["rtt"] is not None:
+            print("  probes:   rtt p50 %.3f ms, p99 %.3f ms, one-way p99 %.3f/%.3f ms, loss %.4f" % (
+                latency["rtt"]["p50"], latency["rtt"]["p99"], latency["up"]["p99"], latency["down"]["p99"],
+                latency["loss"] or 0,
+            ))
+        for (name, queue) in summary.get("queues", {}).items():
+            print("  queue:    %s: p99 backlog %s bytes, %s drops, %s ECN marks" % (
+                name, queue["backlog_bytes"]["p99"], queue["drops"], queue["ecn_marks"]
+            ))
+        if summary.get("host", {}).get("host_limited"):
+            print("  host-limited (" + ", ".join(summary["host"]["overloaded"]) + "): not a valid run")
+
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(summaries if len(summaries) > 1 else summaries[0], output_file, indent=4)
+
+
+if __name__ == "__main__":
+    main()
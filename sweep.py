@@ -0,0 +1,176 @@
+# SPDX-License-Identifier: GPL-2.0-only
+# Copyright (c) 2019-2022 NITK Surathkal
+
+########################
+# SHOULD BE RUN AS ROOT
+########################
+
+# This program runs a matrix of "TCP upload" or "TCP download" experiments (AQMs x flow counts x
+# congestion control algorithms) on a single dumbbell.
+#
+# `tcp_nup.py fq_codel 8` followed by `tcp_nup.py pie 8` builds and tears down the same dumbbell
+# twice just to change the AQM of the bottleneck. Here the dumbbell is built once, for the largest
+# flow count of the sweep, and between experiments:
+#   - the AQM on both ends of the bottleneck is replaced in place (`set_bottleneck_aqm`), which also
+#     starts it with empty queues and zeroed statistics,
+#   - the TCP metrics cached by the previous experiment are flushed (`reset_tcp_state`),
+#   - experiments with fewer flows only use the first nodes of the dumbbell.
+#
+# Usage:
+#   python sweep.py up --aqm fq_codel pie codel --flows 1 2 4 8 [--cc cubic reno]
+#                      [--batched] [--flows-per-host K] [--log sweep.jsonl]
+#                      [--adaptive [--min-duration 20] [--window 10] [--precision 0.05]]
+#                      [--timing [--profile cprofile|pyinstrument]] [--qdisc-interval MS]
+#                      [--tcp-info-interval MS] [--latency-interval MS] [--sketches]
+#
+# With `--adaptive`, every experiment stops as soon as its flows are in a steady state
+# (see `adaptive.py`), after at least `--min-duration` and at most 200 seconds.
+#
+# Every experiment is named after its point of the matrix, e.g. "tcp_8up-pie-cubic", and a line
+# with its parameters, timings and results folder is appended to the `--log` file.
+#
+# With `--qdisc-interval`, the AQM of the bottleneck is sampled every that many milliseconds (1 to
+# 10), and its backlog, drops and marks are written to every dump (see `qdisc_sampler.py`).
+# With `--tcp-info-interval`, the TCP sockets are sampled every that many milliseconds over netlink
+# (see `tcp_info.py`) rather than by NeST's `ss` polling. With `--latency-interval`, the
+# latency across the dumbbell is also probed every that many milliseconds (see `latency_prober.py`).
+# With `--sketches`, every dump also gets the percentile sketches of every flow, which
+# `sketches.py` merges across the experiments of the sweep.
+
+import argparse
+import functools
+import json
+import platform
+import sys
+import time
+
+from nest.experiment.pack import Pack
+from nest.topology import TOPOLOGY_ID
+from adaptive import SteadyState, run_adaptive
+from host_monitor import run_monitored
+from sketches import stream_sketches
+from tcp_info import collected_run
+from teardown import parallel_teardown
+from tcp_up_down import (
+    ROUTER_ROUTER_BANDWIDTH,
+    build_dumbbell,
+    probed_run,
+    reset_tcp_state,
+    sampled_run,
+    set_bottleneck_aqm,
+    tcp_down_experiment,
+    tcp_up_experiment,
+)
+
+
+## This method runs one experiment of the sweep and returns its log entry
+# `criterion` is the `SteadyState` of the adaptive mode, None to run the flows to their end
+# `qdisc_interval` is the interval the bottleneck's qdiscs are sampled at, None not to sample them,
+# `latency_interval` the interval the latency is probed at, None not to probe it, and
+# `tcp_info_interval` the interval the TCP sockets are sampled at over netlink, None to run `ss`
+def run_point(dumbbell, direction, AQM, NO_TCP_FLOWS, congestion_algorithm, criterion=None, qdisc_interval=None,
+              latency_interval=None, tcp_info_interval=None):
+
+    exp_name = "tcp_" + str(NO_TCP_FLOWS) + direction + "-" + AQM + "-" + congestion_algorithm
+    if direction == "up":
+        experiment = tcp_up_experiment(dumbbell, NO_TCP_FLOWS, congestion_algorithm, exp_name)
+    else:
+        experiment = tcp_down_experiment(dumbbell, NO_TCP_FLOWS, congestion_algorithm, exp_name)
+
+    start = time.time()
+    if criterion is None:
+        run = probed_run(collected_run(experiment.run, tcp_info_interval), dumbbell, direction, latency_interval)
+        (result, host) = run_monitored(sampled_run(run, dumbbell, qdisc_interval), (ROUTER_ROUTER_BANDWIDTH, 1))
+        adaptive = None
+    else:
+        run = collected_run(functools.partial(run_adaptive, experiment, criterion), tcp_info_interval)
+        run = probed_run(run, dumbbell, direction, latency_interval)
+        (record, host) = run_monitored(sampled_run(run, dumbbell, qdisc_interval), (ROUTER_ROUTER_BANDWIDTH, 1))
+        adaptive = {"reason": record["reason"], "stop_time": record["stop_time"]}
+    stop = time.time()
+
+    return {
+        "experiment": exp_name,
+        # The id the namespaces of the sweep are named after (see `teardown.py`)
+        "topology_id": TOPOLOGY_ID,
+        "direction": direction,
+        "aqm": AQM,
+        "flows": NO_TCP_FLOWS,
+        "cc": congestion_algorithm,
+        "kernel": platform.release(),
+        "start": start,
+        "duration": stop - start,
+        # Set by `Experiment.run()` to the folder the results were packed in
+        "results": Pack.FOLDER,
+        "adaptive": adaptive,
+        # Whether the host, rather than the bottleneck, limited the experiment (see `host_monitor.py`)
+        "host_limited": host["host_limited"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run an AQM x flows x congestion control sweep on one dumbbell")
+    parser.add_argument("direction", choices=["up", "down"])
+    parser.add_argument("--aqm", nargs="+", required=True)
+    parser.add_argument("--flows", type=int, nargs="+", required=True)
+    parser.add_argument("--cc", nargs="+", default=["cubic"])
+    parser.add_argument("--batched", action="store_true")
+    parser.add_argument("--flows-per-host", type=int, default=1)
+    parser.add_argument("--log", default="sweep.jsonl", help="file the experiments of the sweep are logged to")
+    parser.add_argument("--adaptive", action="store_true", help="stop every experiment once it is in a steady state")
+    parser.add_argument("--min-duration", type=float, default=20)
+    parser.add_argument("--window", type=float, default=10, help="seconds the steady state is judged on")
+    parser.add_argument("--precision", type=float, default=0.05, help="relative confidence interval, e.g. 0.05 for 5%%")
+    parser.add_argument("--timing", action="store_true", help="write the phase timings of every experiment to its dump")
+    parser.add_argument("--profile", choices=["cprofile", "pyinstrument"], help="also profile the Python side")
+    parser.add_argument("--qdisc-interval", type=float, default=0,
+                        help="ms between samples of the bottleneck's qdiscs (0 not to sample them)")
+    parser.add_argument("--tcp-info-interval", type=float, default=0,
+                        help="ms between samples of the TCP sockets over netlink (0 to run ss instead)")
+    parser.add_argument("--latency-interval", type=float, default=0, help="ms between latency probes (0 not to probe)")
+    parser.add_argument("--sketches", action="store_true", help="write the percentile sketches of every flow to the dumps")
+    args = parser.parse_args()
+
+    if args.sketches:
+        stream_sketches()
+    parallel_teardown()
+
+    if args.timing or args.profile:
+        from phase_timer import instrument
+
+        try:
+            instrument(args.profile)
+        except ImportError as error:
+            sys.exit(str(error))
+
+    criterion = None
+    if args.adaptive:
+        criterion = SteadyState(args.min_duration, args.window, args.precision)
+
+    # The dumbbell is built once, with the first AQM and for the largest number of flows
+    start = time.time()
+    dumbbell = build_dumbbell(max(args.flows), args.aqm[0], args.batched, flows_per_host=args.flows_per_host)
+    print("Dumbbell built in %.1f s" % (time.time() - start))
+
+    first = True
+    for AQM in args.aqm:
+        for NO_TCP_FLOWS in args.flows:
+            for congestion_algorithm in args.cc:
+                if not first:
+                    # (Re)installing the AQM gives every experiment fresh queues and statistics,
+                    # not only the first experiment of every AQM
+                    set_bottleneck_aqm(dumbbell, AQM)
+                    reset_tcp_state(dumbbell)
+                first = False
+
+                entry = run_point(
+                    dumbbell, args.direction, AQM, NO_TCP_FLOWS, congestion_algorithm, criterion,
+                    args.qdisc_interval / 1000 or None, args.latency_interval / 1000 or None,
+                    args.tcp_info_interval / 1000 or None,
+                )
+                with open(args.log, "a") as log:
+                    log.write(json.dumps(entry) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+# SPDX-License-Identifier: GPL-2.0-only
+# Copyright (c) 2019-2022 NITK Surathkal
+
+########################
+# SHOULD BE RUN AS ROOT
+########################
+
+import socket
+import struct
+import tempfile
+import time
+from array import array
+
+from netlink_socket import NETLINK_SOCK_DIAG, NetlinkSocket, parse_attributes
+from sketches import flow_name, new_sketches, record_sample, sketches_enabled, spool_sketches
+
+## This program contains a collector of TCP socket stats that replaces NeST's `ss` polling.
+#
+# NeST fills the `ss` stats by running `ss -i` every 0.2 seconds in a shell loop, once per
+# (namespace, destination), and parsing its text output afterwards. Every sample forks `ss`
+# (and `date` and `sleep`), and those processes compete for the CPU with the flows measured.
+#
+# A `TcpInfoCollector` instead keeps one netlink socket open in every namespace flows start from,
+# and every `interval` seconds asks the kernel for the `tcp_info` of all its TCP sockets with
+# one INET_DIAG dump (what `ss -i` does underneath). The samples of the sockets to the
+# destinations being measured are decoded into a flat array of floats, which is written to
+# disk every `FLUSH_SAMPLES` samples rather than growing for the whole experiment.
+#
+# Once the experiment is over, the samples are handed to NeST as `ss` would have been: same
+# fields, units and string values, keyed by destination and port, so `ss.json`, the `ss`
+# plots and `summary.py` are unchanged. The retransmissions ("retrans") and segments sent
+# ("segs_out") are always recorded. With `stream_sketches()`, every sample is also recorded in the
+# sketches of its flow as it is taken (see `sketches.py`).
+#
+# `collected_run(run, interval)` makes an experiment's `run()` use the collector (for that run
+# only), as `sampled_run()` in `tcp_up_down.py` samples the qdiscs along with it. NeST's `ss`
+# polling is used otherwise.
+
+## Seconds between two samples, as NeST's `ss` iterator
+DEFAULT_INTERVAL = 0.2
+
+## Samples buffered before they are written to disk
+FLUSH_SAMPLES = 4096
+
+## Ports of the netperf and iperf3 control connections, which NeST's `ss` filter ignores
+CONTROL_PORTS = (12865, 5201)
+
+## sock_diag constants (linux/sock_diag.h, linux/inet_diag.h)
+SOCK_DIAG_BY_FAMILY = 20
+INET_DIAG_INFO = 2
+
+## TCP states whose sockets are sampled: all but LISTEN, TIME_WAIT and CLOSE
+TCP_STATES = sum(1 << state for state in (1, 2, 3, 4, 5, 8, 9, 11))
+
+INET_DIAG_REQ = struct.Struct("=BBBxI48s")
+INET_DIAG_MSG = struct.Struct("=BBBB2s2s16s16sI8sIIIII")
+
+## Fields of `struct tcp_info` (linux/tcp.h) that are recorded, by offset
+# rto, retrans, rtt, rttvar, snd_ssthresh, snd_cwnd, total_retrans,
+# pacing_rate, segs_out, delivery_rate
+TCP_INFO = struct.Struct("=8xI24xI28xIIII16xI Q24xI20xQ")
+
+## Fields of every sample: when it was taken, the index of its destination, the peer port
+## of its socket, and its `tcp_info`
+FIELDS = [
+    "timestamp", "destination", "port", "rto", "retrans", "rtt", "rttvar", "ssthresh", "cwnd",
+    "total_retrans", "pacing_rate", "segs_out", "delivery_rate",
+]
+
+
+## This method returns the `ss` sample of one row of `FIELDS` values, as NeST's `ss` parser does:
+## rtt and rto in ms, rates in Mbps, retrans as "<unrecovered>/<total>"
+def ss_sample(row):
+    sample = {
+        "timestamp": "%.9f" % row[0],
+        "cwnd": "%d" % row[8],
+        "rtt": "%g" % (row[5] / 1000),
+        "dev_rtt": "%g" % (row[6] / 1000),
+        "rto": "%g" % (row[3] / 1000),
+        "retrans": "%d/%d" % (row[4], row[9]),
+        "segs_out": "%d" % row[11],
+        "delivery_rate": str(row[12] * 8 / 1e6),
+    }
+    # `ss` leaves out the unset slow start threshold and pacing rate
+    if row[7] < 0xFFFF:
+        sample["ssthresh"] = "%d" % row[7]
+    if row[10] < 0xFFFFFFFFFFFFFFFF:
+        sample["pacing_rate"] = str(row[10] * 8 / 1e6)
+    return sample
+
+
+## This method returns the values of one row of `FIELDS` that are sketched for `ss` (see `sketches.py`),
+## in the units of `ss_sample()`
+def sketch_values(row):
+    return {"rtt": row[5] / 1000, "cwnd": row[8], "delivery_rate": row[12] * 8 / 1e6}
+
+
+## Collects the `tcp_info` of the flows from one namespace to some destinations
+class TcpInfoCollector:
+
+    # `schedules` holds the (destination address, start, stop) of the flows from `ns_id`,
+    # with the times in seconds from the start of the experiment
+    def __init__(self, ns_id, schedules, interval=DEFAULT_INTERVAL):
+        from nest.topology.address import Address
+
+        self.ns_id = ns_id
+        self.interval = interval
+        self.destinations = []
+        self.schedules = []
+        for (destination, start, stop) in schedules:
+            address = Address(destination)
+            self.destinations.append(address.get_addr(with_subnet=False))
+            self.schedules.append((start, stop, address.is_ipv6()))
+
+        # Written by `run()` and read by `parse()`, which NeST runs in two processes
+        self.out = tempfile.TemporaryFile()
+
+    ## Samples the sockets every `interval` seconds until the last flow stops
+    def run(self):
+        start = time.monotonic()
+        first = min(schedule[0] for schedule in self.schedules)
+        last = max(schedule[1] for schedule in self.schedules)
+        time.sleep(max(0.0, first - (time.monotonic() - start)))
+
+        # The socket is opened by the process NeST forked for this collector, and lives as long as it
+        sock = NetlinkSocket(NETLINK_SOCK_DIAG, self.ns_id)
+        indices = {}
+        for (i, destination) in enumerate(self.destinations):
+            family = socket.AF_INET6 if self.schedules[i][2] else socket.AF_INET
+            indices[socket.inet_pton(family, destination)] = i
+        families = sorted(set(socket.AF_INET6 if ipv6 else socket.AF_INET for (_, _, ipv6) in self.schedules))
+        requests = [
+            INET_DIAG_REQ.pack(family, socket.IPPROTO_TCP, 1 << (INET_DIAG_INFO - 1), TCP_STATES, b"")
+            for family in families
+        ]
+
+        buffer = array("d")
+        # The sketches of every (destination index, port), fed every sample rather than from the
+        # samples on disk
+        sketches = {} if sketches_enabled() else None
+        deadline = time.monotonic()
+        while True:
+            elapsed = time.monotonic() - start
+            if elapsed > last:
+                break
+
+            timestamp = time.time()
+            for request in requests:
+                for (msg_type, body) in sock.request(SOCK_DIAG_BY_FAMILY, request, dump=True):
+                    row = self._decode(body, indices, elapsed)
+                    if row is None:
+                        continue
+                    buffer.append(timestamp)
+                    buffer.extend(row)
+                    if sketches is not None:
+                        if row[:2] not in sketches:
+                            sketches[row[:2]] = new_sketches("ss")
+                        record_sample("ss", sketches[row[:2]], sketch_values((timestamp,) + row))
+
+            if len(buffer) >= FLUSH_SAMPLES * len(FIELDS):
+                buffer.tofile(self.out)
+                del buffer[:]
+
+            deadline += self.interval
+            now = time.monotonic()
+            if deadline < now:
+                # Skip the samples there was no time for, rather than bunching them up
+                deadline = now
+            time.sleep(deadline - now)
+
+        buffer.tofile(self.out)
+        self.out.flush()
+        sock.close()
+
+        if sketches is not None:
+            spool_sketches("ss", {
+                flow_name(self.ns_id, self.destinations[index], port): metrics
+                for ((index, port), metrics) in sketches.items()
+            })
+
+    # Returns the `FIELDS` (but the timestamp) of one socket, or None if it is not to be sampled
+    def _decode(self, body, indices, elapsed):
+        (family, state, timer, retrans, sport, dport, src, dst, interface, cookie, expires, rqueue, wqueue,
+         uid, inode) = INET_DIAG_MSG.unpack_from(body)
+        (sport,) = struct.unpack("!H", sport)
+        (dport,) = struct.unpack("!H", dport)
+        if sport in CONTROL_PORTS or dport in CONTROL_PORTS:
+            return None
+
+        length = 16 if family == socket.AF_INET6 else 4
+        index = indices.get(dst[:length])
+        if index is None:
+            return None
+        (flow_start, flow_stop, ipv6) = self.schedules[index]
+        if not flow_start <= elapsed <= flow_stop:
+            return None
+
+        info = parse_attributes(body, INET_DIAG_MSG.size).get(INET_DIAG_INFO)
+        if info is None or len(info) < TCP_INFO.size:
+            return None
+        return (index, dport) + TCP_INFO.unpack_from(info)
+
+    ## Hands the samples to NeST as the `ss` stats of every destination
+    def parse(self):
+        from nest.experiment.results import SsResults
+
+        self.out.seek(0)
+        values = array("d")
+        values.frombytes(self.out.read())
+
+        width = len(FIELDS)
+        stats = [{} for destination in self.destinations]
+        for offset in range(0, len(values), width):
+            row = values[offset : offset + width]
+            port = "%d" % row[2]
+            index = int(row[1])
+            if port not in stats[index]:
+                (start, stop, ipv6) = self.schedules[index]
+                stats[index][port] = [{"meta": True, "start_time": str(start), "stop_time": str(stop)}]
+            stats[index][port].append(ss_sample(row))
+
+        # The samples were sketched as they were taken, if at all (see `run()`)
+        add_result = SsResults.add_result
+        add_result = getattr(add_result, "sketches_original", add_result)
+        for (destination, destination_stats) in zip(self.destinations, stats):
+            add_result(self.ns_id, {destination: destination_stats})
+
+
+## This method returns `run` (which runs an experiment) made to collect the TCP socket stats with
+## `TcpInfoCollector`s sampling every `interval` seconds, instead of forking `ss`
+# With `interval` None, `run` is returned as it is, and NeST runs `ss`.
+def collected_run(run, interval=None):
+    if interval is None:
+        return run
+    return lambda: run_collected(run, interval)
+
+
+## This method calls `run` (which runs an experiment) with its TCP socket stats collected by
+## `TcpInfoCollector`s sampling every `interval` seconds, and returns what `run` returns
+# NeST's `ss` runners are only replaced while `run` runs, so that the experiments run afterwards
+# (or alongside, in the same interpreter) are left as they were.
+def run_collected(run, interval=DEFAULT_INTERVAL):
+    from nest.experiment import run_exp
+
+    def setup_collectors(dependency, ss_schedules):
+        # The flows from every namespace are sampled by the same collector
+        by_ns = {}
+        for ((ns_id, destination), (start, stop)) in ss_schedules.items():
+            by_ns.setdefault(ns_id, []).append((destination, start, stop))
+        return [TcpInfoCollector(ns_id, schedules, interval) for (ns_id, schedules) in by_ns.items()]
+
+    setup_ss_runners = run_exp.setup_ss_runners
+    # `phase_timer.py` times the runners it found in place, so it is told about these too
+    if hasattr(setup_ss_runners, "phase_timer_original"):
+        import phase_timer
+
+        setup_collectors = phase_timer.timer.timed("tool_setup", setup_collectors)
+
+    run_exp.setup_ss_runners = setup_collectors
+    try:
+        return run()
+    finally:
+        run_exp.setup_ss_runners = setup_ss_runners
@@ -16,4 +16,40 @@ import sys
 AQM = sys.argv[1]
 NO_TCP_FLOWS = int(sys.argv[2])
 
-tcp_up(NO_TCP_FLOWS, AQM)
\ No newline at end of file
+# Passing `--batched` after the number of flows builds the topology with `ip -batch`/`tc -batch`
+BATCHED = "--batched" in sys.argv[3:]
+
+# Passing `--verify` pings across the dumbbell before the experiment starts
+VERIFY = "--verify" in sys.argv[3:]
+
+# Passing `--flows-per-host=K` puts K flows on every node instead of one
+FLOWS_PER_HOST = 1
+for arg in sys.argv[3:]:
+    if arg.startswith("--flows-per-host="):
+        FLOWS_PER_HOST = int(arg.split("=", 1)[1])
+
+# Passing `--qdisc-interval=MS` samples the bottleneck's qdiscs every MS milliseconds (1 to 10);
+# they are not sampled otherwise
+QDISC_INTERVAL = None
+for arg in sys.argv[3:]:
+    if arg.startswith("--qdisc-interval="):
+        QDISC_INTERVAL = float(arg.split("=", 1)[1]) / 1000 or None
+
+# Passing `--tcp-info-interval=MS` samples the TCP sockets every MS milliseconds over netlink
+# (see `tcp_info.py`); NeST runs `ss` otherwise
+TCP_INFO_INTERVAL = None
+for arg in sys.argv[3:]:
+    if arg.startswith("--tcp-info-interval="):
+        TCP_INFO_INTERVAL = float(arg.split("=", 1)[1]) / 1000 or None
+
+# Passing `--latency-interval=MS` probes the latency across the dumbbell every MS milliseconds
+# (1 to 10) with UDP probes, along with `ping`
+LATENCY_INTERVAL = None
+for arg in sys.argv[3:]:
+    if arg.startswith("--latency-interval="):
+        LATENCY_INTERVAL = float(arg.split("=", 1)[1]) / 1000 or None
+
+# Passing `--sketches` writes mergeable percentile sketches of every flow to the dump
+SKETCHES = "--sketches" in sys.argv[3:]
+
+tcp_up(NO_TCP_FLOWS, AQM, BATCHED, VERIFY, FLOWS_PER_HOST, QDISC_INTERVAL, TCP_INFO_INTERVAL, LATENCY_INTERVAL, SKETCHES)
\ No newline at end of file
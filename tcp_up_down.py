@@ -7,8 +7,16 @@
 
 from nest.topology import *
 from nest.experiment import *
-from nest.topology.network import Network
-from nest.topology.address_helper import AddressHelper
+from nest.experiment.pack import Pack
+from address_plan import AddressPlan
+from batch_build import BatchError, BatchPlan
+from host_monitor import run_monitored
+from latency_prober import run_probed
+from qdisc_sampler import bottleneck_queues, run_sampled
+from scenario import DUMBBELL_ACCESS, DUMBBELL_BOTTLENECK, compile_scenario, write_record
+from sketches import stream_sketches
+from tcp_info import collected_run
+from teardown import parallel_teardown
 
 ## This program contains the methods for carrying out various "TCP upload" and "TCP download" experiments.
 
@@ -34,31 +42,106 @@ from nest.topology.address_helper import AddressHelper
 #                                                                                                               #
 #################################################################################################################
 
-## This method performs the "TCP upload" experiment 
-## i.e., sending the flows from left nodes to the right nodes 
-# Assumption: left-nodes are the clients right-nodes are the servers
+# Link attributes of the dumbbell: `h1` --> `r1` --> `r2` --> `h2`
+
+## Latencies between client-to-router and router-to-router (see `scenario.py`)
+CLIENT_ROUTER_LATENCY = DUMBBELL_ACCESS["delay"]
+ROUTER_ROUTER_LATENCY = DUMBBELL_BOTTLENECK["delay"]
+
+## Bandwidths between client-to-router and router-to-router
+CLIENT_ROUTER_BANDWIDTH = DUMBBELL_ACCESS["bandwidth"]
+ROUTER_ROUTER_BANDWIDTH = DUMBBELL_BOTTLENECK["bandwidth"]
+
+
+## This class holds the pieces of a dumbbell built by `build_dumbbell`.
+# `left_node_connections[i]` and `right_node_connections[i]` are the (node side, router side)
+# interfaces of the i-th access link, and `left_router_connection`/`right_router_connection`
+# are the two ends of the bottleneck link.
+class Dumbbell:
+
+    def __init__(self, left_router, right_router, left_nodes, right_nodes, addresses, flows_per_host):
+        self.left_router = left_router
+        self.right_router = right_router
+        self.left_nodes = left_nodes
+        self.right_nodes = right_nodes
+
+        # The `AddressPlan` the links are addressed from
+        self.addresses = addresses
+
+        # Number of flows carried by each pair of nodes
+        self.flows_per_host = flows_per_host
+
+        self.left_node_connections = []
+        self.right_node_connections = []
+        self.left_router_connection = None
+        self.right_router_connection = None
+
+        # Whether the dumbbell was configured with a `BatchPlan`
+        self.batched = False
 
-def tcp_up(NO_TCP_FLOWS, AQM):
+        # The `Lease` of the `NamespacePool` the nodes and links come from, if any (see `netns_pool.py`)
+        self.lease = None
 
-    # Creating the same number of nodes on either sides as that of the number of flows
-    TOTAL_NODES_PER_SIDE = NO_TCP_FLOWS
 
-    # Set the link attributes: `h1` --> `r1` --> `r2` --> `h2`
+## This method splits `NO_TCP_FLOWS` flows over nodes carrying (at most) `flows_per_host` flows each,
+## and returns the number of flows of every node, e.g. [4, 4, 2] for 10 flows with 4 flows per host
+def host_streams(NO_TCP_FLOWS, flows_per_host=1):
+    if flows_per_host < 1:
+        raise ValueError("flows_per_host should be at least 1")
 
-    ## Creating variables to store the latencies between client-to-router and router-to-router
-    client_router_latency = '1ms'
-    router_router_latency = '10ms'
+    streams = []
+    for first_flow in range(0, NO_TCP_FLOWS, flows_per_host):
+        streams.append(min(flows_per_host, NO_TCP_FLOWS - first_flow))
+    return streams
 
-    ## Creating variables to store the bandwidths between client-to-router and router-to-router
-    client_router_bandwidth = '1000mbit'
-    router_router_bandwidth = '10mbit'
+
+## This method creates the dumbbell topology shown above for `NO_TCP_FLOWS` flows,
+## and enables the user given queue discipline `AQM` on the link between the two routers.
+# With `batched` set, the links, addresses, routes and qdiscs are collected in a `BatchPlan` and
+# applied in a few `ip -batch`/`tc -batch` calls instead of one NeST call (and process) at a time.
+# With `verify` set, `check_forwarding` is run on the finished dumbbell.
+# With `flows_per_host` set to K, every node carries K flows instead of one, so that K times
+# fewer namespaces, veth pairs and qdiscs are needed for the same number of flows.
+# `address_pool` is the network the links are addressed from, so that dumbbells running side
+# by side can be given disjoint address spaces.
+# With `pool` (a `NamespacePool`), the nodes, routers and links are leased from the pool instead
+# of being created, and only configured (always in batches). Give them back with `pool.recycle()`.
+
+def build_dumbbell(NO_TCP_FLOWS, AQM, batched=False, verify=False, flows_per_host=1, address_pool="10.0.0.0/8",
+                   pool=None):
+
+    # Creating one node on either side for every `flows_per_host` flows
+    # (the same number of nodes as that of the number of flows by default)
+    streams = host_streams(NO_TCP_FLOWS, flows_per_host)
+    TOTAL_NODES_PER_SIDE = len(streams)
 
     # Assigning number of nodes on either sides of the dumbbell according to the input
     num_of_left_nodes = TOTAL_NODES_PER_SIDE
     num_of_right_nodes = TOTAL_NODES_PER_SIDE
 
+    # Size the networks on either side of the dumbbell for the number of nodes
+    addresses = AddressPlan(TOTAL_NODES_PER_SIDE, address_pool)
+
     ###### TOPOLOGY CREATION ######
 
+    if pool is not None:
+        lease = pool.acquire(TOTAL_NODES_PER_SIDE)
+        dumbbell = Dumbbell(
+            lease.left_router, lease.right_router, lease.left_nodes, lease.right_nodes, addresses, flows_per_host
+        )
+        dumbbell.lease = lease
+        try:
+            _configure_batched(dumbbell, AQM)
+        except BatchError:
+            # Half-configured slots cannot be recycled, the pool creates them again instead
+            pool.reset()
+            raise
+
+        if verify:
+            check_forwarding(dumbbell)
+
+        return dumbbell
+
     # Creating the routers for the dumbbell topology
     left_router = Router("left-router")
     right_router = Router("right-router")
@@ -76,102 +159,280 @@ def tcp_up(NO_TCP_FLOWS, AQM):
 
     print("Nodes and routers created")
 
-    #########  Adding connections #########
+    dumbbell = Dumbbell(left_router, right_router, left_nodes, right_nodes, addresses, flows_per_host)
 
-    # Lists of tuples to store the interfaces connecting the router and nodes
-    left_node_connections = []
-    right_node_connections = []
-    
-    # Set the IPv4 address for the networks, and not the interfaces.
-    # We will use the `AddressHelper` later to assign addresses to the interfaces.
-
-    # This network is used for all the left-nodes and the left-router, i.e., on to the left of 'r1'
-    left_network = Network("10.0.0.0/24")
-    
-    # This network is used for all the right-nodes and the right-router, i.e., on to the right of 'r2'
-    right_network = Network("10.0.1.0/24")
-
-    # This network is used for the connections between the two routers, i.e., between 'r1' and 'r2'
-    router_network = Network("10.0.2.0/24")
-
-    # Connecting left-nodes to the left-router under "left_network"
-    for i in range(num_of_left_nodes):
-        left_node_connections.append(connect(left_nodes[i], left_router, network=left_network))
+    if batched:
+        _configure_batched(dumbbell, AQM)
+    else:
+        _configure(dumbbell, AQM)
 
-    # Connecting right-nodes to the left-router under "right_network"
-    for i in range(num_of_right_nodes):
-        right_node_connections.append(connect(right_nodes[i], right_router, network=right_network))
+    if verify:
+        check_forwarding(dumbbell)
+
+    return dumbbell
+
+
+## This method checks that the dumbbell forwards packets between the two sides, by pinging
+## every right node from the corresponding left node (the reply takes the reverse path)
+def check_forwarding(dumbbell):
+
+    unreachable = []
+    for i in range(len(dumbbell.left_nodes)):
+        destination = dumbbell.right_node_connections[i][0].get_address()
+        if not dumbbell.left_nodes[i].ping(destination, verbose=False):
+            unreachable.append(dumbbell.left_nodes[i].name + " -> " + dumbbell.right_nodes[i].name)
+
+    if unreachable:
+        raise RuntimeError("Forwarding check failed for: " + ", ".join(unreachable))
+
+    print("Forwarding checked")
+
+
+## This method replaces the queue discipline on both ends of the bottleneck link with `AQM`,
+## leaving the rest of the dumbbell untouched.
+# The new qdisc starts with empty queues and zeroed statistics, so back to back experiments
+# on the same dumbbell do not see each other's queue state.
+
+def set_bottleneck_aqm(dumbbell, AQM):
+
+    if dumbbell.batched:
+        plan = BatchPlan()
+        plan.set_qdisc(dumbbell.left_router_connection, AQM)
+        plan.set_qdisc(dumbbell.right_router_connection, AQM)
+        plan.apply()
+    else:
+        dumbbell.left_router_connection.set_qdisc(AQM, ROUTER_ROUTER_BANDWIDTH)
+        dumbbell.right_router_connection.set_qdisc(AQM, ROUTER_ROUTER_BANDWIDTH)
+
+
+## This method resets the per-connection state the previous experiment left on the dumbbell.
+# The experiment's processes are gone once `Experiment.run()` returns, along with their sockets
+# and socket buffers, but the kernel still caches the TCP metrics (ssthresh, RTT, ...) of every
+# destination, which would seed the next experiment's connections. This flushes them on every node.
+
+def reset_tcp_state(dumbbell):
+
+    plan = BatchPlan()
+    for node in [dumbbell.left_router, dumbbell.right_router] + dumbbell.left_nodes + dumbbell.right_nodes:
+        plan.flush_tcp_metrics(node)
+    plan.apply()
+
+
+## This method connects, addresses, routes and shapes the dumbbell one NeST call at a time
+def _configure(dumbbell, AQM):
 
-    # Connecting the two routers 'r1' and 'r2' under "router_network"
-    (left_router_connection, right_router_connection) = connect(left_router, right_router, network=router_network)
+    left_router = dumbbell.left_router
+    right_router = dumbbell.right_router
+    left_nodes = dumbbell.left_nodes
+    right_nodes = dumbbell.right_nodes
 
-    # Assign IPv4 addresses to all the interfaces in the network.
-    AddressHelper.assign_addresses()
+    #########  Adding connections #########
+
+    # Lists of tuples to store the interfaces connecting the router and nodes
+    left_node_connections = dumbbell.left_node_connections
+    right_node_connections = dumbbell.right_node_connections
+
+    # The addresses come from the dumbbell's `AddressPlan`: the left-nodes and the left-router use
+    # its left network, i.e., on to the left of 'r1' (10.0.0.0/24 for up to 128 nodes), and the
+    # right-nodes and the right-router its right network, i.e., on to the right of 'r2'.
+    # Each access link gets its own /31 of these.
+    addresses = dumbbell.addresses
+
+    # Connecting left-nodes to the left-router
+    for i in range(len(left_nodes)):
+        connection = connect(left_nodes[i], left_router)
+        (node_address, router_address) = addresses.left_link(i)
+        connection[0].set_address(node_address)
+        connection[1].set_address(router_address)
+        left_node_connections.append(connection)
+
+    # Connecting right-nodes to the right-router
+    for i in range(len(right_nodes)):
+        connection = connect(right_nodes[i], right_router)
+        (node_address, router_address) = addresses.right_link(i)
+        connection[0].set_address(node_address)
+        connection[1].set_address(router_address)
+        right_node_connections.append(connection)
+
+    # Connecting the two routers 'r1' and 'r2' under the plan's router network
+    (left_router_connection, right_router_connection) = connect(left_router, right_router)
+    (left_address, right_address) = addresses.router_link()
+    left_router_connection.set_address(left_address)
+    right_router_connection.set_address(right_address)
+    dumbbell.left_router_connection = left_router_connection
+    dumbbell.right_router_connection = right_router_connection
 
     print("Connections made")
 
     ####### ROUTING #######
 
-    # If any packet needs to be sent from any left-nodes, send it to left-router, 
+    # If any packet needs to be sent from any left-nodes, send it to left-router,
     # i.e., Adding "default" gateways for each node
-    for i in range(num_of_left_nodes):
+    for i in range(len(left_nodes)):
         left_nodes[i].add_route("DEFAULT", left_node_connections[i][0])
 
-    # If the destination address for any packet in left-router is
-    # one of the left-nodes, forward the packet to that node
-    for i in range(num_of_left_nodes):
-        left_router.add_route(
-            left_node_connections[i][0].get_address(), left_node_connections[i][1]
-        )
-
-    # If the destination address doesn't match any of the entries
+    # The left-router reaches each of the left-nodes through the connected route of their /31,
+    # so no per-node routes are needed. If the destination address doesn't match any of the entries
     # in the left-router's iptables forward the packet to right-router
     left_router.add_route("DEFAULT", left_router_connection)
 
     # If any packet needs to be sent from any right nodes, send it to right-router
     # i.e., Adding "default" gateways for each node
-    for i in range(num_of_right_nodes):
+    for i in range(len(right_nodes)):
         right_nodes[i].add_route("DEFAULT", right_node_connections[i][0])
 
-    # If the destination address for any packet in right-router is
-    # one of the right-nodes, forward the packet to that node
-    for i in range(num_of_right_nodes):
-        right_router.add_route(
-            right_node_connections[i][0].get_address(), right_node_connections[i][1]
-        )
-
-    # If the destination address doesn't match any of the entries
+    # The right-router reaches each of the right-nodes through the connected route of their /31,
+    # so no per-node routes are needed. If the destination address doesn't match any of the entries
     # in the right-router's iptables forward the packet to left-router
     right_router.add_route("DEFAULT", right_router_connection)
 
     # Setting up the attributes of the connections between
     # the nodes on the left-side and the left-router
-    for i in range(num_of_left_nodes):
+    for i in range(len(left_nodes)):
         left_node_connections[i][0].set_attributes(
-            client_router_bandwidth, client_router_latency
+            CLIENT_ROUTER_BANDWIDTH, CLIENT_ROUTER_LATENCY
         )
         left_node_connections[i][1].set_attributes(
-            client_router_bandwidth, client_router_latency
+            CLIENT_ROUTER_BANDWIDTH, CLIENT_ROUTER_LATENCY
         )
 
     # Setting up the attributes of the connections between
     # the nodes on the right-side and the right-router
-    for i in range(num_of_right_nodes):
+    for i in range(len(right_nodes)):
         right_node_connections[i][0].set_attributes(
-            client_router_bandwidth, client_router_latency
+            CLIENT_ROUTER_BANDWIDTH, CLIENT_ROUTER_LATENCY
         )
         right_node_connections[i][1].set_attributes(
-            client_router_bandwidth, client_router_latency
+            CLIENT_ROUTER_BANDWIDTH, CLIENT_ROUTER_LATENCY
         )
 
     # Setting up the attributes of the connections between the two routers
     # Note: we enable the user given queue discipline on the link from (`r1` to `r2`) and (`r2` to `r1`)
-    left_router_connection.set_attributes(router_router_bandwidth, router_router_latency, AQM)
-    right_router_connection.set_attributes(router_router_bandwidth, router_router_latency, AQM)
+    left_router_connection.set_attributes(ROUTER_ROUTER_BANDWIDTH, ROUTER_ROUTER_LATENCY, AQM)
+    right_router_connection.set_attributes(ROUTER_ROUTER_BANDWIDTH, ROUTER_ROUTER_LATENCY, AQM)
+
+
+## This method plans the same links, addresses, routes and qdiscs as `_configure`,
+## and then applies them all at once with a `BatchPlan`
+def _configure_batched(dumbbell, AQM):
+
+    left_router = dumbbell.left_router
+    right_router = dumbbell.right_router
+    left_nodes = dumbbell.left_nodes
+    right_nodes = dumbbell.right_nodes
+
+    addresses = dumbbell.addresses
+    plan = BatchPlan()
+    lease = dumbbell.lease
+
+    # The addresses are the same /31s as in `_configure`.
+    # Interfaces only need unique names within their namespace, so every node calls its
+    # interface `eth0` and the routers number theirs.
+    # The links of a leased dumbbell already exist, with these very names.
+    for i in range(len(left_nodes)):
+        if lease is not None:
+            connection = lease.left_links[i]
+        else:
+            connection = plan.connect(left_nodes[i], "eth0", left_router, "ln-" + str(i))
+        (node_address, router_address) = addresses.left_link(i)
+        plan.set_address(connection[0], node_address)
+        plan.set_address(connection[1], router_address)
+        dumbbell.left_node_connections.append(connection)
+
+    for i in range(len(right_nodes)):
+        if lease is not None:
+            connection = lease.right_links[i]
+        else:
+            connection = plan.connect(right_nodes[i], "eth0", right_router, "rn-" + str(i))
+        (node_address, router_address) = addresses.right_link(i)
+        plan.set_address(connection[0], node_address)
+        plan.set_address(connection[1], router_address)
+        dumbbell.right_node_connections.append(connection)
+
+    if lease is not None:
+        (left_router_connection, right_router_connection) = lease.router_link
+    else:
+        (left_router_connection, right_router_connection) = plan.connect(left_router, "lr-rr", right_router, "rr-lr")
+    (left_address, right_address) = addresses.router_link()
+    plan.set_address(left_router_connection, left_address)
+    plan.set_address(right_router_connection, right_address)
+    dumbbell.left_router_connection = left_router_connection
+    dumbbell.right_router_connection = right_router_connection
 
-    ######  RUN TESTS ######
+    ####### ROUTING #######
+
+    # As in `_configure`, the routers reach their nodes through connected routes
+    for (node_connection, router_connection) in dumbbell.left_node_connections:
+        plan.add_route(node_connection.node, "DEFAULT", node_connection)
+    plan.add_route(left_router, "DEFAULT", left_router_connection)
+
+    for (node_connection, router_connection) in dumbbell.right_node_connections:
+        plan.add_route(node_connection.node, "DEFAULT", node_connection)
+    plan.add_route(right_router, "DEFAULT", right_router_connection)
+
+    ####### LINK ATTRIBUTES #######
+
+    for connection in dumbbell.left_node_connections + dumbbell.right_node_connections:
+        plan.set_attributes(connection[0], CLIENT_ROUTER_BANDWIDTH, CLIENT_ROUTER_LATENCY)
+        plan.set_attributes(connection[1], CLIENT_ROUTER_BANDWIDTH, CLIENT_ROUTER_LATENCY)
+
+    # Note: we enable the user given queue discipline on the link from (`r1` to `r2`) and (`r2` to `r1`)
+    plan.set_attributes(left_router_connection, ROUTER_ROUTER_BANDWIDTH, ROUTER_ROUTER_LATENCY, AQM)
+    plan.set_attributes(right_router_connection, ROUTER_ROUTER_BANDWIDTH, ROUTER_ROUTER_LATENCY, AQM)
+
+    plan.apply()
+    dumbbell.batched = True
+
+    print("Connections made")
+
+
+## This method returns `run` (which runs an experiment on `dumbbell`) made to also sample the AQM
+## of both ends of the bottleneck every `qdisc_interval` seconds (see `qdisc_sampler.py`)
+# With `qdisc_interval` None, `run` is returned as it is.
+
+def sampled_run(run, dumbbell, qdisc_interval=None):
+
+    if qdisc_interval is None:
+        return run
+    return lambda: run_sampled(run, bottleneck_queues(dumbbell), qdisc_interval)
+
+
+## This method returns `run` (which runs an experiment on `dumbbell`) made to also probe the latency
+## from the first `probed_pairs` nodes flows start from to their peers every `latency_interval`
+## seconds (see `latency_prober.py`). `direction` is "up" or "down", as the experiment's flows.
+# With `latency_interval` None, `run` is returned as it is.
+
+def probed_run(run, dumbbell, direction, latency_interval=None, probed_pairs=1):
+
+    if latency_interval is None:
+        return run
+
+    pairs = []
+    for i in range(min(probed_pairs, len(dumbbell.left_nodes))):
+        if direction == "up":
+            pairs.append((dumbbell.left_nodes[i], dumbbell.right_nodes[i], dumbbell.right_node_connections[i][0].address))
+        else:
+            pairs.append((dumbbell.right_nodes[i], dumbbell.left_nodes[i], dumbbell.left_node_connections[i][0].address))
+    return lambda: run_probed(run, pairs, latency_interval)
+
+
+## This method sets up (without running it) the "TCP upload" experiment on `dumbbell`
+## i.e., sending `NO_TCP_FLOWS` flows from left nodes to the right nodes
+# Assumption: left-nodes are the clients right-nodes are the servers
+# `NO_TCP_FLOWS` can be smaller than the number of flows `dumbbell` was built for, in which case
+# only the first nodes are used. This lets a single dumbbell serve a sweep over flow counts.
+# `start_times[i]`, if given, is the time the flows of the i-th pair of nodes start at (0 by default).
+
+def tcp_up_experiment(dumbbell, NO_TCP_FLOWS, congestion_algorithm="cubic", exp_name=None, duration=200, start_times=None):
+
+    streams = host_streams(NO_TCP_FLOWS, dumbbell.flows_per_host)
+    if len(streams) > len(dumbbell.left_nodes):
+        raise ValueError("The dumbbell was built for fewer than " + str(NO_TCP_FLOWS) + " flows")
+    if start_times is None:
+        start_times = [0] * len(streams)
 
-    exp_name = "tcp_" + str(NO_TCP_FLOWS) + "up"
+    if exp_name is None:
+        exp_name = "tcp_" + str(NO_TCP_FLOWS) + "up"
 
     # Set up an Experiment. This API takes the name of the experiment as a string.
     experiment = Experiment(exp_name)
@@ -180,175 +441,119 @@ def tcp_up(NO_TCP_FLOWS, AQM):
     # Configure flows from each `left_node` to the corresponding `right_node`. We do not use it as a TCP flow yet.
     # The `Flow` API takes in the source node, destination node, destination IP
     # address, start and stop time of the flow, and the total number of flows.
-    # In this program, start time is 0 seconds, stop time is 200 seconds and the
-    # number of streams is 1.
+    # In this program, start time is `start_times[i]` (0 by default) seconds, stop time is `duration`
+    # (200 by default) seconds later and the
+    # number of streams is the number of flows carried by the node (1 by default).
 
-    for i in range(NO_TCP_FLOWS):
+    for i in range(len(streams)):
         flow = Flow(
-            left_nodes[i], right_nodes[i], right_node_connections[i][0].address, 0, 200, 1
+            dumbbell.left_nodes[i], dumbbell.right_nodes[i], dumbbell.right_node_connections[i][0].address,
+            start_times[i], start_times[i] + duration, streams[i]
         )
         # Use TCP cubic which is the default
-        experiment.add_tcp_flow(flow)
+        experiment.add_tcp_flow(flow, congestion_algorithm)
 
-    # Running the experiment
-    experiment.run()
+    return experiment
 
 
-## This method performs the "TCP download" experiment 
-## i.e., sending the flows from right nodes to the left nodes 
+## This method sets up (without running it) the "TCP download" experiment on `dumbbell`
+## i.e., sending `NO_TCP_FLOWS` flows from right nodes to the left nodes
 # Assumption: left-nodes are the clients right-nodes are the servers
 
-def tcp_down(NO_TCP_FLOWS, AQM):
-    
-    # Creating the same number of nodes on either sides as that of the number of flows
-    TOTAL_NODES_PER_SIDE = NO_TCP_FLOWS
+def tcp_down_experiment(dumbbell, NO_TCP_FLOWS, congestion_algorithm="cubic", exp_name=None, duration=200, start_times=None):
 
-    # Set the link attributes: `h1` --> `r1` --> `r2` --> `h2`
+    streams = host_streams(NO_TCP_FLOWS, dumbbell.flows_per_host)
+    if len(streams) > len(dumbbell.right_nodes):
+        raise ValueError("The dumbbell was built for fewer than " + str(NO_TCP_FLOWS) + " flows")
+    if start_times is None:
+        start_times = [0] * len(streams)
 
-    ## Creating variables to store the latencies between client-to-router and router-to-router
-    client_router_latency = '1ms'
-    router_router_latency = '10ms'
+    if exp_name is None:
+        exp_name = "tcp_" + str(NO_TCP_FLOWS) + "down"
 
-    ## Creating variables to store the bandwidths between client-to-router and router-to-router
-    client_router_bandwidth = '1000mbit'
-    router_router_bandwidth = '10mbit'
+    # Set up an Experiment. This API takes the name of the experiment as a string.
+    experiment = Experiment(exp_name)
 
-    # Assigning number of nodes on either sides of the dumbbell according to the input
-    num_of_left_nodes = TOTAL_NODES_PER_SIDE
-    num_of_right_nodes = TOTAL_NODES_PER_SIDE
+    # Assuming left nodes are the clients and right nodes are the router to carry out the "download" experiment
+    # Configure flows from each `right_node` to the corresponding `left_node`. We do not use it as a TCP flow yet.
+    # The `Flow` API takes in the source node, destination node, destination IP
+    # address, start and stop time of the flow, and the total number of flows.
+    # In this program, start time is `start_times[i]` (0 by default) seconds, stop time is `duration`
+    # (200 by default) seconds later and the
+    # number of streams is the number of flows carried by the node (1 by default).
+    for i in range(len(streams)):
+        flow = Flow(
+            dumbbell.right_nodes[i], dumbbell.left_nodes[i], dumbbell.left_node_connections[i][0].address,
+            start_times[i], start_times[i] + duration, streams[i]
+        )
+        # Use TCP cubic which is the default
+        experiment.add_tcp_flow(flow, congestion_algorithm)
 
-    ###### TOPOLOGY CREATION ######
+    return experiment
 
-    # Creating the routers for the dumbbell topology
-    left_router = Router("left-router")
-    right_router = Router("right-router")
 
-     # Lists to store all the left and right nodes
-    left_nodes = []
-    right_nodes = []
+## This method returns the scenario (see `scenario.py`) of the experiments of `tcp_up()` and `tcp_down()`
 
-    # Creating all the left and right nodes
-    for i in range(num_of_left_nodes):
-        left_nodes.append(Node("left-node-" + str(i)))
+def dumbbell_scenario(direction, NO_TCP_FLOWS, AQM, batched=False, flows_per_host=1):
+    return {
+        "topology": "dumbbell", "direction": direction, "flows": NO_TCP_FLOWS, "aqm": AQM, "batched": batched,
+        "flows_per_host": flows_per_host,
+    }
 
-    for i in range(num_of_right_nodes):
-        right_nodes.append(Node("right-node-" + str(i)))
 
-    print("Nodes and routers created")
+## This method performs the "TCP upload" experiment
+## i.e., sending the flows from left nodes to the right nodes
 
-    #########  Adding connections #########
+def tcp_up(NO_TCP_FLOWS, AQM, batched=False, verify=False, flows_per_host=1, qdisc_interval=None,
+           tcp_info_interval=None, latency_interval=None, sketches=False):
 
-    # Lists of tuples to store the interfaces connecting the router and nodes
-    left_node_connections = []
-    right_node_connections = []
-    
-    # Set the IPv4 address for the networks, and not the interfaces.
-    # We will use the `AddressHelper` later to assign addresses to the interfaces.
-
-    # This network is used for all the left-nodes and the left-router, i.e., on to the left of 'r1'
-    left_network = Network("10.0.0.0/24")
-    
-    # This network is used for all the right-nodes and the right-router, i.e., on to the right of 'r2'
-    right_network = Network("10.0.1.0/24")
-
-    # This network is used for the connections between the two routers, i.e., between 'r1' and 'r2'
-    router_network = Network("10.0.2.0/24")
-
-    # Connecting left-nodes to the left-router under "left_network"
-    for i in range(num_of_left_nodes):
-        left_node_connections.append(connect(left_nodes[i], left_router, network=left_network))
+    # The collectors also write the percentile sketches of every flow to the dump (see `sketches.py`)
+    if sketches:
+        stream_sketches()
 
-    # Connecting right-nodes to the left-router under "right_network"
-    for i in range(num_of_right_nodes):
-        right_node_connections.append(connect(right_nodes[i], right_router, network=right_network))
+    # The namespaces are deleted in parallel when the program exits, and checked for leftovers
+    parallel_teardown()
 
-    # Connecting the two routers 'r1' and 'r2' under "router_network"
-    (left_router_connection, right_router_connection) = connect(left_router, right_router, network=router_network)
+    dumbbell = build_dumbbell(NO_TCP_FLOWS, AQM, batched, verify, flows_per_host)
 
-    # Assign IPv4 addresses to all the interfaces in the network.
-    AddressHelper.assign_addresses()
+    ######  RUN TESTS ######
 
-    print("Connections made")
+    experiment = tcp_up_experiment(dumbbell, NO_TCP_FLOWS)
 
-    ####### ROUTING #######
+    # Running the experiment, while checking that the host keeps up with it. With `tcp_info_interval`,
+    # the socket stats are collected over netlink rather than by forking `ss` (see `tcp_info.py`)
+    run = collected_run(experiment.run, tcp_info_interval)
+    run = probed_run(run, dumbbell, "up", latency_interval)
+    run_monitored(sampled_run(run, dumbbell, qdisc_interval), (ROUTER_ROUTER_BANDWIDTH, 1))
 
-    # If any packet needs to be sent from any right-nodes, send it to right-router
-    # i.e., Adding "default" gateways for each node
-    for i in range(num_of_right_nodes):
-        right_nodes[i].add_route("DEFAULT", right_node_connections[i][0])
+    # What was run, for the tools that read the dump later (see `scenario.py`)
+    write_record(Pack.FOLDER, compile_scenario(dumbbell_scenario("up", NO_TCP_FLOWS, AQM, batched, flows_per_host)))
 
-    # If the destination address for any packet in right-router is
-    # one of the right-nodes, forward the packet to that node
-    for i in range(num_of_right_nodes):
-        right_router.add_route(
-            right_node_connections[i][0].get_address(), right_node_connections[i][1]
-        )
 
-    # If the destination address doesn't match any of the entries
-    # in the right-router's iptables forward the packet to left-router
-    right_router.add_route("DEFAULT", right_router_connection)
+## This method performs the "TCP download" experiment
+## i.e., sending the flows from right nodes to the left nodes
 
-    # If any packet needs to be sent from any left nodes, send it to left-router
-    # i.e., Adding "default" gateways for each node
-    for i in range(num_of_left_nodes):
-        left_nodes[i].add_route("DEFAULT", left_node_connections[i][0])
+def tcp_down(NO_TCP_FLOWS, AQM, batched=False, verify=False, flows_per_host=1, qdisc_interval=None,
+             tcp_info_interval=None, latency_interval=None, sketches=False):
 
-    # If the destination address for any packet in left-router is
-    # one of the left-nodes, forward the packet to that node
-    for i in range(num_of_left_nodes):
-        left_router.add_route(
-            left_node_connections[i][0].get_address(), left_node_connections[i][1]
-        )
+    # The collectors also write the percentile sketches of every flow to the dump (see `sketches.py`)
+    if sketches:
+        stream_sketches()
 
-    # If the destination address doesn't match any of the entries
-    # in the left-router's iptables forward the packet to right-router
-    left_router.add_route("DEFAULT", left_router_connection)
-
-    # Setting up the attributes of the connections between
-    # the nodes on the right-side and the right-router
-    for i in range(num_of_right_nodes):
-        right_node_connections[i][0].set_attributes(
-            client_router_bandwidth, client_router_latency
-        )
-        right_node_connections[i][1].set_attributes(
-            client_router_bandwidth, client_router_latency
-        )
-
-    # Setting up the attributes of the connections between
-    # the nodes on the left-side and the left-router
-    for i in range(num_of_left_nodes):
-        left_node_connections[i][0].set_attributes(
-            client_router_bandwidth, client_router_latency
-        )
-        left_node_connections[i][1].set_attributes(
-            client_router_bandwidth, client_router_latency
-        )
-
-    # Setting up the attributes of the connections between the two routers
-    # Note: we enable the user given queue discipline on the link from (`r1` to `r2`) and (`r2` to `r1`)
-    right_router_connection.set_attributes(router_router_bandwidth, router_router_latency, AQM)
-    left_router_connection.set_attributes(router_router_bandwidth, router_router_latency, AQM)
+    # The namespaces are deleted in parallel when the program exits, and checked for leftovers
+    parallel_teardown()
 
+    dumbbell = build_dumbbell(NO_TCP_FLOWS, AQM, batched, verify, flows_per_host)
 
     ######  RUN TESTS ######
 
-    exp_name = "tcp_" + str(NO_TCP_FLOWS) + "down"
-
-    # Set up an Experiment. This API takes the name of the experiment as a string.
-    experiment = Experiment(exp_name)
+    experiment = tcp_down_experiment(dumbbell, NO_TCP_FLOWS)
 
-    # Assuming left nodes are the clients and right nodes are the router to carry out the "download" experiment
-    # Configure flows from each `right_node` to the corresponding `left_node`. We do not use it as a TCP flow yet.
-    # The `Flow` API takes in the source node, destination node, destination IP
-    # address, start and stop time of the flow, and the total number of flows.
-    # In this program, start time is 0 seconds, stop time is 200 seconds and the
-    # number of streams is 1.
-    for i in range(NO_TCP_FLOWS):
-        flow = Flow(
-            right_nodes[i], left_nodes[i], left_node_connections[i][0].address, 0, 200, 1
-        )
-        # Use TCP cubic which is the default
-        experiment.add_tcp_flow(flow)
+    # Running the experiment, while checking that the host keeps up with it. With `tcp_info_interval`,
+    # the socket stats are collected over netlink rather than by forking `ss` (see `tcp_info.py`)
+    run = collected_run(experiment.run, tcp_info_interval)
+    run = probed_run(run, dumbbell, "down", latency_interval)
+    run_monitored(sampled_run(run, dumbbell, qdisc_interval), (ROUTER_ROUTER_BANDWIDTH, 1))
 
-    # Running the experiment
-    experiment.run()
\ No newline at end of file
+    # What was run, for the tools that read the dump later (see `scenario.py`)
+    write_record(Pack.FOLDER, compile_scenario(dumbbell_scenario("down", NO_TCP_FLOWS, AQM, batched, flows_per_host)))
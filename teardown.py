@@ -0,0 +1,396 @@
+# SPDX-License-Identifier: GPL-2.0-only
+# Copyright (c) 2019-2022 NITK Surathkal
+
+########################
+# SHOULD BE RUN AS ROOT
+########################
+
+import argparse
+import atexit
+import json
+import os
+import re
+import signal
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from batch_build import BatchError, run_batch
+
+## This program contains the teardown of a topology: deleting its namespaces in parallel, checking
+## that nothing of it is left behind, and reaping what aborted experiments left.
+#
+# NeST deletes the namespaces of a topology one `ip netns del` at a time (and only when the
+# interpreter exits, or through `scenario.teardown()`). `parallel_teardown()` replaces that with:
+#   - killing the processes still running in the namespaces, found by the inode of their network
+#     namespace in `/proc` rather than by an `ip netns pids` per namespace,
+#   - deleting the namespaces in `jobs` `ip -batch` processes running side by side, every one of
+#     them deleting its share of the namespaces (the veth pairs, IFBs and qdiscs go with them),
+#   - checking for leftovers (see below), and printing them.
+#
+# NeST names every namespace (and interface) "<topology id>-<counter>", where the topology id
+# (`nest.topology.TOPOLOGY_ID`) is drawn for every run: the id of the experiment, which is also
+# written to the `scenario.json` of its dump. The leftovers of an experiment are:
+#   netns       namespaces named after its id,
+#   links       interfaces in the default namespace named after its id, e.g. a veth pair created
+#               by a run that crashed before moving it into its namespaces, and their qdiscs,
+#   processes   processes still in one of its namespaces, deleted ones included (a process keeps
+#               its namespace alive after `ip netns del`).
+#
+# A crashed or interrupted run leaves all of these behind, and they slow down (or break) the next
+# runs. `reap` deletes them, and `list` shows the experiments that have any of them on the host.
+#
+# Only names made of a NeST topology id (10 hex digits) and a counter are taken for an experiment's,
+# but other software names its interfaces alike (e.g. "cni-…", "br-…", "vnet…"), and a match may
+# still be someone else's. So `parallel_teardown()` also registers the id of its experiment in
+# `REGISTRY_DIR`, along with its pid, and drops it once its teardown left nothing behind.
+# `reap --all` only reaps the experiments found there whose process is gone; the others are listed,
+# and can be reaped by their id (e.g. the `topology_id` of a dump's `scenario.json`).
+#
+# Usage:
+#   python teardown.py list
+#   python teardown.py check EXPERIMENT_ID
+#   python teardown.py reap EXPERIMENT_ID [EXPERIMENT_ID ...] [--jobs 8]
+#   python teardown.py reap --all [--older-than MINUTES] [--jobs 8]    <-- registered experiments only
+
+## Where `ip netns` keeps the namespaces
+NETNS_DIR = "/run/netns"
+
+## Number of `ip -batch` processes deleting namespaces side by side
+DEFAULT_JOBS = 8
+
+## Seconds a process is given to exit after SIGKILL before it is reported as left
+KILL_TIMEOUT = 1.0
+
+## Where `parallel_teardown()` registers the experiments of the running processes, one file per id
+REGISTRY_DIR = "/run/nest-experiments"
+
+## NeST's topology ids (`nest.topology.TOPOLOGY_ID`): the first 10 hex digits of a uuid4
+EXPERIMENT_ID = re.compile(r"[0-9a-f]{10}")
+
+
+## This method returns the (device, inode) of the namespaces in `ids` that still exist, by id
+def namespace_inodes(ids):
+    inodes = {}
+    for ns_id in ids:
+        try:
+            stat = os.stat(os.path.join(NETNS_DIR, ns_id))
+        except OSError:
+            continue
+        inodes[ns_id] = (stat.st_dev, stat.st_ino)
+    return inodes
+
+
+## This method returns the pids of the processes in the network namespaces of `inodes`
+def namespace_processes(inodes):
+    inodes = set(inodes)
+    pids = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            stat = os.stat("/proc/" + entry + "/ns/net")
+        except OSError:
+            continue
+        if (stat.st_dev, stat.st_ino) in inodes:
+            pids.append(int(entry))
+    return pids
+
+
+## This method kills the processes in the network namespaces of `inodes`, and returns
+## those still there after `KILL_TIMEOUT` seconds
+def kill_processes(inodes):
+    for pid in namespace_processes(inodes):
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except OSError:
+            pass
+
+    deadline = time.time() + KILL_TIMEOUT
+    while True:
+        left = namespace_processes(inodes)
+        if not left or time.time() > deadline:
+            return left
+        time.sleep(0.01)
+
+
+## This method deletes the namespaces in `ids` (and kills their processes), with `jobs` `ip -batch`
+## processes at a time, and returns the (device, inode) of the namespaces it deleted, and the errors
+## of the `ip -batch` processes that failed
+# Namespaces that are already gone are skipped, so that deleting twice is harmless. Every share of
+# the namespaces is deleted even if another one fails, so that as much as possible is deleted.
+def remove_namespaces(ids, jobs=DEFAULT_JOBS):
+    inodes = namespace_inodes(ids)
+    if not inodes:
+        return ([], [])
+    kill_processes(inodes.values())
+
+    def delete(share):
+        try:
+            run_batch("ip", None, ["netns del " + ns_id for ns_id in share])
+        except (BatchError, OSError) as error:
+            return str(error)
+        return None
+
+    names = sorted(inodes)
+    shares = [names[job::jobs] for job in range(min(jobs, len(names)))]
+    with ThreadPoolExecutor(max_workers=len(shares)) as executor:
+        errors = [error for error in executor.map(delete, shares) if error is not None]
+
+    return (list(inodes.values()), errors)
+
+
+## This method returns the links (and their qdiscs) in the default namespace named after `prefix`
+def find_links(prefix):
+    links = {}
+    for name in os.listdir("/sys/class/net"):
+        if not name.startswith(prefix):
+            continue
+        qdiscs = subprocess.run(
+            ["tc", "qdisc", "show", "dev", name], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            universal_newlines=True,
+        ).stdout.splitlines()
+        # Devices always have a root qdisc, only the ones set up explicitly have a handle
+        links[name] = [qdisc.strip() for qdisc in qdiscs if " 0: " not in qdisc]
+    return links
+
+
+## This method returns what is left of the experiment `experiment_id`: its namespaces, its links
+## in the default namespace, and the processes in its namespaces, including those in the
+## (already deleted) namespaces of `inodes`
+def find_leftovers(experiment_id, inodes=()):
+    prefix = experiment_id + "-"
+    namespaces = sorted(name for name in _list_namespaces() if name.startswith(prefix))
+
+    inodes = set(inodes) | set(namespace_inodes(namespaces).values())
+    return {
+        "netns": namespaces,
+        "links": find_links(prefix),
+        "processes": namespace_processes(inodes),
+    }
+
+
+## This method returns whether `leftovers` (from `find_leftovers()`) holds anything
+def has_leftovers(leftovers):
+    return any(leftovers.values())
+
+
+## This method deletes everything left of the experiment `experiment_id`, and returns what is still
+## left afterwards (nothing, normally) and the errors of deleting its namespaces
+def reap(experiment_id, jobs=DEFAULT_JOBS):
+    prefix = experiment_id + "-"
+    (inodes, errors) = remove_namespaces([name for name in _list_namespaces() if name.startswith(prefix)], jobs)
+
+    # Deleting one end of a veth pair deletes the other one, along with the qdiscs of both
+    for name in find_links(prefix):
+        if os.path.exists("/sys/class/net/" + name):
+            subprocess.run(["ip", "link", "del", name], stderr=subprocess.DEVNULL)
+
+    leftovers = find_leftovers(experiment_id, inodes)
+    if not has_leftovers(leftovers) and not errors:
+        unregister_experiment(experiment_id)
+    return (leftovers, errors)
+
+
+## This method returns the experiments with namespaces (or links in the default namespace) on the host, as
+## {experiment id: {"namespaces": count, "links": count, "age": seconds since its newest one was created,
+##                  "registered": whether `parallel_teardown()` registered it, "running": whether its process still is}}
+# Only the ones named "<NeST topology id>-<counter>" are counted.
+def list_experiments():
+    experiments = {}
+    registered = registered_experiments()
+    now = time.time()
+    found = [(NETNS_DIR, name, "namespaces") for name in _list_namespaces()]
+    found += [("/sys/class/net", name, "links") for name in os.listdir("/sys/class/net")]
+
+    for (directory, name, kind) in found:
+        (experiment_id, _, counter) = name.rpartition("-")
+        if not EXPERIMENT_ID.fullmatch(experiment_id) or not counter.isdigit():
+            continue
+        try:
+            age = now - os.lstat(os.path.join(directory, name)).st_mtime
+        except OSError:
+            continue
+        if experiment_id not in experiments:
+            entry = registered.get(experiment_id)
+            experiments[experiment_id] = {
+                "namespaces": 0, "links": 0, "age": age, "registered": entry is not None,
+                "running": entry is not None and _running(entry["pid"]),
+            }
+        experiment = experiments[experiment_id]
+        experiment[kind] += 1
+        experiment["age"] = min(experiment["age"], age)
+    return experiments
+
+
+## This method records `experiment_id` in the registry, as the experiment of this process
+def register_experiment(experiment_id):
+    os.makedirs(REGISTRY_DIR, exist_ok=True)
+    with open(os.path.join(REGISTRY_DIR, experiment_id), "w") as entry:
+        json.dump({"pid": os.getpid(), "start": time.time(), "argv": sys.argv}, entry)
+
+
+## This method removes `experiment_id` from the registry
+def unregister_experiment(experiment_id):
+    try:
+        os.remove(os.path.join(REGISTRY_DIR, experiment_id))
+    except OSError:
+        pass
+
+
+## This method returns the experiments in the registry, as {experiment id: {"pid", "start", "argv"}}
+def registered_experiments():
+    try:
+        names = os.listdir(REGISTRY_DIR)
+    except OSError:
+        return {}
+
+    experiments = {}
+    for name in names:
+        if not EXPERIMENT_ID.fullmatch(name):
+            continue
+        try:
+            with open(os.path.join(REGISTRY_DIR, name)) as entry:
+                experiments[name] = json.load(entry)
+        except (OSError, ValueError):
+            continue
+    return experiments
+
+
+# Returns whether the process `pid` exists
+def _running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _list_namespaces():
+    try:
+        return os.listdir(NETNS_DIR)
+    except OSError:
+        return []
+
+
+## This method makes NeST delete the namespaces of its topology in parallel (with `jobs` processes),
+## and check for leftovers afterwards, wherever it deletes them: in `scenario.teardown()` and when
+## the interpreter exits. The id of the topology is registered until then (see above).
+# With `phase_timer.instrument()` called before, the parallel teardown is timed in place of NeST's.
+def parallel_teardown(jobs=DEFAULT_JOBS):
+    import nest.clean_up
+    from nest import config
+    from nest.topology import TOPOLOGY_ID
+    from nest.topology_map import TopologyMap
+
+    delete_namespaces = nest.clean_up.delete_namespaces
+    # `phase_timer.py`'s wrapper carries the attributes of the teardown it wraps
+    if getattr(delete_namespaces, "parallel_teardown_original", None) is not None:
+        return
+
+    def teardown():
+        if not config.get_value("delete_namespaces_on_termination"):
+            print("Namespaces not deleted")
+            unregister_experiment(TOPOLOGY_ID)
+            return
+
+        (inodes, errors) = remove_namespaces([namespace["id"] for namespace in TopologyMap.get_namespaces()], jobs)
+        leftovers = find_leftovers(TOPOLOGY_ID, inodes)
+        for error in errors:
+            print("Deleting the namespaces of " + TOPOLOGY_ID + ": " + error)
+        if has_leftovers(leftovers):
+            print("Left behind by " + TOPOLOGY_ID + ": " + json.dumps(leftovers))
+        elif not errors:
+            unregister_experiment(TOPOLOGY_ID)
+
+    register_experiment(TOPOLOGY_ID)
+
+    if hasattr(delete_namespaces, "phase_timer_original"):
+        # `phase_timer.py` times (and runs at exit) this teardown instead of the one it timed so far
+        import phase_timer
+
+        teardown.parallel_teardown_original = delete_namespaces.phase_timer_original
+        phase_timer.time_teardown(teardown)
+        return
+
+    teardown.parallel_teardown_original = delete_namespaces
+    nest.clean_up.delete_namespaces = teardown
+    atexit.unregister(delete_namespaces)
+    atexit.register(teardown)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reap and check what experiments left on the host")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("list", help="list the experiments with namespaces or links on the host")
+
+    check_parser = commands.add_parser("check", help="list what is left of an experiment")
+    check_parser.add_argument("experiment_id")
+
+    reap_parser = commands.add_parser("reap", help="delete what is left of experiments")
+    reap_parser.add_argument("experiment_ids", nargs="*", metavar="EXPERIMENT_ID")
+    reap_parser.add_argument("--all", action="store_true",
+                             help="reap every registered experiment listed by `list` whose process is gone")
+    reap_parser.add_argument("--older-than", type=float, default=0, metavar="MINUTES",
+                             help="with --all, only reap the experiments whose namespaces are this old")
+    reap_parser.add_argument("--jobs", type=int, default=DEFAULT_JOBS, help="ip processes deleting namespaces at a time")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        for (experiment_id, experiment) in sorted(list_experiments().items()):
+            state = "running" if experiment["running"] else ("registered" if experiment["registered"] else "unregistered")
+            print("%s  %4d namespaces  %4d links  %7.1f min old  %s" % (
+                experiment_id, experiment["namespaces"], experiment["links"], experiment["age"] / 60, state
+            ))
+        return
+
+    # Anything else than a NeST topology id could match other software's namespaces and links
+    for experiment_id in ([args.experiment_id] if args.command == "check" else args.experiment_ids):
+        if not EXPERIMENT_ID.fullmatch(experiment_id):
+            parser.error(experiment_id + " is not a NeST topology id (10 hex digits)")
+
+    if args.command == "check":
+        leftovers = find_leftovers(args.experiment_id)
+        print(json.dumps(leftovers, indent=4))
+        sys.exit(1 if has_leftovers(leftovers) else 0)
+
+    experiment_ids = list(args.experiment_ids)
+    if args.all:
+        for (experiment_id, experiment) in sorted(list_experiments().items()):
+            if experiment_id in experiment_ids or experiment["age"] < args.older_than * 60:
+                continue
+            if not experiment["registered"]:
+                print(experiment_id + ": skipped, not registered by parallel_teardown() (reap it by its id)")
+            elif experiment["running"]:
+                print(experiment_id + ": skipped, its process is still running")
+            else:
+                experiment_ids.append(experiment_id)
+
+        # The experiments of processes gone that left nothing behind
+        for (experiment_id, entry) in registered_experiments().items():
+            if experiment_id not in experiment_ids and not _running(entry["pid"]):
+                if not has_leftovers(find_leftovers(experiment_id)):
+                    unregister_experiment(experiment_id)
+    elif not experiment_ids:
+        parser.error("give the experiment ids to reap, or --all")
+
+    failed = False
+    for experiment_id in experiment_ids:
+        start = time.time()
+        (leftovers, errors) = reap(experiment_id, args.jobs)
+        for error in errors:
+            print(experiment_id + ": " + error)
+        if has_leftovers(leftovers) or errors:
+            failed = True
+            print(experiment_id + ": could not reap " + json.dumps(leftovers))
+        else:
+            print(experiment_id + ": reaped in %.2f s" % (time.time() - start))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()